@@ -0,0 +1,9 @@
+# gunicorn settings of the app, see supervisor.ini
+
+
+def post_worker_init(worker):
+    """warm the apps of the worker up before it accepts connections"""
+    from nzdb import warmup
+
+    if not warmup.wait_all(warmup.served(worker.wsgi)):
+        worker.log.warning("warm-up not done, taking requests while it goes on")
@@ -0,0 +1,161 @@
+"""
+archive -- closed months of statuses kept in compressed parquet files
+
+Archived months are written to <archivedir>/<dbname>/statuses_yyyymm.parquet,
+sorted on created_at, and removed from mongo. Queries with a date window
+reaching into archived months scan those files, reading only the row
+groups that overlap the window.
+
+Needs pyarrow, the archive extra: pip install nzdb[archive]
+"""
+
+import heapq
+import os
+from itertools import islice
+from operator import itemgetter
+
+from nzdb.partitions import months, naive_utc, next_month, partition_name
+from nzdb.storage.base import projected
+from nzdb.textmatch import matcher
+
+COLUMNS = ["id", "created_at", "author", "language_code", "source", "text"]
+ROW_GROUP = 50000
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ArchiveError("archiving needs pyarrow: pip install nzdb[archive]")
+    return pyarrow, pyarrow.parquet
+
+
+def _schema(pa):
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("created_at", pa.timestamp("ms")),
+            ("author", pa.string()),
+            ("language_code", pa.string()),
+            ("source", pa.string()),
+            ("text", pa.string()),
+        ]
+    )
+
+
+def month_path(archivedir, dbname, month):
+    return os.path.join(archivedir, dbname, f"{partition_name(month)}.parquet")
+
+
+def archived_months(archivedir, dbname, start, end):
+    """paths of the archived months overlapping [start, end), oldest first"""
+    paths = [month_path(archivedir, dbname, month) for month in months(start, end)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _archived_rows(pq, path):
+    """statuses of an archived month, in file order, a row group at a time"""
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=ROW_GROUP):
+        yield from batch.to_pylist()
+
+
+def write_month(archivedir, dbname, month, statuses):
+    """
+    Write one month of statuses to its parquet file, a row group at a time
+    :param statuses: iterable of status docs of the month, sorted on
+        created_at
+    :return: number of statuses in the file
+    """
+    pa, pq = _pyarrow()
+    schema = _schema(pa)
+    path = month_path(archivedir, dbname, month)
+    rows = iter(statuses)
+    if os.path.exists(path):
+        # statuses stored late for an archived month are merged in; those
+        # archived already are kept as they are
+        archived = set(pq.read_table(path, columns=["id"]).column("id").to_pylist())
+        rows = heapq.merge(
+            _archived_rows(pq, path),
+            (s for s in rows if s["id"] not in archived),
+            key=itemgetter("created_at"),
+        )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    n = 0
+    with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+        while batch := list(islice(rows, ROW_GROUP)):
+            columns = {name: [s.get(name) for s in batch] for name in COLUMNS}
+            writer.write_table(pa.table(columns, schema=schema))
+            n += len(batch)
+    os.replace(tmp, path)
+    return n
+
+
+def _scan(path, start, end, columns):
+    _, pq = _pyarrow()
+    filters = [("created_at", ">=", start), ("created_at", "<", end)]
+    return pq.read_table(path, columns=columns, filters=filters)
+
+
+def _window(searchon):
+    window = searchon["created_at"]
+    return naive_utc(window["$gte"]), naive_utc(window["$lt"])
+
+
+def _matched(path, start, end, columns, match, descending):
+    """matching statuses of one archived month, a row group at a time"""
+    batches = _scan(path, start, end, columns).to_batches()
+    if descending:
+        batches = reversed(batches)
+    for batch in batches:
+        statuses = batch.to_pylist()
+        if descending:
+            statuses.reverse()
+        yield from filter(match, statuses)
+
+
+def find(archivedir, dbname, searchon, descending=False, projection=None, limit=None):
+    """
+    Archived statuses matching searchon, sorted on created_at
+    :param searchon: mongo query with a created_at window, as built by dbif
+    :param projection: mongo projection; created_at is always returned
+    :param limit: if given, months are read only until limit are found
+    :return: list of status docs
+    """
+    start, end = _window(searchon)
+    match = matcher(searchon)
+    fields = set(projected(projection, COLUMNS)) | {"created_at"}
+    # the fields of the match are read, then dropped if not projected
+    needed = {"text"} if "$text" in searchon else set()
+    needed |= {k for k in searchon if k in COLUMNS}
+    columns = [c for c in COLUMNS if c in fields | needed]
+    paths = archived_months(archivedir, dbname, start, end)
+    if descending:
+        paths.reverse()
+    found = []
+    for path in paths:
+        statuses = _matched(path, start, end, columns, match, descending)
+        found.extend(islice(statuses, None if limit is None else limit - len(found)))
+        if limit is not None and len(found) >= limit:
+            break
+    if needed - fields:
+        found = [{k: v for k, v in s.items() if k in fields} for s in found]
+    return found
+
+
+def count(archivedir, dbname, searchon):
+    start, end = _window(searchon)
+    if set(searchon) == {"created_at"}:
+        # date window only: row counts, no need to read texts
+        paths = archived_months(archivedir, dbname, start, end)
+        return sum(_scan(p, start, end, ["created_at"]).num_rows for p in paths)
+    return len(find(archivedir, dbname, searchon, projection={"created_at": True}))
+
+
+def month_window(month):
+    return {"created_at": {"$gte": month, "$lt": next_month(month)}}
@@ -0,0 +1,248 @@
+"""
+asgi -- the web app served by an ASGI server, e.g.
+
+    uvicorn --workers 4 --port 3031 nzdb.asgi:app
+
+With NZDB_TENANTS set, the tenants are served as by tenants.tenants_app.
+
+Requests are read and answered on the event loop; the flask views run in
+thread pools, one per lane of routes, so that long searches queue behind
+each other instead of in front of the polling routes. Each view runs as
+under gunicorn, with the same budgets, caching and compression. The
+generic bridges (a2wsgi, asgiref's WsgiToAsgi) run every request in one
+pool, which is what the lanes are here to avoid.
+"""
+
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from nzdb import metrics, noozeapp, warmup
+
+# threads per lane: the views of a lane run at most this many at once
+LANES = {"recent": 16, "search": 8, "graph": 4, "events": 256, "pages": 8}
+ROUTES = {
+    "/ready": "recent",
+    "/json/recent": "recent",
+    "/json/count": "recent",
+    "/json/cats": "recent",
+    "/json/qry": "search",
+    "/json/xqry": "search",
+    "/json/xcount": "search",
+    "/json/intvlcounts": "graph",
+    "/json/xgraph": "graph",
+    "/json/events": "events",
+}
+
+# chunks of a response queued for the client; the view's thread waits
+# while it is full, so a slow client is not buffered for
+QUEUE = 16
+# secs between checks that the client is still there, while waiting
+WAIT = 1
+
+
+def _served():
+    spec = os.getenv("NZDB_TENANTS")
+    if not spec:
+        return noozeapp.app
+    from nzdb.tenants import tenants_app
+
+    return tenants_app(spec)
+
+
+wsgiapp = _served()
+# mount prefixes of the tenants, longest first
+PREFIXES = sorted(getattr(wsgiapp, "nzdb_prefixes", ()), key=len, reverse=True)
+
+_pools = {
+    lane: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"nzdb-{lane}")
+    for lane, n in LANES.items()
+}
+# lane -> requests submitted and not finished
+_pending = dict.fromkeys(LANES, 0)
+_lock = threading.Lock()
+
+
+def _count(lane, n):
+    with _lock:
+        _pending[lane] += n
+        metrics.set_gauge("nzdb_asgi_pending", _pending[lane], lane=lane)
+
+
+def _latin1(text):
+    return text.encode("utf8").decode("latin1")
+
+
+def environ(scope, body):
+    """wsgi environ of an http request"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    root = scope.get("root_path", "")
+    path = scope["path"]
+    if root and path.startswith(root):
+        path = path[len(root) :]
+    env = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": _latin1(root),
+        "PATH_INFO": _latin1(path),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        # the body has been read whole, whatever the client declared
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin1"), value.decode("latin1")
+        if name == "content-type":
+            env["CONTENT_TYPE"] = value
+        elif name != "content-length":
+            key = "HTTP_" + name.upper().replace("-", "_")
+            env[key] = f"{env[key]},{value}" if key in env else value
+    return env
+
+
+def lane(path, prefixes=None):
+    """lane of the route of path, after the mount prefix of its tenant"""
+    for prefix in PREFIXES if prefixes is None else prefixes:
+        if path.startswith(f"{prefix}/"):
+            path = path[len(prefix) :]
+            break
+    return ROUTES.get(path, "pages")
+
+
+def _respond(env, emit, gone):
+    """
+    Run in a lane thread: call the flask app and emit its response. The
+    whole response is read in this thread, as streamed views keep the
+    request context of the thread they started in.
+    """
+    try:
+
+        def start_response(status, headers, exc_info=None):
+            emit(("start", int(status.split(" ", 1)[0]), headers))
+            return lambda data: emit(("body", data))
+
+        body = wsgiapp(env, start_response)
+        try:
+            for chunk in body:
+                if gone.is_set():
+                    break
+                if chunk:
+                    emit(("body", chunk))
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+    except Exception as e:
+        emit(("error", e))
+    finally:
+        emit(("end",))
+
+
+def _start(status, headers):
+    headers = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+    return {"type": "http.response.start", "status": status, "headers": headers}
+
+
+def _body(data, more=False):
+    return {"type": "http.response.body", "body": data, "more_body": more}
+
+
+async def _read_body(receive):
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    return body
+
+
+async def _watch(receive, gone):
+    """flag gone when the client disconnects"""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    gone.set()
+
+
+async def _http(scope, receive, send):
+    env = environ(scope, await _read_body(receive))
+    loop = asyncio.get_running_loop()
+    route = lane(env["PATH_INFO"])
+    output = asyncio.Queue(QUEUE)
+    gone = threading.Event()
+
+    def emit(item):
+        """queue item for the client, waiting while the queue is full"""
+        queued = asyncio.run_coroutine_threadsafe(output.put(item), loop)
+        while True:
+            try:
+                return queued.result(WAIT)
+            except FutureTimeout:
+                if gone.is_set():
+                    queued.cancel()
+                    return
+
+    def run():
+        try:
+            _respond(env, emit, gone)
+        finally:
+            _count(route, -1)
+
+    _count(route, 1)
+    loop.run_in_executor(_pools[route], run)
+    watcher = asyncio.ensure_future(_watch(receive, gone))
+    started = False
+    try:
+        while True:
+            item = await output.get()
+            if item[0] == "start":
+                _, status, headers = item
+                await send(_start(status, headers))
+                started = True
+            elif item[0] == "body":
+                await send(_body(item[1], more=True))
+            elif item[0] == "error" and not started:
+                await send(_start(500, []))
+                started = True
+            elif item[0] == "end":
+                break
+        await send(_body(b""))
+    finally:
+        gone.set()
+        watcher.cancel()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # the server listens once the warm-up is done, see warmup
+            loop = asyncio.get_running_loop()
+            apps = warmup.served(wsgiapp)
+            await loop.run_in_executor(None, warmup.wait_all, apps)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            for pool in _pools.values():
+                pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http":
+        await _http(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        await _lifespan(receive, send)
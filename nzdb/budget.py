@@ -0,0 +1,115 @@
+"""
+budget -- time budgets for searches, and admission of requests by cost
+
+Searches run in a time_budget pass the time left to the db (maxTimeMS
+on mongo, a progress handler on sqlite). A search cut short by its
+budget ends with what it found so far and marks the budget truncated,
+for the caller to report. Admission limits the estimated cost of the
+requests a process runs at once.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+from nzdb import metrics
+
+_budget = ContextVar("nzdb_budget", default=None)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Budget:
+    def __init__(self, ms):
+        self.ms = ms
+        self.deadline = monotonic() + ms / 1000
+        self.truncated = False
+
+    def remaining_ms(self):
+        # at least 1: maxTimeMS 0 means no limit
+        return max(1, int((self.deadline - monotonic()) * 1000))
+
+    def expired(self):
+        return monotonic() >= self.deadline
+
+
+@contextmanager
+def time_budget(ms):
+    """run the searches of the block within ms milliseconds"""
+    token = _budget.set(None if ms is None else Budget(ms))
+    try:
+        yield _budget.get()
+    finally:
+        _budget.reset(token)
+
+
+def unlimited():
+    """run the searches of the block without a budget"""
+    return time_budget(None)
+
+
+def current():
+    return _budget.get()
+
+
+def remaining_ms():
+    """milliseconds left, None if there is no budget"""
+    budget = _budget.get()
+    return None if budget is None else budget.remaining_ms()
+
+
+def expired():
+    budget = _budget.get()
+    return budget is not None and budget.expired()
+
+
+def truncate():
+    """record that a search was cut short by the budget"""
+    budget = _budget.get()
+    if budget is not None and not budget.truncated:
+        budget.truncated = True
+        metrics.incr("nzdb_truncated_searches_total")
+
+
+def truncated():
+    budget = _budget.get()
+    return budget is not None and budget.truncated
+
+
+class Admission:
+    """
+    Admitted requests hold their estimated cost until they finish. A
+    request that would take the total past capacity waits up to wait
+    secs for others to finish, then is rejected; a request arriving at
+    an idle process is always admitted.
+    """
+
+    def __init__(self, capacity, wait):
+        self.capacity = capacity
+        self.wait = wait
+        self.inflight = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def admit(self, cost):
+        """:raises: Overloaded"""
+        with self._cond:
+            deadline = monotonic() + self.wait
+            while self.inflight and self.inflight + cost > self.capacity:
+                left = deadline - monotonic()
+                if left <= 0:
+                    metrics.incr("nzdb_rejected_requests_total")
+                    raise Overloaded(f"cost {cost}, {self.inflight} in flight")
+                self._cond.wait(left)
+            self.inflight += cost
+            metrics.set_gauge("nzdb_admitted_cost", self.inflight)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.inflight -= cost
+                metrics.set_gauge("nzdb_admitted_cost", self.inflight)
+                self._cond.notify_all()
@@ -4,23 +4,24 @@
 """
 cmdline.py -- command line processing for feed query
 """
-import argparse
 import sys
-from datetime import timedelta
 
-import delorean
+from nzdb import querylang
 
 
 class SearchContext:
-    def __init__(self, startdate, enddate, query, expand):
+    def __init__(self, startdate, enddate, query, expand, authors=(), langs=()):
         """
         :class: SearchContext, provides context for searches
           expand indicates confidence level for expanded search
+          authors and langs, if not empty, restrict the search
         """
         self.startdate = startdate
         self.enddate = enddate
         self.query = query
         self.expand = expand
+        self.authors = authors
+        self.langs = langs
 
     def __str__(self):
         return "Search context: {}-{}\nQuery: {}\
@@ -31,54 +32,28 @@ class SearchContext:
 
 def processCmdLine(cl=None):
     """
-    Process command line for modules run stand-alone
+    Process command line for modules run stand-alone, in the query
+    language of querylang
     return start and end times as datetime objects
     :param cl: command line can be fed by program
     """
-    text1 = "Process docs between start and end dates"
-    epilog = "Specify dates as yyyy-mm-ddThh:mm:ss.sss \
-    or (European style!!) dd/mm/yyyy,\
-    specify d days ago with -d option \
-    or h hours ago with -H option.\n \
-    Query broadened topic with *topic (must be in database)"
-    parser = argparse.ArgumentParser(text1, epilog=epilog)
-    group = parser.add_mutually_exclusive_group()
-    group.add_argument("-s", "--start", help="start date/time")
-    group.add_argument("-d", "--day", help="start n days ago")
-    parser.add_argument("-e", "--end", help="end date/time")
-    parser.add_argument("-x", "--expand", help="expand threshold")
-    parser.add_argument("-H", "--hour", help="start h hours ago")
-    parser.add_argument("query", type=str, nargs="+", help="specify query")
     if cl is None:
-        args = parser.parse_args()
-    else:
-        args = parser.parse_args(cl.split())
-
+        if {"-h", "--help"} & set(sys.argv[1:]):
+            print(querylang.__doc__)
+            sys.exit(0)
+        cl = " ".join(f'"{arg}"' if " " in arg else arg for arg in sys.argv[1:])
     try:
-        today = delorean.Delorean()
-        if args.day is not None:
-            daysAgo = int(args.day)
-            startde = today.next_day(-1 * daysAgo)
-            endde = today
-        elif args.hour is not None:
-            hrsAgo = int(args.hour)
-            startde = today - timedelta(hours=hrsAgo)
-            endde = today
-        elif args.start is not None:
-            startde = delorean.parse(args.start, yearfirst=True, dayfirst=False)
-        else:
-            startde = today
-        if args.end is not None:
-            endde = delorean.parse(args.end, yearfirst=True, dayfirst=False)
-        else:
-            endde = today
-    except Exception as e:
-        print("Error parsing date")
+        query = querylang.parse(cl)
+        start, end = query.window()
+    except querylang.QuerySyntaxError as e:
+        print("Error parsing query")
         print(e)
         sys.exit(1)
-    expand = int(args.expand) if args.expand is not None else None
-    query = " ".join(args.query)
-    return SearchContext(startde.datetime, endde.datetime, query=query, expand=expand)
+    parts = [f"*{topic}" for topic in query.topics] + [query.text() or ""]
+    text = " ".join(parts).strip() or None
+    return SearchContext(
+        start, end, text, query.expand, authors=query.authors, langs=query.langs
+    )
 
 
 if __name__ == "__main__":
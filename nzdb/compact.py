@@ -0,0 +1,35 @@
+"""
+compact -- compact json encoding of lists of statuses
+
+Values repeated across statuses, such as authors and the source markup,
+are replaced by their index in a table that is sent once with them.
+"""
+
+INTERNED = ("author", "source", "language_code")
+
+
+def encode(statuses, fields=INTERNED):
+    """
+    :param statuses: iterable of status docs
+    :param fields: fields whose values are interned
+    :return: statuses with the values of fields replaced by indexes, and
+        the table of values of each field
+    :rtype: tuple(list, dict)
+    """
+    tables = {field: {} for field in fields}
+    encoded = []
+    for status in statuses:
+        status = dict(status)
+        for field, table in tables.items():
+            if field in status:
+                status[field] = table.setdefault(status[field], len(table))
+        encoded.append(status)
+    return encoded, {field: list(table) for field, table in tables.items() if table}
+
+
+def decode(statuses, tables):
+    """inverse of encode"""
+    return [
+        status | {f: values[status[f]] for f, values in tables.items() if f in status}
+        for status in statuses
+    ]
@@ -0,0 +1,129 @@
+"""
+compress -- content-encoding negotiation and compression of responses
+
+gzip always; brotli if the brotli extra is installed (pip install
+nzdb[brotli]). Bodies of cacheable routes are kept in a BodyCache together
+with their compressed encodings, each compressed once on first request.
+"""
+
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+from time import monotonic
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# bodies smaller than this are sent as they are
+MIN_SIZE = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def available():
+    """encodings this process can produce, preferred first"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    """
+    :param str accept_encoding: Accept-Encoding header of the request
+    :return: encoding to respond with, None for identity
+    """
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    for encoding in available():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def stream(chunks, encoding):
+    """
+    compress an iterable of byte chunks as it is sent; each chunk is
+    flushed, so that it reaches the client as it is sent
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+        def feed(chunk):
+            return compressor.process(chunk) + compressor.flush()
+
+        finish = compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+        def feed(chunk):
+            return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        finish = compressor.flush
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        out = feed(chunk)
+        if out:
+            yield out
+    yield finish()
+
+
+class BodyCache:
+    """
+    Response bodies by key, kept for ttl secs, with their compressed
+    encodings added as they are first asked for
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, encoding=None):
+        """
+        :return: body in encoding, the encoding, which is None if the body
+            is too small to compress, and the mimetype; None if the body
+            is not cached or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["expires"] < monotonic():
+                return None
+            self._entries.move_to_end(key)
+            bodies = entry["bodies"]
+        if len(bodies[None]) < MIN_SIZE:
+            encoding = None
+        if encoding not in bodies:
+            # racing threads may both compress; either result is kept
+            bodies[encoding] = compress(bodies[None], encoding)
+        return bodies[encoding], encoding, entry["mimetype"]
+
+    def put(self, key, body, ttl, mimetype):
+        entry = {"expires": monotonic() + ttl, "bodies": {None: body}}
+        entry["mimetype"] = mimetype
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
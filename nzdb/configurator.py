@@ -7,58 +7,149 @@ Configuration module for nzdb app
 import configparser
 import os
 import sys
-
-config = configparser.ConfigParser()
-
-
-nzdbConfig = {}
+from collections.abc import Mapping
 
 
 def expand(path):
     return os.path.expanduser(path)
 
 
-# must set environment variable NZDBCONF to path of config file
-config_file = os.getenv("NZDBCONF")
-errmsg = f"Configuration file {config_file} not found; check env var NZDBCONF"
-if config_file:
+def parse_config(config_file):
+    """
+    Read an nzdb conf file
+    :param str config_file: path to the conf file
+    :return: configuration values keyed as in nzdbConfig
+    :rtype: dict
+    :raises: FileNotFoundError if the file can't be read
+    """
+    config = configparser.ConfigParser()
     config_file = expand(config_file)
-    if not os.path.isfile(config_file):
-        print(errmsg)
-        sys.exit(255)
-    read = config.read(config_file)
-    if len(read) == 0:
-        print(errmsg)
-else:
-    print(errmsg)
-    sys.exit(255)
-
-
-nzdbConfig["OAUTH_TOKEN"] = config.get("authentication", "OAUTH_TOKEN")
-nzdbConfig["OAUTH_TOKEN_SECRET"] = config.get("authentication", "OAUTH_TOKEN_SECRET")
-nzdbConfig["CONSUMER_KEY"] = config.get("authentication", "CONSUMER_KEY")
-nzdbConfig["CONSUMER_SECRET"] = config.get("authentication", "CONSUMER_SECRET")
-
-host = config.get("db", "HOST")
-nzdbConfig["DBHOST"] = "localhost" if host is None else host
-nzdbConfig["DBNAME"] = config.get("db", "DBNAME")
-
-nzdbConfig["authfile"] = expand(config.get("authors", "authfile"))
-nzdbConfig["topicsfile"] = expand(config.get("topics", "topicsfile"))
-
-nzdbConfig["logfile"] = expand(config.get("logging", "logfile"))
-nzdbConfig["logname"] = config.get("logging", "logname")
-
-nzdbConfig["owner"] = config.get("twitter", "owner")
-nzdbConfig["slug"] = config.get("twitter", "slug")
-nzdbConfig["list_id"] = config.get("twitter", "id")
-
-nzdbConfig["templates"] = expand(config.get("app", "template-dir"))
-nzdbConfig["static"] = expand(config.get("app", "static-dir"))
+    if not os.path.isfile(config_file) or not config.read(config_file):
+        raise FileNotFoundError(config_file)
+
+    nzconf = {}
+    nzconf["OAUTH_TOKEN"] = config.get("authentication", "OAUTH_TOKEN")
+    nzconf["OAUTH_TOKEN_SECRET"] = config.get("authentication", "OAUTH_TOKEN_SECRET")
+    nzconf["CONSUMER_KEY"] = config.get("authentication", "CONSUMER_KEY")
+    nzconf["CONSUMER_SECRET"] = config.get("authentication", "CONSUMER_SECRET")
+
+    host = config.get("db", "HOST")
+    nzconf["DBHOST"] = "localhost" if host is None else host
+    nzconf["DBNAME"] = config.get("db", "DBNAME")
+    # mongo, or sqlite for a single-process instance without a db server
+    nzconf["backend"] = config.get("db", "BACKEND", fallback="mongo")
+    nzconf["sqlitedir"] = expand(config.get("db", "SQLITEDIR", fallback="~/nzdb"))
+    # "monthly" stores statuses in one collection per month
+    nzconf["partition"] = config.get("db", "PARTITION", fallback="none")
+
+    # options of the mongo client, whose pool is per process
+    nzconf["mongo"] = {
+        "maxPoolSize": config.getint("mongo", "maxpoolsize", fallback=100),
+        "minPoolSize": config.getint("mongo", "minpoolsize", fallback=0),
+        "maxIdleTimeMS": config.getint("mongo", "maxidletimems", fallback=None),
+        "waitQueueTimeoutMS": config.getint(
+            "mongo", "waitqueuetimeoutms", fallback=None
+        ),
+        "connectTimeoutMS": config.getint("mongo", "connecttimeoutms", fallback=5000),
+        "serverSelectionTimeoutMS": config.getint(
+            "mongo", "serverselectiontimeoutms", fallback=10000
+        ),
+        "socketTimeoutMS": config.getint("mongo", "sockettimeoutms", fallback=None),
+        # e.g. zstd,zlib; zstd needs the zstandard package
+        "compressors": config.get("mongo", "compressors", fallback=None),
+        "readPreference": config.get("mongo", "readpreference", fallback="primary"),
+    }
+    # where counts and histograms read, and how far behind they may be;
+    # mongo allows no less than 90 secs
+    nzconf["analyticsreads"] = config.get(
+        "mongo", "analyticsreads", fallback="secondaryPreferred"
+    )
+    nzconf["maxstaleness"] = config.getint("mongo", "maxstalenessseconds", fallback=120)
+
+    # dbs searched by the federated routes, by region name; each value
+    # is a dbname, or dbname@host for a db on another host
+    nzconf["federation"] = {}
+    if config.has_section("federation"):
+        for region, value in config.items("federation"):
+            dbname, _, fedhost = value.partition("@")
+            nzconf["federation"][region] = (fedhost or nzconf["DBHOST"], dbname)
+
+    nzconf["authfile"] = expand(config.get("authors", "authfile"))
+    nzconf["topicsfile"] = expand(config.get("topics", "topicsfile"))
+
+    nzconf["logfile"] = expand(config.get("logging", "logfile"))
+    nzconf["logname"] = config.get("logging", "logname")
+
+    nzconf["owner"] = config.get("twitter", "owner")
+    nzconf["slug"] = config.get("twitter", "slug")
+    nzconf["list_id"] = config.get("twitter", "id")
+
+    # closed months moved out of mongo by the archive command
+    archivedir = config.get("archive", "dir", fallback=None)
+    nzconf["archivedir"] = expand(archivedir) if archivedir else None
+
+    # hours of recent statuses kept in an in-memory index; 0 for none
+    nzconf["hothours"] = config.getint("hot", "hours", fallback=0)
+
+    # /json/events streams a process serves at once, each holding a thread
+    nzconf["maxstreams"] = config.getint("events", "maxstreams", fallback=8)
+
+    nzconf["templates"] = expand(config.get("app", "template-dir"))
+    nzconf["static"] = expand(config.get("app", "static-dir"))
+
+    nzconf["SECRET_KEY"] = expand(config.get("app", "SECRET_KEY"))
+    nzconf["USERNAME"] = expand(config.get("app", "USERNAME"))
+    nzconf["PASSWORD"] = expand(config.get("app", "PASSWORD"))
+    return nzconf
+
+
+class LazyConfig(Mapping):
+    """
+    The conf in NZDBCONF, read on first use, so that importing nzdb
+    modules needs no conf and costs no parsing
+    """
+
+    def __init__(self):
+        self._conf = None
+
+    def load(self):
+        """
+        :return: the parsed conf
+        :rtype: dict
+        """
+        if self._conf is None:
+            # must set environment variable NZDBCONF to path of config file
+            config_file = os.getenv("NZDBCONF")
+            errmsg = (
+                f"Configuration file {config_file} not found; check env var NZDBCONF"
+            )
+            if not config_file:
+                print(errmsg)
+                sys.exit(255)
+            try:
+                self._conf = parse_config(config_file)
+            except FileNotFoundError:
+                print(errmsg)
+                sys.exit(255)
+        return self._conf
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+nzdbConfig = LazyConfig()
+
+
+def get_config():
+    """the conf in NZDBCONF, read on first call"""
+    return nzdbConfig.load()
 
-nzdbConfig["SECRET_KEY"] = expand(config.get("app", "SECRET_KEY"))
-nzdbConfig["USERNAME"] = expand(config.get("app", "USERNAME"))
-nzdbConfig["PASSWORD"] = expand(config.get("app", "PASSWORD"))
 
 if __name__ == "__main__":
-    print(nzdbConfig)
+    print(get_config())
@@ -1,40 +1,163 @@
-import sys
+"""
+connectdb -- mongo clients, one per host and process
 
-from pymongo import MongoClient  # , TEXT, ASCENDING
+A client, and so a connection pool, is shared by every database on its
+host and every thread of a process. Clients are made on first use and
+dropped in a forked child, which makes its own: a pool inherited across
+fork (gunicorn --preload, multiprocessing) isn't safe to use. Pool size,
+timeouts, compression and read preference come from the [mongo] section
+of the conf; pool use is exported in metrics.
+
+Reads are routed by kind: LIVE reads, the default, follow the read
+preference of the client, the primary unless set otherwise; ANALYTICS
+reads, such as counts and histograms, go to the secondaries allowed by
+the analyticsreads and maxstalenessseconds settings.
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from nzdb.configurator import nzdbConfig
 
-DBNAME = nzdbConfig["DBNAME"]
-DBHOST = nzdbConfig["DBHOST"]
+LIVE = "live"
+ANALYTICS = "analytics"
+# read preference modes an analytics read may take, by their classes
+# in pymongo.read_preferences
+MODES = {
+    "primary": "Primary",
+    "primaryPreferred": "PrimaryPreferred",
+    "secondary": "Secondary",
+    "secondaryPreferred": "SecondaryPreferred",
+    "nearest": "Nearest",
+}
+# commands counted as reads, by the server that answered them
+READS = {"find", "getMore", "aggregate", "count", "distinct"}
+
+logger = logging.getLogger(__name__)
+
+# host -> client of this process
+_clients = {}
+_pid = os.getpid()
+_lock = threading.Lock()
+# (host, dbname) selected with use_db; None means the configured db
+_target = ContextVar("nzdb_target", default=None)
+_reads = ContextVar("nzdb_reads", default=LIVE)
 
-_thedb = None
 
+def _forget_clients():
+    """in a forked child: drop the clients of the parent, unclosed"""
+    global _pid, _lock
+    _clients.clear()
+    _pid = os.getpid()
+    # the lock may have been held by a thread that wasn't forked
+    _lock = threading.Lock()
 
-def conn():
-    """connect to Mongo db dbname
 
-    Args:
-        dbname ([string]): name of the db
+os.register_at_fork(after_in_child=_forget_clients)
 
-    Returns:
-        mongo db: a mongo db instance
+
+def options():
+    """MongoClient options, as set in the conf"""
+    return {k: v for k, v in nzdbConfig["mongo"].items() if v is not None}
+
+
+def conn(host=None):
+    """
+    :param str host: host or mongodb uri, by default that of the conf
+    :return: client with the pool options of the conf
+    :rtype: MongoClient
     """
-    # db with 4 collections: statuses, authors, topics, hashestodocids
-    print("db init", DBHOST)
-    client = MongoClient(DBHOST, connect=True)
+    # pymongo takes a tenth of a second to import, which commands that
+    # never reach the db shouldn't pay
+    from pymongo import MongoClient
+
+    from nzdb.mongostats import PoolStats, ReadStats
+
+    host = host or nzdbConfig["DBHOST"]
+    opts = options()
+    logger.info(f"connecting to {host.rpartition('@')[2]}, pid {os.getpid()}")
+    stats = PoolStats(opts.get("maxPoolSize", 100))
+    return MongoClient(host, event_listeners=[stats, ReadStats()], **opts)
+
+
+def get_client(host=None):
+    host = host or nzdbConfig["DBHOST"]
+    if os.getpid() != _pid:
+        # forked by code that bypasses the at-fork hooks
+        _forget_clients()
+    client = _clients.get(host)
+    if client is None:
+        with _lock:
+            client = _clients.get(host)
+            if client is None:
+                client = _clients[host] = conn(host)
     return client
 
 
-def get_db():
-    global _thedb
-    if _thedb is None:
-        client = conn()
-        if client is None:
-            print("Couldn't connect to database, exiting")
-            sys.exit(1)
-        else:
-            _thedb = client[DBNAME]
-    return _thedb
+def current_target():
+    """(host, dbname) selected by use_db, or the configured ones"""
+    target = _target.get()
+    if target is None:
+        return nzdbConfig["DBHOST"], nzdbConfig["DBNAME"]
+    return target
+
+
+def current_reads():
+    """kind of the reads selected with reading, LIVE by default"""
+    return _reads.get()
+
+
+def read_preference(reads):
+    """
+    :param str reads: LIVE or ANALYTICS
+    :return: read preference of the kind of read, None for the client's
+    """
+    if reads != ANALYTICS:
+        return None
+    from pymongo import read_preferences
+
+    mode = getattr(read_preferences, MODES[nzdbConfig["analyticsreads"]])
+    if mode is read_preferences.Primary:
+        return mode()
+    return mode(max_staleness=nzdbConfig["maxstaleness"])
+
+
+def get_db(reads=None):
+    """
+    the db selected by use_db, or the configured db by default
+    :param str reads: kind of the reads made on the db, by default the
+        kind selected with reading
+    """
+    host, dbname = current_target()
+    preference = read_preference(reads or _reads.get())
+    return get_client(host).get_database(dbname, read_preference=preference)
+
+
+@contextmanager
+def reading(reads):
+    """make the reads of the block reads of kind reads"""
+    token = _reads.set(reads)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+@contextmanager
+def use_db(dbname, host=None):
+    """route get_db to dbname on host for the duration of the block
+
+    The client for host is shared, so switching databases costs no
+    new connections.
+    """
+    token = _target.set((host or nzdbConfig["DBHOST"], dbname))
+    try:
+        yield get_db()
+    finally:
+        _target.reset(token)
 
 
 if __name__ == "__main__":
@@ -1,23 +1,40 @@
 # database abstraction layer
 import json
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dataclasses import dataclass
+from datetime import timezone
+from functools import lru_cache, wraps
+from itertools import chain, islice
 from textwrap import TextWrapper
-from time import perf_counter
-
-import delorean
-import pytz
-from bson import json_util
-from pymongo import ASCENDING, DESCENDING
-from pymongo.errors import DuplicateKeyError as DKE
+from time import monotonic, perf_counter
 
 import nzdb.tdeltas as td
+from nzdb import budget, hotindex, metrics, querylang
 from nzdb.cmdline import SearchContext, processCmdLine
-from nzdb.connectdb import get_db
+from nzdb.connectdb import ANALYTICS, current_target, get_db, reading
 from nzdb.dupdetect import tokenize
+from nzdb.storage import DuplicateStatus, get_backend  # noqa: F401
+from nzdb.querylang import QuerySyntaxError
+from nzdb.storage.base import ASCENDING, DESCENDING
 
 wrapper = TextWrapper(width=60, initial_indent="+====>", subsequent_indent="       ")
 
-utc = pytz.UTC
+# secs between rereads of the topics version, which keys compiled queries
+REFRESH = 60
+# (host, dbname) -> (time read, topics version)
+_topics_seen = {}
+
+# matches an approximate count stops at
+APPROX_LIMIT = 10000
+# exact counts computed in the background, oldest dropped beyond this
+PENDING_COUNTS = 256
+# secs an exact count is served for after it was asked for; windows
+# ending now keep growing
+EXACT_TTL = 60
+# (host, dbname, query) -> (monotonic time submitted, future exact count)
+_exact_counts = {}
+_counter = ThreadPoolExecutor(max_workers=2, thread_name_prefix="nzdb-count")
 
 
 class StatusNotFound(Exception):
@@ -28,31 +45,55 @@ class AuthorNotFound(Exception):
     pass
 
 
-class DuplicateStatus(Exception):
+class QueryParseException(Exception):
     pass
 
 
-class QueryParseException(Exception):
+class TopicNotFound(Exception):
     pass
 
 
-class TopicNotFound(Exception):
+class ProfileNotFound(Exception):
     pass
 
 
+def analytical(fn):
+    """route the reads of fn, a count or histogram, as analytics reads"""
+
+    @wraps(fn)
+    def run(*args, **kwargs):
+        with reading(ANALYTICS):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+# projections of the statuses returned by searches; every profile keeps
+# created_at, on which results from several collections are merged
+PROFILES = {
+    "full": {"_id": False},
+    "list": {
+        "_id": False,
+        "id": True,
+        "created_at": True,
+        "author": True,
+        "language_code": True,
+        "text": True,
+    },
+    "ids": {"_id": False, "id": True, "created_at": True},
+}
+
+
 def getAuthors():
     """
     :return: list of authors from db
     :rtype: list of strings
     """
-    db = get_db()
-    authrecs = db.authors.find()
-    return [authrec["author"] for authrec in authrecs]
+    return list(get_backend().get_author_langs())
 
 
 def mapAuthorToLang(author):
-    db = get_db()
-    author_record = db.authors.find_one({"author": author})
+    author_record = get_backend().find_author(author)
     if author_record is None:
         raise AuthorNotFound(author)
     else:
@@ -60,9 +101,42 @@ def mapAuthorToLang(author):
 
 
 def getUnknownAuthors():
-    db = get_db()
-    unknowns = db.authors.find({"language_code": "U"})
-    return unknowns
+    return get_backend().unknown_authors()
+
+
+def getUnknownStatusAuthors():
+    """
+    :return: authors of statuses stored with unknown language
+    :rtype: list of strings
+    """
+    return get_backend().unknown_status_authors()
+
+
+def reclassifyStatuses(author, lang, batch=1000):
+    """
+    Set the language of author's unknown-language statuses in batches
+    :param str author:
+    :param str lang: language code now known for author
+    :param int batch: statuses per update
+    :return: generator of the number of statuses updated by each batch
+    """
+    return get_backend().reclassify_statuses(author, lang, batch)
+
+
+def getCheckpoint(job):
+    return get_backend().get_checkpoint(job)
+
+
+def storeCheckpoint(job, **state):
+    get_backend().store_checkpoint(job, **state)
+
+
+def ensure_indexes():
+    """
+    Create the indexes searches rely on, among them (author, created_at)
+    and (language_code, created_at) for the author and language filters
+    """
+    get_backend().ensure_indexes()
 
 
 def getCount():
@@ -71,8 +145,7 @@ def getCount():
     :return: count
     :rtype: int
     """
-    db = get_db()
-    return db.statuses.estimated_document_count()
+    return get_backend().estimated_count()
 
 
 def getTopics():
@@ -81,13 +154,11 @@ def getTopics():
     :return: cursor of topics
     :rtype: topic document
     """
-    db = get_db()
-    return db.topics.find(projection={"_id": False}).sort("desc", ASCENDING)
+    return get_backend().get_topics()
 
 
 def cleanTopicsCollection():
-    db = get_db()
-    db.topics.drop()
+    get_backend().drop_topics()
 
 
 def storeTopic(topic):
@@ -95,8 +166,47 @@ def storeTopic(topic):
     Stores topic dict in topics collectiion, indexed by topic
     :param topic: dictionary(topic, desc cat query)
     """
-    db = get_db()
-    db.topics.insert_one(topic)
+    get_backend().store_topic(topic)
+
+
+def getRefVersion(name):
+    """
+    Version of reference data (topics or authors), bumped by every sync
+    that changes it, so that caches can tell when to reload
+    :param str name: "topics" or "authors"
+    :rtype: int
+    """
+    return get_backend().get_ref_version(name)
+
+
+def syncTopics(topics):
+    """
+    Replace the topics with topics if they differ from them; queries
+    never see a missing or partial topic set
+    :param topics: list of dicts (topic, desc, cat, query)
+    :return: version of the topics, number of topics added, changed, removed
+    :rtype: tuple
+    """
+    return get_backend().sync_topics(topics)
+
+
+def getAuthorLangs():
+    """
+    :return: language of every author in the authors collection
+    :rtype: dict
+    """
+    return get_backend().get_author_langs()
+
+
+def syncAuthors(langs):
+    """
+    Apply the differences between langs and the authors collection
+    in one bulk write
+    :param dict langs: language code keyed by author
+    :return: version of the authors, number added, changed, removed
+    :rtype: tuple
+    """
+    return get_backend().sync_authors(langs)
 
 
 def storeAuthor(author, lang):
@@ -106,9 +216,7 @@ def storeAuthor(author, lang):
     :param str lang:
     :return: nothing
     """
-    db = get_db()
-    row = {"author": author, "language_code": lang}
-    db.authors.update_one({"author": author}, {"$set": row}, upsert=True)
+    get_backend().store_author(author, lang)
 
 
 def storeStatus(status):
@@ -116,13 +224,23 @@ def storeStatus(status):
     Store trimmed twitter status doc in statuses collection
     :param json status: trimmed status doc from twitter
     :return: nothing
-    :raises: DuplicateKeyError
+    :raises: DuplicateStatus
     """
-    db = get_db()
-    try:
-        db.statuses.insert_one(status)
-    except DKE:
-        raise DuplicateStatus(status)
+    get_backend().store_status(status)
+
+
+def storeStatuses(statuses):
+    """
+    Store trimmed twitter status docs in one unordered bulk insert
+    :param list statuses: trimmed status docs from twitter
+    :return: number added, number skipped as duplicates
+    :rtype: tuple
+    """
+    if not statuses:
+        return 0, 0
+    added, skipped = get_backend().store_statuses(statuses)
+    hotindex.feed(statuses)
+    return added, skipped
 
 
 def sid_to_topics(sid, lang):
@@ -139,10 +257,9 @@ def docDate(doc):
     :return: created_at datetime
     :rtype: datetime
     """
-    db = get_db()
     docid = doc["docid"]
-    doc = db.statuses.find_one({"id": docid}, {"created_at": 1})
-    return utc.localize(doc["created_at"])
+    doc = get_backend().find_status({"id": docid}, {"created_at": 1})
+    return doc["created_at"].replace(tzinfo=timezone.utc)
 
 
 def mapTopicToQuery(topic):
@@ -152,8 +269,7 @@ def mapTopicToQuery(topic):
         :return: query associated with topic
         :rtype: string
     """
-    db = get_db()
-    row = db.topics.find_one({"topic": topic})
+    row = get_backend().find_topic(topic)
     if row is not None:
         return row["query"]
     else:
@@ -200,15 +316,25 @@ def _setup_mongo_query(search_context):
         searchon |= {
             "$text": {"$search": query, "$diacriticSensitive": False},
         }
+    searchon |= querylang.Query(
+        authors=tuple(search_context.authors), langs=tuple(search_context.langs)
+    ).filters()
     return searchon
 
 
+def _filters(xquery):
+    """authors and languages filters of an xquery"""
+    return tuple(xquery.get("authors") or ()), tuple(xquery.get("languages") or ())
+
+
 def _setup_mongo_query_from_xquery(xquery):
     """setup query via json query from Web
 
     Args:
-        xquery (dict): keys words, start, end
+        xquery (dict): keys words, start, end, optional authors, languages
         xquery["words"] is a list of strings
+        xquery["authors"], xquery["languages"], if not empty, restrict
+        the search to those authors and language codes
     """
     # ?NB: setup expects xquery["words"] to be an array of words
     words = xquery["words"]
@@ -216,78 +342,250 @@ def _setup_mongo_query_from_xquery(xquery):
         words = None
     else:
         words = " ".join(words)
-    startde = delorean.parse(xquery["start"], yearfirst=True, dayfirst=False).datetime
-    endde = delorean.parse(xquery["end"], yearfirst=True, dayfirst=False).datetime
-    search_context = SearchContext(startde, endde, words, None)
+    startde = td.parse_date(xquery["start"]).datetime
+    endde = td.parse_date(xquery["end"]).datetime
+    search_context = SearchContext(startde, endde, words, None, *_filters(xquery))
     return _setup_mongo_query(search_context)
 
 
-def esearch(search_context, sort_dir=ASCENDING):
+def projection(profile):
+    """
+    :param str profile: name of a projection profile, see PROFILES
+    :rtype: dict
+    :raises: ProfileNotFound
+    """
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ProfileNotFound(f"no profile {profile}, use one of {list(PROFILES)}")
+
+
+def _search(searchon, sort_dir, limit=None, profile="full"):
+    """statuses matching searchon, from the hot index if it covers them"""
+    fields = projection(profile)
+    backend = get_backend()
+    hot = hotindex.get_index(backend)
+    if hot is not None and hot.covers(searchon):
+        metrics.incr("nzdb_hot_searches_total", source="hot")
+        return hot.find(searchon, sort_dir, limit, fields)
+    metrics.incr("nzdb_hot_searches_total", source="db")
+    return backend.find_statuses(searchon, fields, sort_dir, limit)
+
+
+def _days(start, end):
+    return max(1.0, (end - start).total_seconds() / 86400)
+
+
+def query_cost(text, together=False):
+    """
+    Estimated cost of a query, in days searched; 1 if it doesn't parse,
+    as it then fails without searching
+    """
+    try:
+        query = querylang.parse(text)
+    except QuerySyntaxError:
+        return 1.0
+    searches = len(query.topics) + (query.text(together) is not None)
+    return _days(*query.window()) * max(1, searches)
+
+
+def xquery_cost(xquery):
+    """estimated cost of an xquery, in days searched"""
+    try:
+        start, end = (
+            td.parse_date(xquery[k]).datetime
+            for k in ("start", "end")
+        )
+    except Exception:
+        return 1.0
+    return _days(start, end)
+
+
+def xcounts_cost(xcounts_qry):
+    """estimated cost of xcounts, or of xgraphdb, in days searched"""
+    try:
+        intvls = td.calc_intervals(
+            xcounts_qry["start"], xcounts_qry["interval"], xcounts_qry["n"]
+        )
+    except Exception:
+        return 1.0
+    if not intvls:
+        return 1.0
+    subqueries = len(xcounts_qry.get("subqueries") or [None])
+    return _days(intvls[0][0], intvls[-1][1]) * subqueries
+
+
+def esearch(search_context, sort_dir=ASCENDING, limit=None, profile="full"):
     """
       If query is None, search on date range only
     :param: search_context
     :type: search_context or None
-    :return: cursor of full statuses based on query
+    :param limit: return only the first limit statuses in sort order
+    :param profile: fields of the statuses returned, see PROFILES
+    :return: cursor of statuses based on query
     :rtype: err, cursor
     """
-    db = get_db()
     try:
         searchon = _setup_mongo_query(search_context)
-        cursor = db.statuses.find(searchon, {"_id": False})
-        return None, cursor.sort("created_at", sort_dir)
-    except QueryParseException as e:
+        return None, _search(searchon, sort_dir, limit, profile)
+    except (QueryParseException, ProfileNotFound) as e:
         return e, []
 
 
-def websearch(query):
-    search_context = processCmdLine(query)
-    return esearch(search_context, DESCENDING)
+def _topics_version():
+    """version of the topics of the current db, reread every REFRESH secs"""
+    target = current_target()
+    seen = _topics_seen.get(target)
+    if seen is None or monotonic() - seen[0] > REFRESH:
+        seen = _topics_seen[target] = (monotonic(), getRefVersion("topics"))
+    return seen[1]
+
+
+@lru_cache(maxsize=querylang.CACHE_SIZE)
+def _plan(text, together, target, topics_version):
+    # target and topics_version only key the cache
+    query = querylang.parse(text)
+    return querylang.compile_query(
+        query, lambda topic: expand_topic(f"*{topic}"), together
+    )
+
+
+def plan_query(text, together=False):
+    """
+    Compile query text to a plan, cached until the topics change
+    :param str text: query, see querylang
+    :param bool together: search for the words as one phrase
+    :rtype: querylang.QueryPlan
+    :raises: QuerySyntaxError, QueryParseException
+    """
+    return _plan(text, together, current_target(), _topics_version())
 
 
+def websearch(query, together=False, limit=None, profile="full"):
+    """
+    :param str query: query, see querylang
+    :param bool together: search for the words as one phrase
+    :param limit: return only the newest limit statuses of each search
+    :param profile: fields of the statuses returned, see PROFILES
+    :return: statuses of the searches of the query, newest first in each
+    :rtype: err, iterator
+    """
+    try:
+        plan = plan_query(query, together)
+        projection(profile)
+    except (QuerySyntaxError, QueryParseException, ProfileNotFound) as e:
+        return e, []
+    searchons = plan.searchons()
+    found = (_search(s, DESCENDING, limit, profile) for s in searchons)
+    return None, chain.from_iterable(found)
+
+
+def _counted(count, exact=True, upper=None):
+    """
+    count result: count is exact, or at least min and at most max, max
+    None if unknown
+    """
+    if exact:
+        return {"count": count, "exact": True, "min": count, "max": count}
+    return {"count": count, "exact": False, "min": count, "max": upper}
+
+
+def _exact_count(backend, searchon):
+    # not bound by the budget of the request that asked for it
+    with budget.unlimited():
+        count, _ = backend.count_statuses(searchon)
+        return count
+
+
+def _approx_count(backend, searchon, limit, background):
+    """
+    Count matches up to limit; the count of the whole window bounds the
+    rest. With background, the exact count is computed meanwhile and
+    returned for the same query once it is done, for EXACT_TTL secs
+    """
+    from bson import json_util
+
+    key = (current_target(), json_util.dumps(searchon, sort_keys=True))
+    submitted, pending = _exact_counts.get(key, (None, None))
+    if pending is not None and pending.done():
+        if pending.exception() is None and monotonic() - submitted < EXACT_TTL:
+            return _counted(pending.result())
+        # failed or stale: counted again if asked for
+        _exact_counts.pop(key, None)
+        pending = None
+    count, complete = backend.count_statuses(searchon, limit)
+    if not complete:
+        # cut short by the budget: there may be more
+        return _counted(count, exact=False)
+    if count < limit:
+        return _counted(count)
+    window = {"created_at": searchon["created_at"]}
+    if searchon == window:
+        return _counted(*backend.count_statuses(window))
+    if background and pending is None:
+        if len(_exact_counts) >= PENDING_COUNTS:
+            _exact_counts.pop(next(iter(_exact_counts)), None)
+        _exact_counts[key] = monotonic(), _counter.submit(
+            copy_context().run, _exact_count, backend, searchon
+        )
+    upper, complete = backend.count_statuses(window)
+    return _counted(count, exact=False, upper=upper if complete else None)
+
+
+@analytical
 def xcount(xquery):
     """count results returned from query as in xwebsearch
 
     Args:
-        xquery (dict): see xwebsearch
-    Return: int
+        xquery (dict): see xwebsearch; with approx true, counting stops
+            after limit (default APPROX_LIMIT) matches, and with background
+            true the exact count is computed for a later request
+    Return: dict {count, exact, min, max}: if not exact, the count lies
+        between min and max, max None if the count was cut short by the
+        time budget
     """
-    db = get_db()
     try:
         searchon = _setup_mongo_query_from_xquery(xquery)
-        # cursor = db.statuses.find(searchon, {"_id": True})
-        count = db.statuses.count_documents(searchon)
-        return None, count  # len(list(cursor))
+        backend = get_backend()
+        if not xquery.get("approx"):
+            return None, _counted(*backend.count_statuses(searchon))
+        limit = int(xquery.get("limit", APPROX_LIMIT))
+        background = bool(xquery.get("background"))
+        return None, _approx_count(backend, searchon, limit, background)
     except Exception as e:
         return e, 0
 
 
-def xwebsearch(xquery, sort_dir=DESCENDING):
+def xwebsearch(xquery, sort_dir=DESCENDING, limit=None, profile="full"):
     """do web search from json xquery
 
     Args:
         xquery (dict): xquery
         xquery dict expects fields words, start, end
+        limit (int): return only the first limit statuses by date
+        profile (str): fields of the statuses returned, see PROFILES
     Return: mongo cursor sorted by date
     """
-    db = get_db()
     try:
         searchon = _setup_mongo_query_from_xquery(xquery)
-        cursor = db.statuses.find(searchon, {"_id": False})
-        return None, cursor.sort("created_at", sort_dir)
+        return None, _search(searchon, sort_dir, limit, profile)
     except Exception as e:
         return e, []
 
 
+@analytical
 def xcounts(xcounts_qry):
     """get counts for a series of dates specified in the query
 
     Args:
         xcounts_qry (dict): {start: ..., intvl: e.g., 24h, 1m, 2d}
+            and optional authors and languages, as in xwebsearch
     Returns:
-        dict: {counts: list[int], dates: list[[start, end]], n: int}
+        dict: {counts: list[int], dates: list[[start, end]], n: int,
+            truncated: bool}; intervals not counted within the time
+            budget have count None
 
     """
-    db = get_db()
     query = xcounts_qry["words"]
     words = " ".join(query)
     start = xcounts_qry["start"]
@@ -298,14 +596,17 @@ def xcounts(xcounts_qry):
     counts = []
     try:
         for intvl in intvls:
-            sc = SearchContext(intvl[0], intvl[1], words, None)
+            if budget.expired():
+                budget.truncate()
+                counts.append(None)
+                continue
+            sc = SearchContext(intvl[0], intvl[1], words, None, *_filters(xcounts_qry))
             searchon = _setup_mongo_query(sc)
-            # cursor = db.statuses.find(searchon, {"_id": True})
-            # count = len(list(cursor))
-            count = db.statuses.count_documents(searchon)
-            counts.append(count)
+            count, complete = get_backend().count_statuses(searchon)
+            counts.append(count if complete else None)
         # print(f"xcounts res: {counts}")
-        return None, {"counts": counts, "intervals": intvls}
+        result = {"counts": counts, "intervals": intvls}
+        return None, result | {"truncated": budget.truncated()}
     except Exception as e:
         return e, None
 
@@ -330,6 +631,7 @@ vega_schema = {
 }
 
 
+@analytical
 def xgraphdb(query):
     """process subqueries for graphing of counts
     query: {subqueries: [query1, query2]}
@@ -369,10 +671,10 @@ def find_topic_all(topic, lang):
     """
     return all statuses for topic
     """
-    db = get_db()
     query = expand_topic(topic)
-    cursor = db.statuses.find(
-        {"$text": {"$search": query, "$language": lang, "$diacriticSensitive": False}}
+    cursor = get_backend().find_statuses(
+        {"$text": {"$search": query, "$language": lang, "$diacriticSensitive": False}},
+        None,
     )
     return cursor
 
@@ -383,8 +685,7 @@ def get_all_texts():
     :rtype: cursor
     """
     # mindate, maxdate = get_status_date_range()
-    db = get_db()
-    return db.statuses.find(projection={"_id": False, "text": True})
+    return get_backend().find_statuses({}, {"_id": False, "text": True})
 
 
 def cleanup(text):
@@ -397,13 +698,14 @@ def cleanup(text):
 
 def sample(skip=0, nsamples=10000):
     # tokenize strips out urls
-    cursor = get_all_texts()
-    cursor = cursor.skip(skip).limit(nsamples)
+    cursor = islice(get_all_texts(), skip, skip + nsamples)
     return (cleanup(s["text"]) for s in cursor)
 
 
 def explain_pp(cursor):
     """pretty print cursor explanation"""
+    from bson import json_util
+
     explanation = cursor.explain()
     better_explanation = json.dumps(
         explanation, default=json_util.default, sort_keys=True, indent=4
@@ -416,59 +718,59 @@ def status_from_id(id):
     :param: id
     :return: status
     """
-    db = get_db()
-    return db.statuses.find_one({"id": id})
+    return get_backend().find_status({"id": id})
 
 
-def fetch_recent(cmdline="-H 3 dummy"):
+def fetch_recent(cmdline="-H 3", limit=None, profile="full"):
     """fetch recent statuses as defined by cmdline
 
-    :param cmdline: a dummy cmdline, such as "-H 8 dummy"
+    :param cmdline: a window, such as "-H 8"; words are ignored
+    :param limit: return only the newest limit statuses
+    :param profile: fields of the statuses returned, see PROFILES
     :returns: cursor of statuses as for esearch
     :rtype: pymongo cursor
 
     """
-    search_context = processCmdLine(cmdline)
-    search_context.query = None
-    return esearch(search_context, DESCENDING)
+    start, end = querylang.parse(cmdline).window()
+    search_context = SearchContext(start, end, None, None)
+    return esearch(search_context, DESCENDING, limit, profile)
 
 
-def xget_by_date(query):
+def xget_by_date(query, profile="full"):
     """get by start and end dates
     :param query: dict specifying start and end dates
       in ISO format, e.g. "2022-02-25"
+    :param profile: fields of the statuses returned, see PROFILES
     :return err, result:
     """
-    db = get_db()
     try:
-        startde = delorean.parse(
-            query["start"], yearfirst=True, dayfirst=False
-        ).datetime
-        endde = delorean.parse(query["end"], yearfirst=True, dayfirst=False).datetime
+        startde = td.parse_date(query["start"]).datetime
+        endde = td.parse_date(query["end"]).datetime
         searchon = {"created_at": {"$gte": startde, "$lt": endde}}
-        cursor = db.statuses.find(searchon)
+        cursor = get_backend().find_statuses(searchon, projection(profile))
         return None, cursor
     except Exception as e:
         return e, None
 
 
-def get_lastread():
-    db = get_db()
-    last = db.lastread.find_one()
-    if not last:
-        return (0, 0)
-    else:
-        return last["_id"], last["maxid"]
+def get_lastread(feed=None, inherit=False):
+    """
+    :param feed: list id of the feed, None for the untagged watermark
+    :param bool inherit: a feed without a watermark of its own starts
+        from the untagged one; only for the list readfeed used to read,
+        any other list has a backlog of its own
+    :return: key and maxid of the watermark, (0, 0) on virgin database
+    :rtype: tuple
+    """
+    return get_backend().get_lastread(feed, inherit)
 
 
-def store_lastread(maxid):
-    _id, oldmaxid = get_lastread()
-    db = get_db()
-    db.lastread.update_one(
-        {"_id": _id, "maxid": oldmaxid},
-        {"$set": {"_id": _id, "maxid": maxid}},
-        upsert=True,
-    )
+def store_lastread(maxid, feed=None):
+    """
+    Advance the watermark to maxid atomically; a late or replayed
+    checkpoint can never move it backwards
+    """
+    get_backend().store_lastread(maxid, feed)
 
 
 def instrumented_esearch(search_context, sort_dir=ASCENDING):
@@ -480,13 +782,12 @@ def instrumented_esearch(search_context, sort_dir=ASCENDING):
     :rtype: err, cursor
     """
     t0 = perf_counter()
-    db = get_db()
+    backend = get_backend()
     t1 = perf_counter()
     try:
         searchon = _setup_mongo_query(search_context)
-        cursor = db.statuses.find(searchon)
         t2 = perf_counter()
-        c = cursor.sort("created_at", sort_dir)
+        c = backend.find_statuses(searchon, None, sort_dir)
         t3 = perf_counter()
         times = (t0, t1, t2, t3)
         return None, c, times
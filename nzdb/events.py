@@ -0,0 +1,209 @@
+"""
+events -- new statuses pushed to subscribers as readfeed commits them
+
+readfeed and ingestd advance a lastread watermark once they have
+committed a read. One Watcher per db in a process reads the watermarks every POLL
+secs while anyone is subscribed, and when one moves reads the statuses
+it passed once and hands them to the queue of every subscription. The
+db sees one small query per poll however many clients are listening.
+
+Each stream holds a server thread for as long as it is open, so a
+process serves at most maxstreams of them (the [events] section of the
+conf) and refuses more with TooManyStreams, keeping threads for the
+other routes.
+"""
+
+import logging
+import queue
+import threading
+from collections import deque
+from contextvars import copy_context
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+
+from nzdb import budget, metrics
+from nzdb.configurator import nzdbConfig
+from nzdb.connectdb import current_target
+from nzdb.storage import get_backend
+from nzdb.storage.base import ASCENDING, project
+
+# secs between reads of the watermarks
+POLL = 2
+# secs between keepalives on a stream with nothing new
+KEEPALIVE = 15
+# batches a subscriber may fall behind before it is dropped
+BACKLOG = 64
+# statuses committed later than this after their creation are not pushed
+LAG = timedelta(hours=1)
+# ids remembered as pushed, against feeds whose watermarks overlap
+SENT = 10000
+
+logger = logging.getLogger(__name__)
+
+# (host, dbname) -> Watcher
+_watchers = {}
+_lock = threading.Lock()
+# subscriptions open in this process
+_streams = 0
+
+
+class TooManyStreams(Exception):
+    pass
+
+
+class Subscription:
+    """the batches of new statuses for one client"""
+
+    def __init__(self, watcher, fields):
+        self.watcher = watcher
+        self.fields = fields
+        self.queue = queue.Queue(BACKLOG)
+        self.dropped = False
+        self.closed = False
+
+    def get(self, timeout):
+        """
+        :param timeout: secs to wait for a batch
+        :return: statuses of the next batch, projected, and the monotonic
+            time they were read; None if none came within timeout
+        """
+        try:
+            statuses, read_at = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return [project(s, self.fields) for s in statuses], read_at
+
+    def close(self):
+        global _streams
+        with _lock:
+            if self.closed:
+                return
+            self.closed = True
+            _streams -= 1
+        self.watcher.unsubscribe(self)
+
+
+class Watcher:
+    """
+    Polls the watermarks of a db from a thread of its own, started with
+    the first subscription and ended when the last one closes
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.subscriptions = set()
+        # maxid by watermark, None until first read
+        self.marks = None
+        self.sent = deque(maxlen=SENT)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self, fields):
+        sub = Subscription(self, fields)
+        with self.lock:
+            self.subscriptions.add(sub)
+            if self.thread is None:
+                # the context carries the db the watcher was made for
+                context = copy_context()
+                self.thread = threading.Thread(
+                    target=context.run,
+                    args=(self._run,),
+                    name=f"nzdb-events-{self.target[1]}",
+                    daemon=True,
+                )
+                self.thread.start()
+            self._count()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscriptions.discard(sub)
+            self._count()
+
+    def _count(self):
+        connections = len(self.subscriptions)
+        metrics.set_gauge("nzdb_sse_connections", connections, db=self.target[1])
+
+    def _run(self):
+        with budget.unlimited():
+            while True:
+                with self.lock:
+                    if not self.subscriptions:
+                        self.thread = None
+                        self.marks = None
+                        return
+                try:
+                    self.publish(self.poll(get_backend()))
+                except Exception:
+                    logger.exception("events: poll failed")
+                    metrics.incr("nzdb_sse_poll_errors_total")
+                sleep(POLL)
+
+    def poll(self, backend, now=None):
+        """
+        :return: statuses committed since the last poll, oldest first;
+            none on the first poll, which only reads the watermarks
+        :rtype: list
+        """
+        marks = backend.get_watermarks()
+        last, self.marks = self.marks, marks
+        if last is None:
+            return []
+        moved = [key for key, maxid in marks.items() if maxid > last.get(key, 0)]
+        if not moved:
+            return []
+        low = min(last.get(key, 0) for key in moved)
+        high = max(marks[key] for key in moved)
+        now = now or datetime.utcnow()
+        searchon = {
+            "created_at": {"$gte": now - LAG},
+            "id": {"$gt": low, "$lte": high},
+        }
+        sent = set(self.sent)
+        found = backend.find_statuses(searchon, {"_id": False}, ASCENDING)
+        statuses = [s for s in found if s["id"] not in sent]
+        self.sent.extend(s["id"] for s in statuses)
+        return statuses
+
+    def publish(self, statuses):
+        """hand statuses to every subscription, dropping those behind"""
+        if not statuses:
+            return
+        read_at = monotonic()
+        with self.lock:
+            subs = list(self.subscriptions)
+        for sub in subs:
+            try:
+                sub.queue.put_nowait((statuses, read_at))
+            except queue.Full:
+                sub.dropped = True
+                self.unsubscribe(sub)
+                metrics.incr("nzdb_sse_dropped_total")
+        metrics.incr("nzdb_sse_statuses_total", len(statuses))
+
+
+def subscribe(fields):
+    """
+    :param dict fields: mongo projection of the statuses pushed
+    :return: Subscription to the statuses committed to the current db
+    :raises: TooManyStreams if maxstreams subscriptions are open
+    """
+    global _streams
+    target = current_target()
+    with _lock:
+        if _streams >= nzdbConfig["maxstreams"]:
+            metrics.incr("nzdb_sse_rejected_total")
+            raise TooManyStreams(f"{_streams} event streams open, try again later")
+        _streams += 1
+        watcher = _watchers.get(target)
+        if watcher is None:
+            watcher = _watchers[target] = Watcher(target)
+    return watcher.subscribe(fields)
+
+
+def delivered(read_at):
+    """record the time from reading a batch to writing it to a client"""
+    latency = monotonic() - read_at
+    metrics.incr("nzdb_sse_fanout_seconds_sum", latency)
+    metrics.incr("nzdb_sse_fanout_seconds_count")
+    metrics.set_gauge("nzdb_sse_fanout_seconds_last", latency)
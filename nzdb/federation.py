@@ -0,0 +1,205 @@
+"""
+federation -- searches and counts run on several regional dbs at once
+
+The dbs are those of the [federation] section of the conf, by region:
+
+    [federation]
+    us = usnews
+    eu = eunews@mongodb://eu-db:27017
+
+A federated call runs the dbif function on every region in parallel,
+each under use_db and in the time budget of the caller, and reports for
+every region the time it took and the error if it failed; the regions
+that succeeded still give their results.
+"""
+
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from copy import deepcopy
+from itertools import islice
+from operator import itemgetter
+from time import perf_counter
+
+from nzdb import dbif, metrics
+from nzdb.configurator import nzdbConfig
+from nzdb.connectdb import use_db
+from nzdb.storage.base import DESCENDING
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="nzdb-federation")
+
+
+class RegionNotFound(Exception):
+    pass
+
+
+def configured():
+    """
+    :return: (host, dbname) of the regions of the conf, by name; read
+        when used, as the conf is
+    """
+    return nzdbConfig.get("federation") or {}
+
+
+def regions(names=None):
+    """
+    :param names: region names, None for all
+    :return: (host, dbname) of the regions, by name
+    :raises: RegionNotFound
+    """
+    known = configured()
+    if not known:
+        raise RegionNotFound("no [federation] section in the conf")
+    if not names:
+        return dict(known)
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise RegionNotFound(f"no regions {unknown}, use some of {list(known)}")
+    return {name: known[name] for name in names}
+
+
+def _call(region, target, fn, args):
+    """run fn on the db of region; its result is read in full here"""
+    host, dbname = target
+    t0 = perf_counter()
+    with use_db(dbname, host):
+        try:
+            err, result = fn(*args)
+            if err is None and not isinstance(result, (dict, list)):
+                result = list(result)
+        except Exception as e:
+            err, result = e, None
+    ms = 1000 * (perf_counter() - t0)
+    metrics.incr("nzdb_federated_calls_total", region=region, ok=err is None)
+    report = {"ms": round(ms, 1), "error": None if err is None else str(err)}
+    return region, result if err is None else None, report
+
+
+def fan_out(fn, args_of, names=None):
+    """
+    :param fn: dbif function returning (err, result)
+    :param args_of: function of a region name to the args of fn
+    :param names: regions to run on, None for all
+    :return: results of the regions that succeeded, and the report of
+        every region, both by name
+    :raises: RegionNotFound
+    """
+    futures = [
+        # each call gets a copy of the caller's context: its budget
+        # and kind of reads
+        _pool.submit(copy_context().run, _call, name, target, fn, args_of(name))
+        for name, target in regions(names).items()
+    ]
+    results, reports = {}, {}
+    for future in futures:
+        region, result, report = future.result()
+        reports[region] = report
+        if result is not None:
+            results[region] = result
+    return results, reports
+
+
+def _failed(reports):
+    """error of a federated call, if no region succeeded"""
+    errors = [f"{region}: {r['error']}" for region, r in reports.items()]
+    return Exception("all regions failed: " + "; ".join(errors))
+
+
+def fsearch(xquery, sort_dir=DESCENDING, limit=None, profile="full"):
+    """
+    xwebsearch on every region, merged by created_at
+    :param dict xquery: as for xwebsearch, with optional regions
+    :return: err, statuses tagged with their region, and the reports
+    """
+    try:
+        results, reports = fan_out(
+            dbif.xwebsearch,
+            lambda region: (xquery, sort_dir, limit, profile),
+            xquery.get("regions"),
+        )
+    except RegionNotFound as e:
+        return e, [], {}
+    if not results:
+        return _failed(reports), [], reports
+    streams = [
+        [status | {"region": region} for status in statuses]
+        for region, statuses in results.items()
+    ]
+    merged = heapq.merge(
+        *streams, key=itemgetter("created_at"), reverse=sort_dir == DESCENDING
+    )
+    return None, list(islice(merged, limit)), reports
+
+
+def fcount(xquery):
+    """
+    xcount on every region
+    :return: err, dict {count, exact, min, max} of the regions together
+        with the count of each region under regions, and the reports
+    """
+    try:
+        results, reports = fan_out(
+            dbif.xcount, lambda region: (xquery,), xquery.get("regions")
+        )
+    except RegionNotFound as e:
+        return e, None, {}
+    if not results:
+        return _failed(reports), None, reports
+    maxes = [r["max"] for r in results.values()]
+    total = {
+        "count": sum(r["count"] for r in results.values()),
+        "exact": all(r["exact"] for r in results.values()),
+        "min": sum(r["min"] for r in results.values()),
+        "max": None if None in maxes else sum(maxes),
+    }
+    return None, total | {"regions": results}, reports
+
+
+def fcounts(xcounts_qry):
+    """
+    xcounts on every region
+    :return: err, dict {counts, intervals, regions} where counts are the
+        totals of the regions, None where a region has no count, and
+        regions the counts of each region; and the reports
+    """
+    try:
+        results, reports = fan_out(
+            dbif.xcounts, lambda region: (xcounts_qry,), xcounts_qry.get("regions")
+        )
+    except RegionNotFound as e:
+        return e, None, {}
+    if not results:
+        return _failed(reports), None, reports
+    counts = zip(*(r["counts"] for r in results.values()))
+    totals = [None if None in c else sum(c) for c in counts]
+    intervals = next(iter(results.values()))["intervals"]
+    regional = {region: r["counts"] for region, r in results.items()}
+    combined = {"counts": totals, "intervals": intervals, "regions": regional}
+    return None, combined, reports
+
+
+def fgraph(query):
+    """
+    xgraphdb on every region, the series of each subquery and region
+    side by side, labelled "query (region)"
+    :return: err, vega-lite spec as from xgraphdb, and the reports
+    """
+    try:
+        results, reports = fan_out(
+            # xgraphdb takes the subqueries out of its query
+            dbif.xgraphdb,
+            lambda region: (deepcopy(query),),
+            query.get("regions"),
+        )
+    except RegionNotFound as e:
+        return e, None, {}
+    if not results:
+        return _failed(reports), None, reports
+    values = []
+    for region, spec in results.items():
+        for item in spec["data"].get("values", []):
+            values.append(
+                dbif.graph_item(item.period, f"{item.query} ({region})", item.value)
+            )
+    spec = next(iter(results.values()))
+    return None, spec | {"data": {"values": values}}, reports
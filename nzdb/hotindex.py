@@ -0,0 +1,196 @@
+"""
+hotindex -- in-memory inverted index of the statuses of the last hours
+
+Most searches ask for the last day or two. With hours set in the [hot]
+section of the conf, a process keeps the statuses created in the last
+hours in memory, with a posting list of status ids for every stem of a
+folded word, and answers searches whose date window lies inside that
+range from it. Statuses stored by the process are added as they are
+stored; statuses stored by other processes are picked up from the db at
+most every REFRESH secs. Words are folded and stemmed as in textmatch.
+"""
+
+import heapq
+import threading
+from array import array
+from bisect import insort
+from datetime import datetime, timedelta
+from operator import itemgetter
+from time import monotonic
+
+from nzdb import metrics
+from nzdb.configurator import nzdbConfig
+from nzdb.connectdb import current_target
+from nzdb.partitions import naive_utc
+from nzdb.storage.base import ASCENDING, DESCENDING, project
+from nzdb.textmatch import TextQuery, matcher, stem, stems
+
+# secs between reads of statuses stored by other processes
+REFRESH = 30
+# secs between evictions of statuses that have left the window
+EVICT = 600
+# statuses stored later than this after their creation may be missed
+LAG = timedelta(hours=1)
+
+# (host, dbname) -> HotIndex
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _append(ids, sid):
+    """add sid to ids, kept in ascending order"""
+    if not ids or ids[-1] < sid:
+        ids.append(sid)
+    else:
+        insort(ids, sid)
+
+
+class HotIndex:
+    """
+    Statuses created in the last hours, keyed by id, and for every stem
+    an array of the ids of the statuses containing it, in id order
+    """
+
+    def __init__(self, hours):
+        self.span = timedelta(hours=hours)
+        # oldest created_at held; None until loaded
+        self.start = None
+        self.statuses = {}
+        self.postings = {}
+        self.refreshed = self.evicted = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def add(self, statuses):
+        with self.lock:
+            self._add(statuses)
+
+    def _add(self, statuses):
+        for status in sorted(statuses, key=lambda s: s["id"]):
+            sid = status["id"]
+            created = naive_utc(status["created_at"])
+            if sid in self.statuses or (self.start and created < self.start):
+                continue
+            status = {k: v for k, v in status.items() if k != "_id"}
+            status["created_at"] = created
+            self.statuses[sid] = status
+            for word in stems(status["text"]):
+                _append(self.postings.setdefault(word, array("q")), sid)
+
+    def _evict(self, now):
+        self.start = now - self.span
+        old = {sid for sid, s in self.statuses.items() if s["created_at"] < self.start}
+        if not old:
+            return
+        for sid in old:
+            del self.statuses[sid]
+        newest_old = max(old)
+        for word, ids in list(self.postings.items()):
+            if ids[0] > newest_old:
+                continue
+            kept = array("q", (sid for sid in ids if sid not in old))
+            if kept:
+                self.postings[word] = kept
+            else:
+                del self.postings[word]
+
+    def refresh(self, backend, now=None):
+        """
+        Load the window on first use, then read statuses stored since
+        the last refresh and evict those that have left the window
+        """
+        now = now or datetime.utcnow()
+        with self.lock:
+            if self.start is None:
+                since = self.start = now - self.span
+            else:
+                since = max(self.start, now - LAG)
+            window = {"created_at": {"$gte": since, "$lt": now + LAG}}
+            self._add(backend.find_statuses(window, {"_id": False}))
+            if monotonic() - self.evicted > EVICT:
+                self._evict(now)
+                self.evicted = monotonic()
+            self.refreshed = monotonic()
+        metrics.set_gauge("nzdb_hot_statuses", len(self))
+        metrics.set_gauge("nzdb_hot_words", len(self.postings))
+
+    def stale(self):
+        return monotonic() - self.refreshed > REFRESH
+
+    def covers(self, searchon):
+        """true if the date window of searchon lies inside the index"""
+        window = searchon.get("created_at")
+        if self.start is None or window is None or "$gte" not in window:
+            return False
+        return naive_utc(window["$gte"]) >= self.start
+
+    def _candidates(self, query):
+        """ids of statuses that may match query, to be checked in full"""
+        if query.phrases:
+            required = {stem(w) for phrase in query.phrases for w in phrase.split()}
+            postings = sorted((self.postings.get(w, ()) for w in required), key=len)
+            if not postings:
+                return self.statuses.keys()
+            return set(postings[0]).intersection(*postings[1:])
+        if not query.terms:
+            return self.statuses.keys()
+        return set().union(*(self.postings.get(w, ()) for w in query.term_stems))
+
+    def find(self, searchon, sort_dir=None, limit=None, projection=None):
+        """
+        :param dict searchon: query as built by dbif, with a window that
+            the index covers
+        :param limit: return only the first limit statuses in sort order
+        :param dict projection: mongo projection of the statuses
+        :return: list of matching status docs
+        """
+        window = searchon["created_at"]
+        start = naive_utc(window["$gte"])
+        end = naive_utc(window["$lt"]) if "$lt" in window else datetime.max
+        text = searchon.get("$text")
+        match = matcher(searchon)
+        with self.lock:
+            ids = (
+                self._candidates(TextQuery(text["$search"]))
+                if text
+                else self.statuses.keys()
+            )
+            found = [
+                project(status, projection)
+                for status in (self.statuses[sid] for sid in ids)
+                if start <= status["created_at"] < end and match(status)
+            ]
+        key = itemgetter("created_at")
+        if limit is not None and sort_dir in (ASCENDING, DESCENDING):
+            top = heapq.nlargest if sort_dir == DESCENDING else heapq.nsmallest
+            return top(limit, found, key=key)
+        if sort_dir in (ASCENDING, DESCENDING):
+            found.sort(key=key, reverse=sort_dir == DESCENDING)
+        return found if limit is None else found[:limit]
+
+
+def get_index(backend):
+    """
+    The hot index of the current db, loaded or refreshed if due
+    :return: HotIndex, or None if hours is not set in the conf
+    """
+    hours = nzdbConfig["hothours"]
+    if not hours:
+        return None
+    target = current_target()
+    with _lock:
+        index = _indexes.get(target)
+        if index is None:
+            index = _indexes[target] = HotIndex(hours)
+    if index.stale():
+        index.refresh(backend)
+    return index
+
+
+def feed(statuses):
+    """add statuses just stored to the hot index of the db, if loaded"""
+    index = _indexes.get(current_target())
+    if index is not None and index.start is not None:
+        index.add(statuses)
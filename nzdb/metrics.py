@@ -0,0 +1,58 @@
+"""
+metrics -- process-wide gauges and counters, exported in prometheus
+text format
+"""
+
+import os
+from collections import defaultdict
+from threading import Lock
+
+_lock = Lock()
+_gauges = {}
+_counters = defaultdict(float)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def incr(name, amount=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += amount
+
+
+def snapshot():
+    """
+    :return: current values keyed by (name, labels)
+    :rtype: dict
+    """
+    with _lock:
+        return dict(_gauges) | dict(_counters)
+
+
+def render():
+    """
+    :return: all metrics in prometheus text exposition format
+    :rtype: str
+    """
+    lines = []
+    for (name, labels), value in sorted(snapshot().items()):
+        if labels:
+            labelstr = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{labelstr}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path):
+    """write metrics atomically for the node exporter textfile collector"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
@@ -0,0 +1,99 @@
+"""
+mongostats -- pymongo listeners exporting the pool use and reads of the
+mongo clients made by connectdb
+"""
+
+import threading
+from time import perf_counter
+
+from pymongo.monitoring import CommandListener, ConnectionPoolListener
+
+from nzdb import metrics
+from nzdb.connectdb import READS, current_reads
+
+
+class PoolStats(ConnectionPoolListener):
+    """
+    Connections open, in use and waited for, per server of a client,
+    and the time spent waiting for a connection
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.open = {}
+        self.in_use = {}
+        self.waiting = {}
+        self._lock = threading.Lock()
+        self._started = threading.local()
+
+    def _add(self, counts, address, n):
+        server = "%s:%s" % address
+        with self._lock:
+            counts[server] = counts.get(server, 0) + n
+            in_use = self.in_use.get(server, 0)
+            gauges = {
+                "nzdb_pool_open": self.open.get(server, 0),
+                "nzdb_pool_in_use": in_use,
+                "nzdb_pool_waiting": self.waiting.get(server, 0),
+                "nzdb_pool_utilization": in_use / self.size,
+            }
+        for name, value in gauges.items():
+            metrics.set_gauge(name, value, server=server)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add(self.open, event.address, 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(self.open, event.address, -1)
+
+    def connection_check_out_started(self, event):
+        # check out starts and ends on the thread that asked
+        self._started.t = perf_counter()
+        self._add(self.waiting, event.address, 1)
+
+    def _waited(self, event):
+        waited = perf_counter() - getattr(self._started, "t", perf_counter())
+        metrics.incr("nzdb_pool_wait_seconds_sum", waited)
+        metrics.incr("nzdb_pool_wait_seconds_count")
+        self._add(self.waiting, event.address, -1)
+
+    def connection_check_out_failed(self, event):
+        self._waited(event)
+        metrics.incr("nzdb_pool_checkout_failures_total", reason=event.reason)
+
+    def connection_checked_out(self, event):
+        self._waited(event)
+        self._add(self.in_use, event.address, 1)
+
+    def connection_checked_in(self, event):
+        self._add(self.in_use, event.address, -1)
+
+
+class ReadStats(CommandListener):
+    """reads answered, by server and kind of read"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name in READS:
+            server = "%s:%s" % event.connection_id
+            metrics.incr("nzdb_reads_total", server=server, reads=current_reads())
+
+    def failed(self, event):
+        pass
@@ -1,29 +1,43 @@
 import logging
 import re
 from collections import OrderedDict, defaultdict
-from itertools import chain, groupby
+from contextlib import ExitStack
+from functools import wraps
+from itertools import groupby
 from time import perf_counter
 
 from flask import (
+    Blueprint,
     Flask,
+    current_app,
     flash,
+    g,
     jsonify,
     redirect,
     render_template,
     request,
-    url_for,
+    stream_with_context,
 )
+from flask import json as flask_json
 from flask_bootstrap import Bootstrap
 from flask.json import JSONEncoder
 
+from nzdb import budget, compress, events, federation, warmup
+from nzdb.compact import encode
 from nzdb.configurator import nzdbConfig
+from nzdb.connectdb import ANALYTICS, current_target, reading, use_db
 from nzdb.dbif import (
+    ProfileNotFound,
     fetch_recent,
     getCount,
     getTopics,
+    projection,
+    query_cost,
     websearch,
     xcount,
     xcounts,
+    xcounts_cost,
+    xquery_cost,
     xwebsearch,
     xgraphdb,
 )
@@ -34,10 +48,6 @@ import ujson as json
 # from nzdb.dupdetect import dedupe
 
 
-class WebQueryParseException(Exception):
-    pass
-
-
 LOGFILENAME = nzdbConfig["logfile"]
 LOGNAME = nzdbConfig["logname"]
 
@@ -55,22 +65,9 @@ SECRET_KEY = nzdbConfig["SECRET_KEY"]
 USERNAME = nzdbConfig["USERNAME"]
 PASSWORD = nzdbConfig["PASSWORD"]
 
-templates = nzdbConfig["templates"]
-static = nzdbConfig["static"]
 # ?FIXME! add to config eventually
 images = "~/Prog/nooze2/app/images/signature.jpg"
 
-app = Flask(__name__, template_folder=templates, static_folder=static)
-
-# added 2/18/21 per
-# https://stackoverflow.com/questions/37931927/why-is-flasks-jsonify-method-slow/37932098
-app.config["JSONIFY_PRETTYPRINT_REGULAR"] = False
-app.config["JSON_SORT_KEYS"] = False
-# app.config.from_object(__name__)
-
-# manager = Manager(app)
-bootstrap = Bootstrap(app)
-
 
 # for below hack, see
 # https://stackoverflow.com/questions/64203233/how-can-i-use-ujson-as-a-flask-encoder-decoder
@@ -82,7 +79,179 @@ class CustomJSONEncoder(JSONEncoder):
             return JSONEncoder.default(self, obj)
 
 
-app.json_encoder = CustomJSONEncoder
+nooze = Blueprint("nooze", __name__)
+
+
+def create_app(conf=None):
+    """
+    The web app on the db of conf; several apps, one per db, can be
+    served by one process, see tenants
+    :param dict conf: configuration as read by configurator.parse_config,
+        by default the conf in NZDBCONF
+    :rtype: Flask
+    """
+    conf = conf or nzdbConfig
+    app = Flask(
+        __name__, template_folder=conf["templates"], static_folder=conf["static"]
+    )
+    # added 2/18/21 per
+    # https://stackoverflow.com/questions/37931927/why-is-flasks-jsonify-method-slow/37932098
+    app.config["JSONIFY_PRETTYPRINT_REGULAR"] = False
+    app.config["JSON_SORT_KEYS"] = False
+    app.config["NZDB_TARGET"] = (conf["DBHOST"], conf["DBNAME"])
+    # app.config.from_object(__name__)
+    app.json_encoder = CustomJSONEncoder
+    Bootstrap(app)
+    # each app caches its own bodies, so that apps don't evict each other's
+    app.extensions["nzdb_bodies"] = compress.BodyCache()
+    # started in each worker, see warmup
+    app.extensions["nzdb_warmup"] = warmup.Warmup(app)
+    app.register_blueprint(nooze)
+    return app
+
+
+@nooze.before_app_request
+def select_db():
+    """run the request on the db of its app"""
+    target = current_app.config["NZDB_TARGET"]
+    if target != current_target():
+        g.nzdb_db = ExitStack()
+        host, dbname = target
+        g.nzdb_db.enter_context(use_db(dbname, host))
+
+
+@nooze.teardown_app_request
+def release_db(exc):
+    # after a streamed response has been sent
+    if "nzdb_db" in g:
+        g.pop("nzdb_db").close()
+
+
+# milliseconds each route may spend searching before it returns what it
+# has found, marked truncated
+BUDGETS = {
+    "recent": 2000,
+    "qry": 10000,
+    "xqry": 10000,
+    "xcount": 5000,
+    "intvlcounts": 15000,
+    "xgraph": 20000,
+    "fxqry": 10000,
+    "fxcount": 5000,
+    "fintvlcounts": 15000,
+    "fxgraph": 20000,
+}
+# days of searching a process runs at once; requests beyond it wait up
+# to QUEUE_WAIT secs, then get a 503
+CAPACITY = 120
+QUEUE_WAIT = 3
+admission = budget.Admission(CAPACITY, QUEUE_WAIT)
+
+
+def budgeted(name, cost):
+    """
+    Run a route within its time budget, once admitted
+    :param str name: key of the route in BUDGETS
+    :param cost: function of the request to its estimated cost
+    """
+
+    def decorate(view):
+        @wraps(view)
+        def run(*args, **kwargs):
+            try:
+                with admission.admit(cost(request)):
+                    with budget.time_budget(BUDGETS[name]):
+                        resp = view(*args, **kwargs)
+                        if budget.truncated():
+                            # for routes returning bare lists
+                            resp.headers["X-Truncated"] = "1"
+                        return resp
+            except budget.Overloaded as e:
+                logger.warning(f"{name} rejected: {e}")
+                resp = jsonify(error=f"server busy, try again: {e}")
+                resp.status_code = 503
+                resp.headers["Retry-After"] = str(QUEUE_WAIT)
+                return resp
+
+        return run
+
+    return decorate
+
+
+# secs the bodies of cacheable routes are served from the cache
+CACHE_TTLS = {"cats": 60, "count": 60, "recent": 15}
+COMPRESSIBLE = ("application/json", "application/javascript", "text/")
+
+
+def cached(name):
+    """
+    Serve a GET route from the body cache for CACHE_TTLS[name] secs,
+    keyed by db and full path, compressed once per encoding
+    """
+
+    def decorate(view):
+        @wraps(view)
+        def run(*args, **kwargs):
+            key = (current_target(), request.full_path)
+            encoding = compress.negotiate(request.headers.get("Accept-Encoding"))
+            bodies = current_app.extensions["nzdb_bodies"]
+            hit = bodies.get(key, encoding)
+            if hit is None:
+                resp = view(*args, **kwargs)
+                if resp.status_code != 200 or "X-Truncated" in resp.headers:
+                    return resp
+                bodies.put(key, resp.get_data(), CACHE_TTLS[name], resp.mimetype)
+                hit = bodies.get(key, encoding)
+            body, encoding, mimetype = hit
+            resp = current_app.response_class(body, mimetype=mimetype)
+            if encoding is not None:
+                resp.headers["Content-Encoding"] = encoding
+            return resp
+
+        return run
+
+    return decorate
+
+
+def result_limit(value):
+    """limit on the statuses a route returns, from a request parameter"""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return None
+    return limit if limit > 0 else None
+
+
+def flag(value):
+    """a boolean request parameter, set by 1, true, yes or on"""
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def statuses_json(statuses, compact):
+    """
+    json list of statuses, or if compact an object with the statuses
+    and the tables of their interned values
+    """
+    if not compact:
+        return jsonify(list(statuses))
+    statuses, interned = encode(statuses)
+    return jsonify(statuses=statuses, interned=interned)
+
+
+def json_cost(cost):
+    """cost function of a request from a cost function of its json"""
+    return lambda req: cost(req.get_json(silent=True) or {})
+
+
+def federated_cost(cost):
+    """cost function of a federated request, run on each of its regions"""
+
+    def run(req):
+        query = req.get_json(silent=True) or {}
+        names = query.get("regions") or federation.configured()
+        return cost(query) * max(1, len(names))
+
+    return run
 
 
 # timing, return time in ms
@@ -152,7 +321,7 @@ class Row:
         self.header = header
 
 
-@app.template_filter("taburlize")
+@nooze.app_template_filter("taburlize")
 def taburlize(s):
     """flask filter similar to urlize but sets target to new tab"""
     pattern = r"(https?://\S+)"
@@ -160,120 +329,55 @@ def taburlize(s):
     return p.sub(r'<a href="\1" target="_blank"> ...more &#10149; </a>', s)
 
 
-@app.route("/error")
+@nooze.route("/error")
 def showError():
     return render_template("error.html")
 
 
-@app.route("/stats")
+@nooze.route("/stats")
 def showStats():
-    n, cats = getStats()
+    with reading(ANALYTICS):
+        n, cats = getStats()
     return render_template("stats.html", n=n, cats=cats)
 
 
-@app.route("/help")
+@nooze.route("/help")
 def showHelp():
     return render_template("help.html")
 
 
+@nooze.route("/ready")
+def ready():
+    """200 once the app is warmed up in this worker, 503 until then"""
+    warm = current_app.extensions["nzdb_warmup"]
+    # for servers that don't start the warm-up themselves
+    warm.start()
+    if not warm.ready.is_set():
+        resp = jsonify(ready=False, error=warm.error)
+        resp.status_code = 503
+        return resp
+    return jsonify(ready=True, steps=warm.steps)
+
+
 # https://stackoverflow.com/questions/63052492/cant-load-icons-from-manifest-json-file
-# @app.route("/static/icons/<path:filename>")
+# @nooze.route("/static/icons/<path:filename>")
 # def icons(filename):
 #     return send_from_directory("./static/icons", filename)
 
 
-def extract_options(parts):
-    """
-    Extract options from query, such as -d 5 xxx
-    """
-    options = ""
-    newparts = []
-    n = len(parts)
-    skip = False
-    for i in range(len(parts)):
-        if skip:
-            skip = False
-            continue
-        if (parts[i].startswith("-")) and i + 1 < n:
-            if parts[i][1] not in "dseH":
-                # -d -s -e are only valid options
-                raise WebQueryParseException
-            # remove option indicator and value and add to options
-            clause = " ".join([parts[i], parts[i + 1]])
-            if options != "":
-                options = " ".join([options, clause])
-            else:
-                options = clause
-            skip = True  # skip ahead in iteration
-        else:
-            newparts.append(parts[i])
-    if options == "":
-        # valid query must have options
-        raise WebQueryParseException
-    return options, newparts
-
-
-def parse_query(query):
+def handleQuery(query, limit=None, profile="full"):
     """
-    Transform complex query into simpler subqueries that can be processed
-    by processCmdLine and then combined in showNews by chaining
-    returns err, queries; err is None if no exception, True otherwise
+    Statuses for a query from the query page, where the words of a query
+    are searched for as one phrase and each *topic on its own
     """
-    parts = query.split(" ")
-    try:
-        if len(parts) < 3:
-            # -x 1 somequery is minimal query, so will have 3 or more parts
-            raise WebQueryParseException
-        options, parts = extract_options(parts)
-    # TODO: make this catch more fine-grained.
-    # right now taking care of both WebQueryParseException and
-    # index out of range exception from parts[1][1] avoe when a bare -
-    # is entered in a custom query
-    except Exception as e:
-        print(query, e)
-        return True, []
-    starred = []
-    unstarred = []
-    for part in parts:
-        if part.startswith("*"):
-            starred.append(part)
-        else:
-            unstarred.append(part)
-    queries = []
-    for query in starred:
-        queries.append(" ".join([options, query]))
-    unstarred_stringed = " ".join(unstarred)
-    unstarred_quoted = f'"{unstarred_stringed}"'
-    if unstarred:
-        queries.append(" ".join([options, unstarred_quoted]))
-    return False, queries
-
-
-def handleQuery(query):
-    err, queries = parse_query(query)
+    err, statuses = websearch(query, together=True, limit=limit, profile=profile)
     if err:
-        flash("Error in query, try again!")
-        return redirect(url_for("query"))
-    cursors = []
-    for subquery in queries:
-        err, cursor = websearch(subquery)
-        if not err:
-            cursors.append(cursor)
-        elif err:
-            flash("Error in query, try again! " + str(err))
-    # kludgy error signaling mechanism
-    if not cursors:
-        query = None
-    # eliminate near duplicates from the display
-
-    # TODO!! for now, remove dedupe from processing chai
-    # print(f"cursors: {cursors}")
-    # statuses = dedupe(chain(*cursors))
-    # return statuses
-    return chain.from_iterable(cursors)
-
-
-@app.route("/")
+        flash("Error in query, try again! " + str(err))
+        return []
+    return statuses
+
+
+@nooze.route("/")
 def query():
     if request.method == "GET":
         return render_template("index.html")
@@ -281,44 +385,97 @@ def query():
         return redirect("/error")
 
 
-@app.route("/json/cats", methods=["GET", "PUT"])
+@nooze.route("/json/cats", methods=["GET", "PUT"])
+@cached("cats")
 def cats_json():
     n, cats = getShortStats()
     resp = jsonify(count=n, cats=cats)
     return resp
 
 
-@app.route("/json/count", methods=["GET"])
+@nooze.route("/json/count", methods=["GET"])
+@cached("count")
 def count_json():
     n = getCount()
     resp = jsonify(count=n)
     return resp
 
 
-@app.route("/json/recent", methods=["GET", "POST"])
+@nooze.route("/json/recent", methods=["GET", "POST"])
+@cached("recent")
+@budgeted("recent", lambda req: 0.125)
 def recent_json():
     # this will get last 3 hours of posts
     t0 = mstimer()
-    error, cursor = fetch_recent()
+    args = request.args
+    limit = result_limit(args.get("limit"))
+    profile = args.get("profile", "full")
+    error, cursor = fetch_recent(limit=limit, profile=profile)
     t1 = mstimer()
     if error is None:
         # cursor = [unid(s) for s in cursor]
         # t2 = mstimer_ns()
-        resp = jsonify([s for s in cursor])
+        resp = statuses_json(cursor, args.get("compact", False, type=flag))
         # resp.headers["Access-Control-Allow-Origin"] = "*"
         t2 = mstimer()
         logger.debug(f"recent: fetch {t1 - t0},  jsonify {t2 - t1} ")
         return resp
     else:
-        t0 = 0
-        return 0
+        logger.error(f"recent: {error}")
+        return jsonify([])
+
+
+@nooze.route("/json/events", methods=["GET"])
+def events_json():
+    """
+    Server-sent events: a statuses event with each batch of statuses
+    readfeed commits, in the projection profile given (ids for just ids
+    and dates), and a keepalive comment when there is nothing new
+    """
+    try:
+        fields = projection(request.args.get("profile", "full"))
+    except ProfileNotFound as e:
+        resp = jsonify(error=str(e))
+        resp.status_code = 400
+        return resp
+    try:
+        subscription = events.subscribe(fields)
+    except events.TooManyStreams as e:
+        resp = jsonify(error=str(e))
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(events.KEEPALIVE)
+        return resp
+
+    def stream():
+        try:
+            yield f"retry: {int(events.POLL * 1000)}\n\n"
+            while not subscription.dropped:
+                batch = subscription.get(events.KEEPALIVE)
+                if batch is None:
+                    yield ": keepalive\n\n"
+                    continue
+                statuses, read_at = batch
+                yield f"event: statuses\ndata: {flask_json.dumps(statuses)}\n\n"
+                events.delivered(read_at)
+        finally:
+            # also run when the client goes away and the server closes us
+            subscription.close()
+
+    resp = current_app.response_class(
+        stream_with_context(stream()), mimetype="text/event-stream"
+    )
+    # a stream closed before its first chunk never runs its finally
+    resp.call_on_close(subscription.close)
+    # nginx would otherwise buffer the stream
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 
 # TODO: need to do something about flashed error messages in handleQuery
 # These won't work with the json interface
 
 
-@app.after_request
+@nooze.after_app_request
 def after_req(resp):
     resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
     resp.headers["server"] = "Nooze Server 0.2.1"
@@ -326,46 +483,88 @@ def after_req(resp):
     return resp
 
 
-@app.route("/json/qry", methods=["GET", "POST"])
+@nooze.after_app_request
+def compress_response(resp):
+    """compress text responses in the encoding the client prefers"""
+    resp.vary.add("Accept-Encoding")
+    if resp.status_code != 200 or resp.direct_passthrough:
+        return resp
+    if resp.mimetype == "text/event-stream":
+        # events are small, and must not wait in a compressor's buffer
+        return resp
+    if "Content-Encoding" in resp.headers:
+        return resp
+    if not (resp.mimetype or "").startswith(COMPRESSIBLE):
+        return resp
+    encoding = compress.negotiate(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return resp
+    if resp.is_streamed:
+        resp.response = compress.stream(resp.response, encoding)
+        resp.headers.pop("Content-Length", None)
+    else:
+        body = resp.get_data()
+        if len(body) < compress.MIN_SIZE:
+            return resp
+        resp.set_data(compress.compress(body, encoding))
+    resp.headers["Content-Encoding"] = encoding
+    return resp
+
+
+@nooze.route("/json/qry", methods=["GET", "POST"])
+@budgeted("qry", lambda req: query_cost(req.args.get("data") or "", True))
 def qry_json():
     logger.debug(f"qry_json: {request.args}")
     query = request.args.get("data")
     # print(query)
     t0 = mstimer()
-    statuses = handleQuery(query)
+    args = request.args
+    limit = result_limit(args.get("limit"))
+    statuses = handleQuery(query, limit, args.get("profile", "full"))
     t1 = mstimer()
     # statuses = [unid(s) for s in statuses]
     # t2 = mstimer_ns()
     # resp = jsonify([s for s in statuses])
-    resp = jsonify(list(statuses))
+    resp = statuses_json(statuses, args.get("compact", False, type=flag))
     t2 = mstimer()
     logger.debug(f"qry_json: fetch {t1 - t0}, jsonify {t2 - t1} ")
     return resp
 
 
-@app.route("/json/xqry", methods=["POST"])
+@nooze.route("/json/xqry", methods=["POST"])
+@budgeted("xqry", json_cost(xquery_cost))
 def xqry():
     xquery = request.get_json()
-    err, statuses = xwebsearch(xquery)
+    limit = result_limit(xquery.get("limit"))
+    profile = xquery.get("profile", "full")
+    err, statuses = xwebsearch(xquery, limit=limit, profile=profile)
     if err is None:
-        resp = jsonify(statuses=list(statuses), error=0)
+        statuses = list(statuses)
+        compact = {}
+        if flag(xquery.get("compact")):
+            statuses, interned = encode(statuses)
+            compact = {"interned": interned}
+        truncated = budget.truncated()
+        resp = jsonify(statuses=statuses, **compact, truncated=truncated, error=0)
     else:
         resp = jsonify(statuses=[], error=str(err))
     return resp
 
 
-@app.route("/json/xcount", methods=["POST"])
+@nooze.route("/json/xcount", methods=["POST"])
+@budgeted("xcount", json_cost(xquery_cost))
 def count():
     xquery = request.get_json()
     err, res = xcount(xquery)
     if err is None:
-        resp = jsonify(count=res["count"], intervals=res["intervals"], error=0)
+        resp = jsonify(**res, truncated=budget.truncated(), error=0)
     else:
-        resp = jsonify(count=0, error=str(err))
+        resp = jsonify(count=0, exact=True, error=str(err))
     return resp
 
 
-@app.route("/json/intvlcounts", methods=["POST"])
+@nooze.route("/json/intvlcounts", methods=["POST"])
+@budgeted("intvlcounts", json_cost(xcounts_cost))
 def intvlcounts():
     """
     query {words: ["Macron"], start: daatestring,
@@ -381,7 +580,8 @@ def intvlcounts():
     return resp
 
 
-@app.route("/json/xgraph", methods=["POST"])
+@nooze.route("/json/xgraph", methods=["POST"])
+@budgeted("xgraph", json_cost(xcounts_cost))
 def xgraph():
     """Receive set of queries for graphing of counts
     query: {subqueries: [query1, query2]}
@@ -400,7 +600,65 @@ def xgraph():
     query = request.get_json()
     err, result = xgraphdb(query)
     if err is None:
-        resp = jsonify(result=result, error=0)
+        resp = jsonify(result=result, truncated=budget.truncated(), error=0)
     else:
         resp = jsonify(result=None, error=str(err))
     return resp
+
+
+@nooze.route("/json/federated/xqry", methods=["POST"])
+@budgeted("fxqry", federated_cost(xquery_cost))
+def federated_xqry():
+    """
+    xqry on every region of the federation, or on those listed in
+    regions, with the time taken and any error of each region
+    """
+    xquery = request.get_json()
+    limit = result_limit(xquery.get("limit"))
+    profile = xquery.get("profile", "full")
+    err, statuses, sources = federation.fsearch(xquery, limit=limit, profile=profile)
+    if err is None:
+        truncated = budget.truncated()
+        resp = jsonify(statuses=statuses, sources=sources, truncated=truncated, error=0)
+    else:
+        resp = jsonify(statuses=[], sources=sources, error=str(err))
+    return resp
+
+
+@nooze.route("/json/federated/xcount", methods=["POST"])
+@budgeted("fxcount", federated_cost(xquery_cost))
+def federated_count():
+    err, res, sources = federation.fcount(request.get_json())
+    if err is None:
+        truncated = budget.truncated()
+        resp = jsonify(**res, sources=sources, truncated=truncated, error=0)
+    else:
+        resp = jsonify(count=0, exact=True, sources=sources, error=str(err))
+    return resp
+
+
+@nooze.route("/json/federated/intvlcounts", methods=["POST"])
+@budgeted("fintvlcounts", federated_cost(xcounts_cost))
+def federated_intvlcounts():
+    err, result, sources = federation.fcounts(request.get_json())
+    if err is None:
+        resp = jsonify(intervals=result, sources=sources, error=0)
+    else:
+        resp = jsonify(intervals=[], sources=sources, error=str(err))
+    return resp
+
+
+@nooze.route("/json/federated/xgraph", methods=["POST"])
+@budgeted("fxgraph", federated_cost(xcounts_cost))
+def federated_xgraph():
+    """xgraph with the series of every region side by side"""
+    err, result, sources = federation.fgraph(request.get_json())
+    if err is None:
+        truncated = budget.truncated()
+        resp = jsonify(result=result, sources=sources, truncated=truncated, error=0)
+    else:
+        resp = jsonify(result=None, sources=sources, error=str(err))
+    return resp
+
+
+app = create_app()
@@ -2,24 +2,22 @@
 """Authenticate to Twitter using tokens from .nany configuration file"""
 import sys
 
-import tweepy
-
 from nzdb.configurator import nzdbConfig
 
-OAUTH_TOKEN = nzdbConfig["OAUTH_TOKEN"]
-OAUTH_TOKEN_SECRET = nzdbConfig["OAUTH_TOKEN_SECRET"]
-CONSUMER_KEY = nzdbConfig["CONSUMER_KEY"]
-CONSUMER_SECRET = nzdbConfig["CONSUMER_SECRET"]
-
 
-def getTwitterApi(wait=False, notify=False):
+def getTwitterApi(wait=False, notify=False, conf=None):
     """
     Authenticate to Twitter
+    conf: parsed conf supplying the tokens, defaults to NZDBCONF
     returns: twitter_api
     """
+    # tweepy takes a tenth of a second to import
+    import tweepy
+
+    conf = nzdbConfig if conf is None else conf
     try:
-        auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
-        auth.set_access_token(OAUTH_TOKEN, OAUTH_TOKEN_SECRET)
+        auth = tweepy.OAuthHandler(conf["CONSUMER_KEY"], conf["CONSUMER_SECRET"])
+        auth.set_access_token(conf["OAUTH_TOKEN"], conf["OAUTH_TOKEN_SECRET"])
         api = tweepy.API(
             auth, wait_on_rate_limit=wait, wait_on_rate_limit_notify=notify
         )
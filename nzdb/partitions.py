@@ -0,0 +1,139 @@
+"""
+partitions -- monthly status collections, selected by created_at
+
+With partitioning on, statuses created in a month are stored in
+statuses_yyyymm and a query reads only the months its date window
+overlaps. The unpartitioned statuses collection is still read while it
+exists, so a db can be migrated month by month.
+"""
+
+import heapq
+from datetime import datetime, timezone
+from itertools import chain
+from time import monotonic
+
+from nzdb.connectdb import current_target
+from nzdb.storage.base import ASCENDING, DESCENDING
+
+TEXT = "text"
+
+LEGACY = "statuses"
+PREFIX = "statuses_"
+# secs between refreshes of the list of partitions; a month created by
+# another process is seen by queries at most this late
+REFRESH = 60
+
+# (host, dbname) -> (time listed, sorted status collection names)
+_known = {}
+
+
+def naive_utc(date):
+    """created_at is stored as naive utc"""
+    if date.tzinfo is None:
+        return date
+    return date.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def partition_name(date):
+    return f"{PREFIX}{date:%Y%m}"
+
+
+def next_month(month):
+    year, month0 = divmod(month.year * 12 + month.month, 12)
+    return month.replace(year=year, month=month0 + 1)
+
+
+def months(start, end):
+    """first days of the months overlapping [start, end)"""
+    start, end = naive_utc(start), naive_utc(end)
+    month = datetime(start.year, start.month, 1)
+    while month < end:
+        yield month
+        month = next_month(month)
+
+
+def status_names(db, refresh=False):
+    """
+    :return: names of the legacy and monthly status collections of db,
+        legacy first, then oldest month first
+    :rtype: list
+    """
+    # dbs of the same name on several hosts are tenants of their own
+    host, _ = current_target()
+    listed = _known.get((host, db.name))
+    if refresh or listed is None or monotonic() - listed[0] > REFRESH:
+        pattern = f"^{LEGACY}$|^{PREFIX}[0-9]{{6}}$"
+        names = db.list_collection_names(filter={"name": {"$regex": pattern}})
+        listed = (monotonic(), sorted(names))
+        _known[(host, db.name)] = listed
+    return listed[1]
+
+
+def collections(db, start=None, end=None):
+    """
+    Status collections holding statuses created in [start, end), oldest
+    first; all of them if there is no window
+    """
+    names = status_names(db)
+    if start is not None and end is not None:
+        wanted = {partition_name(month) for month in months(start, end)}
+        names = [name for name in names if name == LEGACY or name in wanted]
+    return [db[name] for name in names]
+
+
+def index_spec(name, info):
+    """keys and options to recreate an index from index_information"""
+    keys = info["key"]
+    options = {k: v for k, v in info.items() if k not in ("key", "v", "ns")}
+    if ("_fts", "text") in keys:
+        # text indexes report their internal keys; rebuild from weights
+        keys = [(field, TEXT) for field in info["weights"]]
+    return {"name": name, "keys": keys, "options": options}
+
+
+DEFAULT_INDEXES = [
+    {"name": "id_1", "keys": [("id", ASCENDING)], "options": {"unique": True}},
+    {"name": "created_at_-1", "keys": [("created_at", DESCENDING)], "options": {}},
+    {"name": "text_text", "keys": [("text", TEXT)], "options": {}},
+    {
+        "name": "author_1_created_at_-1",
+        "keys": [("author", ASCENDING), ("created_at", DESCENDING)],
+        "options": {},
+    },
+    {
+        "name": "language_code_1_created_at_-1",
+        "keys": [("language_code", ASCENDING), ("created_at", DESCENDING)],
+        "options": {},
+    },
+]
+
+
+def partition_for(db, date):
+    """
+    The partition for statuses created at date, created with the indexes
+    of the legacy statuses collection if it doesn't exist yet
+    """
+    name = partition_name(naive_utc(date))
+    if name not in status_names(db) and name not in status_names(db, True):
+        info = db[LEGACY].index_information()
+        specs = [index_spec(n, i) for n, i in info.items() if n != "_id_"]
+        for spec in specs or DEFAULT_INDEXES:
+            keys = [tuple(key) for key in spec["keys"]]
+            db[name].create_index(keys, name=spec["name"], **spec["options"])
+        status_names(db, True)
+    return db[name]
+
+
+def merge_sorted(cursors, sort_dir):
+    """merge cursors sorted on created_at into one stream in that order"""
+    if len(cursors) == 1:
+        return cursors[0]
+    if not cursors:
+        return iter(())
+    return heapq.merge(
+        *cursors, key=lambda s: s["created_at"], reverse=sort_dir == DESCENDING
+    )
+
+
+def concat(cursors):
+    return chain.from_iterable(cursors)
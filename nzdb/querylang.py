@@ -0,0 +1,194 @@
+"""
+querylang -- the nooze query language, parsed once into cached queries
+
+    -d 2 *France macron "tax cut" -zemmour author:lemonde lang:fr
+
+The window is -d days or -H hours back from now, since:3d (units h, d,
+w), or -s start and -e end dates. *topic searches for the query stored
+for topic, "..." for a phrase; -word excludes statuses containing word;
+author: and lang: restrict a search to authors and languages and can be
+repeated. Each *topic is a search of its own, the remaining words are
+searched together; the results of a query are those of its searches.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from nzdb.tdeltas import parse_date
+
+CACHE_SIZE = 1024
+# hours in a unit of since:
+UNITS = {"h": 1, "d": 24, "w": 168}
+OPTIONS = ("-d", "-H", "-s", "-e", "-x")
+LISTS = ("topics", "words", "phrases", "negated", "authors", "langs")
+
+_token = re.compile(r'-?"[^"]*"|\S+')
+_since = re.compile(r"^(\d+)([hdw])$")
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Query:
+    """
+    A parsed query; relative windows are resolved when the query is run,
+    so a Query can be cached and reused
+    """
+
+    topics: tuple = ()
+    words: tuple = ()
+    phrases: tuple = ()
+    negated: tuple = ()
+    authors: tuple = ()
+    langs: tuple = ()
+    span: timedelta = None
+    start: object = None
+    end: object = None
+    expand: int = None
+
+    def window(self, now=None):
+        """
+        :param now: datetime the window of a relative query ends at
+        :return: start and end datetimes of the query
+        """
+        now = now or datetime.now(timezone.utc)
+        if self.span is not None:
+            return now - self.span, self.end or now
+        return self.start or now, self.end or now
+
+    def text(self, together=False):
+        """
+        $text search for the words, phrases and exclusions, None if there
+        are no words or phrases
+        :param bool together: search for the words as one phrase
+        """
+        words = list(self.words)
+        phrases = list(self.phrases)
+        if together and words:
+            phrases.insert(0, " ".join(words))
+            words = []
+        if not (words or phrases):
+            return None
+        return " ".join(words + [f'"{p}"' for p in phrases] + self.exclusions())
+
+    def exclusions(self):
+        """$text terms excluding the negated words and phrases"""
+        return [f'-"{w}"' if " " in w else f"-{w}" for w in self.negated]
+
+    def filters(self):
+        """mongo conditions on author and language"""
+        conds = {}
+        for field, values in (("author", self.authors), ("language_code", self.langs)):
+            if len(values) == 1:
+                conds[field] = values[0]
+            elif values:
+                conds[field] = {"$in": list(values)}
+        return conds
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    """a query with its topics expanded into the searches it runs"""
+
+    query: Query
+    # $text searches, None for a search on the window only
+    searches: tuple
+
+    def searchons(self, now=None):
+        """
+        :param now: datetime the window of a relative query ends at
+        :return: mongo queries of the searches
+        :rtype: list
+        """
+        start, end = self.query.window(now)
+        base = {"created_at": {"$gte": start, "$lt": end}} | self.query.filters()
+        return [
+            base | {"$text": {"$search": search, "$diacriticSensitive": False}}
+            if search
+            else base
+            for search in self.searches
+        ]
+
+
+def compile_query(query, topic_query, together=False):
+    """
+    :param Query query: parsed query
+    :param topic_query: function of a topic to its stored query
+    :param bool together: search for the words as one phrase
+    :rtype: QueryPlan
+    """
+    exclusions = query.exclusions()
+    searches = [" ".join([topic_query(t)] + exclusions) for t in query.topics]
+    text = query.text(together)
+    if text is not None or not searches:
+        searches.append(text)
+    return QueryPlan(query, tuple(searches))
+
+
+def _date(text):
+    try:
+        return parse_date(text).datetime
+    except Exception:
+        raise QuerySyntaxError(f"bad date {text}")
+
+
+def _number(option, text):
+    if not text.isdigit():
+        raise QuerySyntaxError(f"{option} needs a number, got {text}")
+    return int(text)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse(text):
+    """
+    :param str text: query
+    :rtype: Query
+    :raises: QuerySyntaxError
+    """
+    tokens = _token.findall(text)
+    fields = {name: [] for name in LISTS}
+    span = start = end = expand = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if token in OPTIONS:
+            if i == len(tokens):
+                raise QuerySyntaxError(f"{token} needs a value")
+            value = tokens[i]
+            i += 1
+            if token == "-d":
+                span = timedelta(days=_number(token, value))
+            elif token == "-H":
+                span = timedelta(hours=_number(token, value))
+            elif token == "-s":
+                start = _date(value)
+            elif token == "-e":
+                end = _date(value)
+            else:
+                expand = _number(token, value)
+        elif token.startswith("since:"):
+            match = _since.match(token[6:])
+            if match is None:
+                raise QuerySyntaxError(f"bad window {token}, use e.g. since:3d")
+            span = timedelta(hours=int(match[1]) * UNITS[match[2]])
+        elif token.startswith("author:") and len(token) > 7:
+            fields["authors"].append(token[7:])
+        elif token.startswith("lang:") and len(token) > 5:
+            fields["langs"].append(token[5:])
+        elif token.startswith("*") and len(token) > 1:
+            fields["topics"].append(token[1:])
+        elif token.startswith('"'):
+            fields["phrases"].append(token.strip('"'))
+        elif token.startswith("-") and len(token) > 1:
+            fields["negated"].append(token[1:].strip('"'))
+        else:
+            fields["words"].append(token)
+    if span is not None and start is not None:
+        raise QuerySyntaxError("give either a start date or a window back from now")
+    fields = {k: tuple(v) for k, v in fields.items()}
+    return Query(**fields, span=span, start=start, end=end, expand=expand)
@@ -0,0 +1,74 @@
+"""
+replay -- serve recorded statuses as if they were arriving from twitter
+"""
+
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+# created_at as delivered in twitter's v1.1 json
+TWITTER_DATE = "%a %b %d %H:%M:%S %z %Y"
+
+
+def parse_created_at(text):
+    try:
+        return datetime.strptime(text, TWITTER_DATE)
+    except ValueError:
+        return datetime.fromisoformat(text.replace("Z", "+00:00"))
+
+
+def to_status(doc):
+    """
+    Build an object shaped like a tweepy status from a stored status doc
+    :param dict doc: status as stored by readfeed or as recorded from twitter
+    :return: status with id, author.screen_name, created_at, source, text
+    """
+    author = doc.get("author") or doc.get("user", {}).get("screen_name")
+    if isinstance(author, dict):
+        author = author["screen_name"]
+    created_at = doc["created_at"]
+    if isinstance(created_at, dict):
+        # mongoexport extended json
+        created_at = created_at["$date"]
+    if isinstance(created_at, str):
+        created_at = parse_created_at(created_at)
+    if isinstance(created_at, (int, float)):
+        created_at = datetime.fromtimestamp(created_at / 1000, timezone.utc)
+    if created_at.tzinfo is not None:
+        # twitter statuses carry naive utc datetimes
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return SimpleNamespace(
+        id=doc["id"],
+        author=SimpleNamespace(screen_name=author),
+        created_at=created_at,
+        source=doc.get("source", ""),
+        text=doc.get("text") or doc.get("full_text", ""),
+    )
+
+
+class ReplaySource:
+    """statuses recorded in a jsonl file, released by their created_at"""
+
+    def __init__(self, statuses):
+        self.statuses = sorted(statuses, key=lambda status: status.created_at)
+
+    @classmethod
+    def from_jsonl(cls, path):
+        with open(path) as f:
+            return cls([to_status(json.loads(line)) for line in f if line.strip()])
+
+    def poll(self, since_id, now):
+        """
+        :param since_id: newest id already read, None to read everything
+        :param float now: epoch secs of the simulated poll
+        :return: statuses newer than since_id created by now, newest first
+        """
+        cutoff = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        new = [
+            status
+            for status in self.statuses
+            if status.created_at <= cutoff
+            and (since_id is None or status.id > since_id)
+        ]
+        return new[::-1]
@@ -0,0 +1,141 @@
+"""
+scheduler -- adapt the polling interval of a feed to its arrival rate
+"""
+
+import random
+from math import ceil
+from time import time
+
+from nzdb import metrics
+
+# statuses per list_timeline page
+PAGE_SIZE = 200
+
+
+class AdaptiveScheduler:
+    """
+    Choose the time to the next poll of a feed so that a poll fills
+    about target_fill of a page: arrivals are estimated by an exponentially
+    weighted moving average of statuses per second, and the interval is
+    clamped to [min_interval, max_interval], stretched to stay within the
+    remaining rate-limit budget, and jittered so feeds don't poll in step
+    """
+
+    def __init__(
+        self,
+        name="feed",
+        min_interval=60,
+        max_interval=1800,
+        target_fill=0.5,
+        page_size=PAGE_SIZE,
+        jitter=0.1,
+        smoothing=0.3,
+        rng=None,
+    ):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_fill = target_fill
+        self.page_size = page_size
+        self.jitter = jitter
+        self.smoothing = smoothing
+        self.rng = random.Random() if rng is None else rng
+        # statuses per second, None until the first observation
+        self.rate = None
+        self.interval = max_interval
+
+    def observe(self, n_new, elapsed):
+        """fold in n_new statuses that arrived over elapsed seconds"""
+        if elapsed <= 0:
+            return self.rate
+        rate = n_new / elapsed
+        if self.rate is None:
+            self.rate = rate
+        else:
+            self.rate = self.smoothing * rate + (1 - self.smoothing) * self.rate
+        return self.rate
+
+    def _budget_floor(self, interval, rate_remaining, rate_reset):
+        """shortest interval that doesn't exhaust the rate-limit window"""
+        if rate_remaining is None or rate_reset is None or rate_reset <= 0:
+            return 0
+        expected = (self.rate or 0) * interval
+        pages_per_poll = max(1, ceil(expected / self.page_size))
+        polls_left = rate_remaining // pages_per_poll
+        if polls_left < 1:
+            return rate_reset
+        return rate_reset / polls_left
+
+    def next_interval(self, n_new, elapsed, rate_remaining=None, rate_reset=None):
+        """
+        :param int n_new: statuses read by the last poll
+        :param float elapsed: seconds covered by the last poll
+        :param rate_remaining: requests left in the rate-limit window
+        :param rate_reset: seconds until the rate-limit window resets
+        :return: seconds to wait before the next poll
+        :rtype: float
+        """
+        self.observe(n_new, elapsed)
+        target = self.target_fill * self.page_size
+        if not self.rate:
+            interval = self.max_interval
+        else:
+            interval = target / self.rate
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        floor = self._budget_floor(interval, rate_remaining, rate_reset)
+        interval = max(interval, floor)
+        self.interval = interval
+        jittered = interval * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+        metrics.set_gauge("nzdb_feed_interval_seconds", jittered, feed=self.name)
+        metrics.set_gauge("nzdb_feed_arrival_rate", self.rate or 0, feed=self.name)
+        fill = n_new / self.page_size
+        metrics.set_gauge("nzdb_feed_page_fill", fill, feed=self.name)
+        if rate_remaining is not None:
+            metrics.set_gauge(
+                "nzdb_feed_rate_remaining", rate_remaining, feed=self.name
+            )
+        metrics.incr("nzdb_feed_polls_total", feed=self.name)
+        metrics.incr("nzdb_feed_statuses_total", n_new, feed=self.name)
+        return jittered
+
+
+def rate_budget(api):
+    """
+    :param api: tweepy api after a request
+    :return: requests remaining and seconds to reset, or None, None
+    :rtype: tuple
+    """
+    resp = getattr(api, "last_response", None)
+    if resp is None:
+        return None, None
+    try:
+        remaining = int(resp.headers["x-rate-limit-remaining"])
+        reset = int(resp.headers["x-rate-limit-reset"]) - time()
+    except (KeyError, ValueError):
+        return None, None
+    return remaining, max(reset, 0)
+
+
+def simulate(scheduler, source, start, end):
+    """
+    Run scheduler against a replay source between start and end
+    :param scheduler: AdaptiveScheduler
+    :param source: ReplaySource
+    :param float start: simulated start time (epoch secs)
+    :param float end: simulated end time (epoch secs)
+    :return: list of (poll time, statuses read, next interval)
+    """
+    decisions = []
+    now = start
+    last = start
+    since_id = None
+    while now < end:
+        statuses = source.poll(since_id, now)
+        if statuses:
+            since_id = max(status.id for status in statuses)
+        interval = scheduler.next_interval(len(statuses), now - last)
+        decisions.append((now, len(statuses), interval))
+        last = now
+        now += interval
+    return decisions
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""move closed months of statuses out of mongo into parquet files"""
+
+from datetime import datetime
+
+import click
+from pymongo import ASCENDING
+
+from nzdb import archive
+from nzdb.configurator import nzdbConfig
+from nzdb.connectdb import get_db
+from nzdb.partitions import (
+    LEGACY,
+    merge_sorted,
+    months,
+    partition_name,
+    status_names,
+)
+
+# statuses deleted from mongo at a time
+BATCH = 5000
+
+
+def first_month(db):
+    """first day of the month of the oldest status in mongo, or None"""
+    oldest = []
+    for name in status_names(db):
+        first = db[name].find_one(sort=[("created_at", ASCENDING)])
+        if first is not None:
+            oldest.append(first["created_at"])
+    if not oldest:
+        return None
+    return min(oldest).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def tracked(cursor, ids):
+    """statuses of cursor without their _id, which is added to ids"""
+    for status in cursor:
+        ids.append(status.pop("_id"))
+        yield status
+
+
+def delete_written(statuses, ids):
+    """
+    Delete the statuses written to the archive, a batch of _ids at a time;
+    statuses stored in the month meanwhile are left for the next run
+    """
+    for start in range(0, len(ids), BATCH):
+        statuses.delete_many({"_id": {"$in": ids[start : start + BATCH]}})
+    if statuses.name != LEGACY and statuses.estimated_document_count() == 0:
+        statuses.drop()
+
+
+@click.command()
+@click.option(
+    "-k", "--keep", default=6, type=click.IntRange(min=1), help="months kept in mongo"
+)
+def main(keep):
+    archivedir = nzdbConfig["archivedir"]
+    if not archivedir:
+        raise click.UsageError("set dir in the [archive] section of the conf")
+    db = get_db()
+    now = datetime.utcnow()
+    # first day of the oldest month kept, counting the current month
+    year, month0 = divmod(now.year * 12 + now.month - 1 - (keep - 1), 12)
+    cutoff = datetime(year, month0 + 1, 1)
+    start = first_month(db)
+    if start is None or start >= cutoff:
+        print("nothing to archive")
+        return
+    for month in months(start, cutoff):
+        window = archive.month_window(month)
+        names = [n for n in status_names(db) if n in (LEGACY, partition_name(month))]
+        if not any(db[name].find_one(window) for name in names):
+            continue
+        written = {name: [] for name in names}
+        cursors = [
+            tracked(db[name].find(window).sort("created_at", ASCENDING), ids)
+            for name, ids in written.items()
+        ]
+        n = archive.write_month(
+            archivedir, db.name, month, merge_sorted(cursors, ASCENDING)
+        )
+        # the month is in the file before it leaves mongo; a crash in
+        # between leaves it in both, and a rerun keeps the archived copy
+        for name, ids in written.items():
+            delete_written(db[name], ids)
+        status_names(db, True)
+        print(f"{partition_name(month)}: archived {n}")
+
+
+if __name__ == "__main__":
+
+    # pylint: disable=no-value-for-parameter
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""
+import archived status dumps (jsonl or bson) in parallel
+
+Each worker reads and decodes its own part of the dumps: a byte range of
+an uncompressed file, split between docs, or a whole gzipped file, which
+can't be split. The parent only hands out the ranges.
+"""
+
+import gzip
+import os
+import struct
+from itertools import islice
+from multiprocessing import Pool
+from time import perf_counter
+
+import bson
+import click
+from bson import json_util
+from pymongo import ASCENDING
+
+from nzdb.connectdb import get_db, use_db
+from nzdb.dbif import storeStatuses
+from nzdb import partitions
+from nzdb.partitions import LEGACY, index_spec
+from nzdb.replay import to_status
+from nzdb.scripts.readfeed import pruneStatus
+
+# meta document holding the specs of indexes dropped for the import,
+# keyed by collection, so that an interrupted run can still rebuild them
+DEFERRED = "deferred_indexes"
+# bytes of an uncompressed dump read by one task
+CHUNK = 32 * 1024 * 1024
+
+_authors = {}
+_dbname = None
+_batch = 1000
+
+
+def read_archive(path):
+    """
+    :param path: .jsonl or .bson file, optionally gzipped
+    :return: generator of status docs
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    name = path.removesuffix(".gz")
+    with opener(path, "rb") as f:
+        if name.endswith(".bson"):
+            yield from bson.decode_file_iter(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+
+
+def ranges(path, size=CHUNK):
+    """
+    :return: (start, end) byte ranges of path of about size bytes, split
+        between docs; one range, end None, for a gzipped file
+    """
+    if path.endswith(".gz"):
+        return [(0, None)]
+    total = os.path.getsize(path)
+    if path.endswith(".bson"):
+        # hop from doc to doc on their length prefixes, decoding nothing
+        bounds = [0]
+        with open(path, "rb") as f:
+            pos = 0
+            while pos < total:
+                f.seek(pos)
+                (length,) = struct.unpack("<i", f.read(4))
+                pos += length
+                if pos - bounds[-1] >= size:
+                    bounds.append(pos)
+        if bounds[-1] != total:
+            bounds.append(total)
+    else:
+        # lines are assigned to the range they start in, see read_range
+        bounds = list(range(0, total, size)) + [total]
+    return list(zip(bounds, bounds[1:]))
+
+
+def read_range(path, start, end):
+    """
+    :return: generator of the status docs of path starting in
+        [start, end), of all of them if end is None
+    """
+    if end is None:
+        yield from read_archive(path)
+    elif path.endswith(".bson"):
+        with open(path, "rb") as f:
+            f.seek(start)
+            yield from bson.decode_iter(f.read(end - start))
+    else:
+        with open(path, "rb") as f:
+            if start:
+                # skip the rest of the line the previous range ends in
+                f.seek(start - 1)
+                f.readline()
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    yield json_util.loads(line)
+
+
+def batched(docs, size):
+    docs = iter(docs)
+    while batch := list(islice(docs, size)):
+        yield batch
+
+
+def _init_worker(dbname, authors, batch):
+    global _authors, _dbname, _batch
+    _authors = authors
+    _dbname = dbname
+    _batch = batch
+
+
+def prepare(doc):
+    """prune doc as readfeed.pruneStatus and tag its author's language"""
+    status = pruneStatus(to_status(doc))
+    status["language_code"] = _authors.get(status["author"], "U")
+    return status
+
+
+def import_batch(docs):
+    """
+    :param docs: raw archived docs
+    :return: number read, added, skipped as duplicates
+    """
+    statuses = [prepare(doc) for doc in docs]
+    with use_db(_dbname):
+        added, skipped = storeStatuses(statuses)
+    return len(docs), added, skipped
+
+
+def import_range(task):
+    """
+    :param task: path, start and end of a range, see ranges
+    :return: number read, added, skipped as duplicates
+    """
+    path, start, end = task
+    nread = nadded = nskipped = 0
+    for docs in batched(read_range(path, start, end), _batch):
+        n, added, skipped = import_batch(docs)
+        nread += n
+        nadded += added
+        nskipped += skipped
+    return nread, nadded, nskipped
+
+
+def drop_secondary_indexes(db):
+    """
+    drop the non-unique indexes of every status collection, recording
+    their specs
+    :return: specs keyed by collection name
+    """
+    saved = db.meta.find_one({"_id": DEFERRED})
+    if saved is None:
+        specs = {
+            statuses.name: [
+                index_spec(name, info)
+                for name, info in statuses.index_information().items()
+                if name != "_id_" and not info.get("unique")
+            ]
+            for statuses in partitions.collections(db) or [db[LEGACY]]
+        }
+        db.meta.insert_one({"_id": DEFERRED, "indexes": specs})
+    else:
+        # a previous import didn't finish; its specs are the complete set
+        specs = saved["indexes"]
+    for name, collection_specs in specs.items():
+        info = db[name].index_information()
+        for spec in collection_specs:
+            if spec["name"] in info:
+                db[name].drop_index(spec["name"])
+    return specs
+
+
+def rebuild_indexes(db, specs):
+    """
+    :param specs: index specs keyed by collection name; partitions made
+        during the import, which copied the stripped legacy indexes, get
+        those of the legacy collection
+    """
+    default = specs.get(LEGACY) or partitions.DEFAULT_INDEXES
+    for statuses in partitions.collections(db) or [db[LEGACY]]:
+        for spec in specs.get(statuses.name, default):
+            t0 = perf_counter()
+            keys = [tuple(key) for key in spec["keys"]]
+            statuses.create_index(keys, name=spec["name"], **spec["options"])
+            elapsed = perf_counter() - t0
+            print(f"built index {spec['name']} of {statuses.name} in {elapsed:.1f}s")
+    db.meta.delete_one({"_id": DEFERRED})
+
+
+@click.command()
+@click.argument("paths", nargs=-1, required=True)
+@click.option("-w", "--workers", default=4, help="number of import processes")
+@click.option("-b", "--batch", default=1000, help="statuses per bulk insert")
+@click.option("--defer-indexes/--keep-indexes", default=False, help="build at end")
+@click.option("--every", default=100000, help="report progress every n statuses")
+def main(paths, workers, batch, defer_indexes, every):
+    db = get_db()
+    # duplicates are detected by the unique index on id, so it stays
+    db.statuses.create_index([("id", ASCENDING)], unique=True)
+    if defer_indexes:
+        specs = drop_secondary_indexes(db)
+    else:
+        # indexes left unbuilt by an interrupted import are rebuilt anyway
+        saved = db.meta.find_one({"_id": DEFERRED})
+        specs = saved["indexes"] if saved else {}
+    authors = {a["author"]: a["language_code"] for a in db.authors.find()}
+
+    nread = nadded = nskipped = 0
+    reported = 0
+    t0 = perf_counter()
+    tasks = [(path, start, end) for path in paths for start, end in ranges(path)]
+    with Pool(workers, _init_worker, (db.name, authors, batch)) as pool:
+        for n, added, skipped in pool.imap_unordered(import_range, tasks):
+            nread += n
+            nadded += added
+            nskipped += skipped
+            if nread - reported >= every:
+                reported = nread
+                rate = nread / (perf_counter() - t0)
+                print(f"read {nread} added {nadded} ({rate:.0f}/s)")
+    elapsed = perf_counter() - t0
+    print(
+        f"read {nread} added {nadded} skipped {nskipped} in {elapsed:.1f}s",
+        f"({nread / max(elapsed, 1e-9):.0f}/s)",
+    )
+    if specs:
+        rebuild_indexes(get_db(), specs)
+
+
+if __name__ == "__main__":
+
+    # pylint: disable=no-value-for-parameter
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""read several twitter lists in one process over a shared db client"""
+
+import heapq
+from dataclasses import dataclass, field
+from time import sleep, time
+
+import click
+from nzdb.configurator import nzdbConfig, parse_config
+from nzdb.connectdb import use_db
+from nzdb.dbif import ensure_indexes
+from nzdb.metrics import write_textfile
+from nzdb.nzauth import getTwitterApi
+from nzdb.scheduler import AdaptiveScheduler, rate_budget
+from nzdb.scripts import readfeed
+
+
+@dataclass(order=True)
+class Feed:
+    """a list to read, the db it is stored in, and when it is next due"""
+
+    due: float
+    name: str
+    list_id: str = field(compare=False)
+    dbname: str = field(compare=False)
+    host: str = field(compare=False)
+    conf: dict = field(compare=False, repr=False)
+    scheduler: AdaptiveScheduler = field(default=None, compare=False, repr=False)
+    # time of the last read, None until the backlog has been drained
+    last: float = field(default=None, compare=False)
+
+
+def feeds_from_confs(confs):
+    """one feed per conf file, each with its own list, db and tokens"""
+    feeds = []
+    for path in confs:
+        conf = parse_config(path)
+        feeds.append(
+            Feed(0, path, conf["list_id"], conf["DBNAME"], conf["DBHOST"], conf)
+        )
+    return feeds
+
+
+def feeds_from_lists(lists):
+    """
+    feeds given as LIST_ID or LIST_ID:DBNAME, read with the NZDBCONF tokens
+    and stored in its db unless another is named
+    """
+    feeds = []
+    for spec in lists:
+        list_id, _, dbname = spec.partition(":")
+        dbname = dbname or nzdbConfig["DBNAME"]
+        feeds.append(
+            Feed(0, spec, list_id, dbname, nzdbConfig["DBHOST"], nzdbConfig)
+        )
+    return feeds
+
+
+def read_feed(feed, apis, quiet):
+    """read one feed into its own db, keeping its own watermark"""
+    tokens = (feed.conf["OAUTH_TOKEN"], feed.conf["CONSUMER_KEY"])
+    if tokens not in apis:
+        apis[tokens] = getTwitterApi(wait=True, notify=True, conf=feed.conf)
+    # only the list of the conf may have been read by readfeed before
+    inherit = feed.list_id == feed.conf["list_id"]
+    with use_db(feed.dbname, feed.host):
+        return readfeed.read_list(
+            apis[tokens], feed.list_id, quiet, feed.list_id, inherit
+        )
+
+
+def next_due(feed, nread, api, sleeptime):
+    """time of the next read of feed, adapted to its arrivals if scheduled"""
+    now = time()
+    if feed.scheduler is not None:
+        elapsed = 0 if feed.last is None else now - feed.last
+        remaining, reset = rate_budget(api)
+        sleeptime = feed.scheduler.next_interval(nread, elapsed, remaining, reset)
+    feed.last = now
+    return now + sleeptime
+
+
+@click.command()
+@click.option("-c", "--conf", multiple=True, help="conf file of a feed")
+@click.option("-l", "--list", "lists", multiple=True, help="LIST_ID[:DBNAME]")
+@click.option("--quiet/--verbose", default=True, help="default quiet")
+@click.option("-d", "--daemon/--no-daemon", default=False, help="run as daemon")
+@click.option("--sleeptime", default=900, help="sleep time per feed in secs")
+@click.option("--adaptive/--fixed", default=False, help="adapt sleep to arrivals")
+@click.option("--min-sleep", default=60, help="shortest adaptive sleep in secs")
+@click.option("--max-sleep", default=1800, help="longest adaptive sleep in secs")
+@click.option("--metrics-file", default=None, help="prometheus textfile to write")
+def main(
+    conf, lists, quiet, daemon, sleeptime, adaptive, min_sleep, max_sleep, metrics_file
+):
+    from tweepy import TweepError
+
+    readfeed.setup_logging()
+    feeds = feeds_from_confs(conf) + feeds_from_lists(lists)
+    if not feeds:
+        raise click.UsageError("specify at least one --conf or --list")
+    for feed in feeds:
+        with use_db(feed.dbname, feed.host):
+            ensure_indexes()
+    if adaptive:
+        for feed in feeds:
+            feed.scheduler = AdaptiveScheduler(feed.name, min_sleep, max_sleep)
+    # api handles are shared by feeds authenticating with the same tokens
+    apis = {}
+    heapq.heapify(feeds)
+    while feeds:
+        feed = heapq.heappop(feeds)
+        wait = feed.due - time()
+        if wait > 0:
+            sleep(wait)
+        msg = ""
+        nread = 0
+        try:
+            nread, msg = read_feed(feed, apis, quiet)
+        except TweepError as e:
+            print(feed.name, e)
+        if not quiet:
+            print(feed.name, msg)
+        if daemon:
+            api = apis.get((feed.conf["OAUTH_TOKEN"], feed.conf["CONSUMER_KEY"]))
+            feed.due = next_due(feed, nread, api, sleeptime)
+            heapq.heappush(feeds, feed)
+            if metrics_file:
+                write_textfile(metrics_file)
+
+
+if __name__ == "__main__":
+
+    # pylint: disable=no-value-for-parameter
+    main()
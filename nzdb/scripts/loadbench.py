@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+mixed load on running servers: clients polling /json/recent while others
+run long searches, reporting throughput and latency percentiles per route
+"""
+
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from statistics import quantiles
+from time import monotonic, perf_counter
+
+import click
+import requests
+
+
+def percentiles(latencies):
+    """:return: p50 and p99 of latencies"""
+    if len(latencies) < 2:
+        latency = latencies[0] if latencies else 0.0
+        return latency, latency
+    cuts = quantiles(latencies, n=100)
+    return cuts[49], cuts[98]
+
+
+def search_requests(words, days):
+    """requests made in turn by the searching clients"""
+    start = (date.today() - timedelta(days=days)).isoformat()
+    subqueries = [[word] for word in words]
+    xgraph = {
+        "subqueries": subqueries,
+        "start": start,
+        "title": "loadbench",
+        "interval": "1d",
+        "n": days,
+    }
+    qry = {"data": f"-d {days} " + " ".join(words)}
+    return [
+        ("/json/xgraph", "post", {"json": xgraph}),
+        ("/json/qry", "get", {"params": qry}),
+    ]
+
+
+def client(url, calls, until, results, lock):
+    session = requests.Session()
+    i = 0
+    while monotonic() < until:
+        route, method, kwargs = calls[i % len(calls)]
+        i += 1
+        t0 = perf_counter()
+        try:
+            resp = getattr(session, method)(url + route, timeout=60, **kwargs)
+            ok = resp.status_code == 200
+        except requests.RequestException:
+            ok = False
+        latency = perf_counter() - t0
+        with lock:
+            results[route].append((latency, ok))
+
+
+def run(url, pollers, searchers, duration, words, days):
+    """:return: (latency, ok) of every request, by route"""
+    results = defaultdict(list)
+    lock = threading.Lock()
+    until = monotonic() + duration
+    polls = [("/json/recent", "get", {"params": {"limit": 100}})]
+    searches = search_requests(words, days)
+    with ThreadPoolExecutor(max_workers=pollers + searchers) as pool:
+        for _ in range(pollers):
+            pool.submit(client, url, polls, until, results, lock)
+        for _ in range(searchers):
+            pool.submit(client, url, searches, until, results, lock)
+    return results
+
+
+def report(url, results, duration):
+    click.echo(f"\n{url}")
+    click.echo(
+        f"{'route':<18}{'requests':>9}{'req/s':>8}{'errors':>8}"
+        f"{'p50 ms':>9}{'p99 ms':>9}"
+    )
+    for route, done in sorted(results.items()):
+        latencies = [latency for latency, _ in done]
+        errors = sum(1 for _, ok in done if not ok)
+        p50, p99 = percentiles(latencies)
+        click.echo(
+            f"{route:<18}{len(done):>9}{len(done) / duration:>8.1f}{errors:>8}"
+            f"{p50 * 1000:>9.0f}{p99 * 1000:>9.0f}"
+        )
+
+
+@click.command()
+@click.option(
+    "-u",
+    "--url",
+    multiple=True,
+    default=["http://localhost:3031"],
+    help="server to load, repeat to compare servers",
+)
+@click.option("-p", "--pollers", default=16, help="clients polling /json/recent")
+@click.option("-s", "--searchers", default=4, help="clients running long searches")
+@click.option("-t", "--duration", default=30, help="secs of load per server")
+@click.option("-w", "--words", default="Macron,Biden", help="comma separated words")
+@click.option("-d", "--days", default=30, help="days searched")
+def main(url, pollers, searchers, duration, words, days):
+    """e.g. loadbench -u http://localhost:3031 -u http://localhost:3032"""
+    words = words.split(",")
+    for server in url:
+        results = run(server, pollers, searchers, duration, words, days)
+        report(server, results, duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""move statuses from the statuses collection into monthly partitions"""
+
+from datetime import datetime, timezone
+
+import click
+from pymongo import ASCENDING, DESCENDING
+
+from nzdb.configurator import nzdbConfig
+from nzdb.connectdb import get_db
+from nzdb.partitions import LEGACY, months, next_month, partition_for
+
+# statuses copied, then deleted, at a time
+BATCH = 5000
+
+
+def move(legacy, partition, window):
+    """
+    Copy, then delete, a batch of statuses at a time. Only the _ids just
+    copied are deleted, so a status written to the window meanwhile is
+    left for a rerun rather than lost; a batch is read from both
+    collections until its delete, and a rerun after a crash copies
+    nothing twice.
+    :return: number of statuses moved
+    """
+    moved = 0
+    while True:
+        batch = legacy.find(window, projection={"_id": True})
+        ids = [status["_id"] for status in batch.sort("_id", ASCENDING).limit(BATCH)]
+        if not ids:
+            return moved
+        legacy.aggregate(
+            [
+                {"$match": {"_id": {"$in": ids}}},
+                {
+                    "$merge": {
+                        "into": partition.name,
+                        "on": "_id",
+                        "whenMatched": "keepExisting",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ]
+        )
+        moved += legacy.delete_many({"_id": {"$in": ids}}).deleted_count
+
+
+@click.command()
+@click.option(
+    "--before",
+    default=None,
+    help="move only months before yyyy-mm, default the current month",
+)
+def main(before):
+    if nzdbConfig["partition"] != "monthly":
+        # searches would not read the partitions
+        raise click.UsageError("set PARTITION = monthly in the [db] section")
+    if before is None:
+        # the current month is still written to; created_at is utc
+        now = datetime.now(timezone.utc)
+        end = datetime(now.year, now.month, 1)
+    else:
+        end = datetime.strptime(before, "%Y-%m")
+    db = get_db()
+    legacy = db[LEGACY]
+    first = legacy.find_one(sort=[("created_at", ASCENDING)])
+    last = legacy.find_one(sort=[("created_at", DESCENDING)])
+    if first is None:
+        print("nothing to move")
+        return
+    end = min(end, next_month(last["created_at"].replace(day=1)))
+    for month in months(first["created_at"], end):
+        window = {"created_at": {"$gte": month, "$lt": next_month(month)}}
+        partition = partition_for(db, month)
+        moved = move(legacy, partition, window)
+        print(f"{partition.name}: moved {moved}")
+
+
+if __name__ == "__main__":
+
+    # pylint: disable=no-value-for-parameter
+    main()
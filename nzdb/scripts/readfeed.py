@@ -4,27 +4,29 @@
 
 import logging
 from logging import FileHandler
-from time import sleep
+from time import sleep, time
 
 import click
 from nzdb.configurator import nzdbConfig
 from nzdb.dbif import (
     AuthorNotFound,
-    DuplicateStatus,
+    ensure_indexes,
     get_lastread,
+    getCheckpoint,
     mapAuthorToLang,
     store_lastread,
-    storeStatus,
+    storeCheckpoint,
+    storeStatuses,
 )
+from nzdb.metrics import write_textfile
 from nzdb.nzauth import getTwitterApi
 from nzdb.prettytext import printStatus
-from tweepy import Cursor, TweepError
+from nzdb.scheduler import PAGE_SIZE, AdaptiveScheduler, rate_budget
 
-LOGFILENAME = nzdbConfig["logfile"]
-LOGNAME = nzdbConfig["logname"]
 # OWNER = nzdbConfig['owner']
 # SLUG = nzdbConfig['slug']
-LIST_ID = nzdbConfig["list_id"]
+# statuses committed at a time as the timeline is read
+BATCH_SIZE = 100
 logger = None
 
 processed = 0
@@ -51,84 +53,185 @@ def processStatus(i, status, quiet):
     """Process a Twitter status record
     :param i: sequence number
     :param status: the status record
-    :returns nothing
-     .. prints notification of duplicate record and does not insert
+    :returns pruned status tagged with its author's language
     """
-    global processed, added, skipped, maxid
+    global processed
     processed += 1
-    status_id = status.id
-    if status_id > maxid:
-        maxid = status_id
-    created_at = status.created_at
+    status = pruneStatus(status)
+    author = status["author"]
     try:
-        status = pruneStatus(status)
-        author = status["author"]
-        try:
-            language_code = mapAuthorToLang(author)
-            status["language_code"] = language_code
-        except AuthorNotFound:
-            # missing authors are logged but recorded as Unknown
-            status["language_code"] = "U"
-            logger.info(f"Author not found {author}")
-        storeStatus(status)
-        # If, successful, display the entry being processed ...
-        if not quiet:
-            out = "\n---\n{}. author {} id {}  time {} via {}"
-            print(out.format(i + 1, author, status_id, created_at, status["source"]))
-            printStatus(status)
-        added += 1
-    # if status is already in db, we get here
-    except DuplicateStatus:
-        skipped += 1
+        language_code = mapAuthorToLang(author)
+        status["language_code"] = language_code
+    except AuthorNotFound:
+        # missing authors are logged but recorded as Unknown
+        status["language_code"] = "U"
+        logger.info(f"Author not found {author}")
+    if not quiet:
+        out = "\n---\n{}. author {} id {}  time {} via {}"
+        print(
+            out.format(
+                i + 1, author, status["id"], status["created_at"], status["source"]
+            )
+        )
+        printStatus(status)
+    return status
+
+
+def commitStatuses(statuses, quiet):
+    """Store a batch of statuses oldest first
+    :param statuses: status records as read from twitter
+    :param quiet: suppress display of statuses
+    :returns highest id of the batch, 0 if empty
+    """
+    global added, skipped
+    statuses = sorted(statuses, key=lambda status: status.id)
+    batch = [
+        processStatus(i, status, quiet)
+        for i, status in enumerate(statuses, processed)
+    ]
+    n_added, n_skipped = storeStatuses(batch)
+    added += n_added
+    skipped += n_skipped
+    return batch[-1]["id"] if batch else 0
+
+
+def checkpoint_job(feed):
+    """checkpoint of the read of a feed, resumed if it broke off"""
+    return "readfeed" if feed is None else f"readfeed-{feed}"
+
+
+def storeTimeline(statuses, quiet, feed, since=0, top=0):
+    """Store a timeline a batch at a time as it is read, then advance the
+    watermark. The timeline arrives newest first, so after each batch a
+    checkpoint records the max_id below which the read goes on; a read
+    that breaks off resumes there (see read_list) rather than from the
+    watermark, which only moves once the whole read is stored
+    :param statuses: iterable of status records, newest first
+    :param quiet: suppress display of statuses
+    :param feed: watermark tag
+    :param since: watermark the read goes down to
+    :param top: highest id of a resumed read, 0 for a new one
+    """
+    global maxid
+    job = checkpoint_job(feed)
+    checkpointed = bool(top)
+    batch = []
+
+    def commit():
+        nonlocal top, checkpointed
+        if not batch:
+            return
+        top = max(top, commitStatuses(batch, quiet))
+        lowest = min(status.id for status in batch)
+        storeCheckpoint(job, since=since, top=top, max_id=lowest - 1)
+        checkpointed = True
+        batch.clear()
+
+    try:
+        for status in statuses:
+            batch.append(status)
+            if len(batch) == BATCH_SIZE:
+                commit()
+    finally:
+        commit()
+    if top > maxid:
+        maxid = top
+        store_lastread(maxid, feed)
+    if checkpointed:
+        storeCheckpoint(job, since=None, top=None, max_id=None)
 
 
 def setup_logging():
     # print("Processing usnews feeds for nzdb")
     global logger
-    logger = logging.getLogger(LOGNAME)
+    logger = logging.getLogger(nzdbConfig["logname"])
     logger.setLevel(logging.INFO)
-    fh = FileHandler(LOGFILENAME)
+    fh = FileHandler(nzdbConfig["logfile"])
     fh.setLevel(logging.INFO)
     myformat = logging.Formatter("%(asctime)s-%(name)s:%(levelname)s--%(message)s")
     fh.setFormatter(myformat)
     logger.addHandler(fh)
 
 
+def read_list(api, list_id, quiet, feed=None, inherit=False):
+    """Read one list timeline into the current db and advance its watermark
+    :param api: authenticated twitter api
+    :param list_id: id of the twitter list
+    :param quiet: suppress display of statuses
+    :param feed: watermark tag, None for the untagged readfeed watermark
+    :param inherit: start a new feed from the untagged watermark
+    :returns number of statuses read, summary message
+    """
+    from tweepy import Cursor
+
+    global maxid, processed, added, skipped
+    # this will return 0, 0 on virgin database
+    _, maxid = get_lastread(feed, inherit)
+    processed = added = skipped = 0
+    resume = getCheckpoint(checkpoint_job(feed))
+    if resume.get("max_id"):
+        # the rest of a read that broke off, below what it stored
+        since = resume["since"]
+        timeline = Cursor(
+            api.list_timeline,
+            list_id=list_id,
+            since_id=since or None,
+            max_id=resume["max_id"],
+            count=PAGE_SIZE,
+        )
+        storeTimeline(timeline.items(), quiet, feed, since, resume["top"])
+    # setting sinceid to None does the right thing
+    sinceid = None if maxid == 0 else maxid
+    timeline = Cursor(
+        api.list_timeline, list_id=list_id, since_id=sinceid, count=PAGE_SIZE
+    )
+    storeTimeline(timeline.items(), quiet, feed, maxid)
+    msg = f"processed {processed}. added {added}.\
+        skipped {skipped} maxid {maxid}"
+    logger.info(msg)
+    return processed, msg
+
+
 @click.command()
 @click.option("--quiet/--verbose", default=True, help="default quiet")
 @click.option("-d", "--daemon/--no-daemon", default=False, help="run as daemon")
 @click.option("--sleeptime", default=900, help="sleep time in secs")
-def main(quiet, daemon, sleeptime):
-    global maxid, processed, added, skipped
+@click.option("--adaptive/--fixed", default=False, help="adapt sleep to arrivals")
+@click.option("--min-sleep", default=60, help="shortest adaptive sleep in secs")
+@click.option("--max-sleep", default=1800, help="longest adaptive sleep in secs")
+@click.option("--metrics-file", default=None, help="prometheus textfile to write")
+def main(quiet, daemon, sleeptime, adaptive, min_sleep, max_sleep, metrics_file):
+    from tweepy import TweepError
 
     setup_logging()
+    ensure_indexes()
+    list_id = nzdbConfig["list_id"]
+    scheduler = AdaptiveScheduler(list_id, min_sleep, max_sleep)
 
     msg = ""
+    # the first read drains a backlog of unknown span, so isn't observed
+    last = None
     while True:
+        nread = 0
         try:
             api = getTwitterApi(wait=True, notify=True)
-            # this will return 0, 0 on virgin database
-            _, maxid = get_lastread()
-            processed = added = skipped = 0
-            # setting sinceid to None does the right thing
-            sinceid = None if maxid == 0 else maxid
-            for i, status in enumerate(
-                Cursor(api.list_timeline, list_id=LIST_ID, since_id=sinceid).items()
-            ):
-                processStatus(i, status, quiet)
-
-            store_lastread(maxid)
-            msg = f"processed {processed}. added {added}.\
-        skipped {skipped} maxid {maxid}"
-            logger.info(msg)
+            nread, msg = read_list(api, list_id, quiet)
         except TweepError as e:
             print(e)
         if not quiet:
             print(msg)
         if not daemon:
             break
-        else:
-            sleep(sleeptime)
+        if adaptive:
+            now = time()
+            elapsed = 0 if last is None else now - last
+            remaining, reset = rate_budget(api)
+            sleeptime = scheduler.next_interval(nread, elapsed, remaining, reset)
+            last = now
+            logger.info(f"next poll in {sleeptime:.0f}s, rate {scheduler.rate}")
+            if metrics_file:
+                write_textfile(metrics_file)
+        sleep(sleeptime)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+set the language of statuses stored as unknown ("U") whose authors
+have since been added to the authors table
+"""
+
+from time import perf_counter, sleep
+
+import click
+from nzdb.dbif import (
+    ensure_indexes,
+    getAuthorLangs,
+    getCheckpoint,
+    getRefVersion,
+    getUnknownStatusAuthors,
+    reclassifyStatuses,
+    storeCheckpoint,
+)
+
+JOB = "reclassify"
+
+
+@click.command()
+@click.option(
+    "-b",
+    "--batch",
+    default=1000,
+    type=click.IntRange(min=1),
+    help="statuses per update",
+)
+@click.option(
+    "--duty",
+    default=0.25,
+    type=click.FloatRange(0, 1, min_open=True),
+    help="fraction of time spent updating, 0 < duty <= 1",
+)
+@click.option("--restart/--resume", default=False, help="ignore saved progress")
+def main(batch, duty, restart):
+    # batches are found by author and unknown language, through the
+    # (author, created_at) index rather than a scan of all statuses
+    ensure_indexes()
+    langs = getAuthorLangs()
+    version = getRefVersion("authors")
+    candidates = sorted(
+        author
+        for author in getUnknownStatusAuthors()
+        if langs.get(author, "U") != "U"
+    )
+    checkpoint = getCheckpoint(JOB)
+    if not restart and checkpoint.get("authors_version") == version:
+        # authors up to the checkpoint were finished by an earlier run
+        done = checkpoint.get("author", "")
+        candidates = [author for author in candidates if author > done]
+    print(f"{len(candidates)} newly known authors to reclassify")
+
+    total = 0
+    for author in candidates:
+        nauthor = 0
+        t0 = perf_counter()
+        for n in reclassifyStatuses(author, langs[author], batch):
+            nauthor += n
+            # throttle: sleep long enough that updates take only duty of
+            # the elapsed time, leaving the rest to live queries
+            busy = perf_counter() - t0
+            sleep(busy * (1 - duty) / duty)
+            t0 = perf_counter()
+        storeCheckpoint(JOB, author=author, authors_version=version)
+        total += nauthor
+        print(f"{author}: {nauthor} statuses set to {langs[author]}")
+    print(f"reclassified {total} statuses")
+
+
+if __name__ == "__main__":
+
+    # pylint: disable=no-value-for-parameter
+    main()
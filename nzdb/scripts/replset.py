@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+start a local replica set of mongods, to try read routing against, e.g.
+
+    replset -d ~/nzrs -n 3
+
+then set HOST in the [db] section of a conf to the uri it prints
+"""
+
+import os
+import subprocess  # nosec
+import time
+
+import click
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+NAME = "nzrs"
+
+
+def mongod(dbdir, port, stop=False):
+    """start, or stop, the mongod of port, forked into the background"""
+    path = os.path.join(dbdir, str(port))
+    os.makedirs(path, exist_ok=True)
+    if stop:
+        args = ["mongod", "--shutdown", "--dbpath", path]
+    else:
+        args = ["mongod", "--replSet", NAME, "--port", str(port), "--dbpath", path]
+        args += ["--bind_ip", "localhost", "--fork"]
+        args += ["--logpath", os.path.join(path, "mongod.log")]
+    subprocess.run(args, check=not stop)  # nosec
+
+
+def initiate(ports):
+    """make the mongods on ports a replica set, the first one primary"""
+    client = MongoClient("localhost", ports[0], directConnection=True)
+    members = [
+        {"_id": i, "host": f"localhost:{port}", "priority": 2 if i == 0 else 1}
+        for i, port in enumerate(ports)
+    ]
+    try:
+        client.admin.command("replSetInitiate", {"_id": NAME, "members": members})
+    except OperationFailure as e:
+        if "already initialized" not in str(e):
+            raise
+    while not client.admin.command("hello").get("isWritablePrimary"):
+        time.sleep(0.5)
+
+
+@click.command()
+@click.option("-d", "--dbdir", default="~/nzrs", help="directory of the dbs")
+@click.option("-p", "--port", default=27117, help="port of the first mongod")
+@click.option("-n", "--members", default=3, help="number of mongods")
+@click.option("--stop", is_flag=True, help="shut the replica set down")
+def main(dbdir, port, members, stop):
+    dbdir = os.path.expanduser(dbdir)
+    ports = [port + i for i in range(members)]
+    for p in ports:
+        mongod(dbdir, p, stop)
+    if stop:
+        return
+    initiate(ports)
+    hosts = ",".join(f"localhost:{p}" for p in ports)
+    click.echo(f"mongodb://{hosts}/?replicaSet={NAME}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,29 @@
 import os
 
 from nzdb.configurator import nzdbConfig
-from nzdb.dbif import getAuthors, mapAuthorToLang, storeAuthor
+from nzdb.dbif import getAuthorLangs, syncAuthors
+
+
+def read_authors(authfile):
+    langs = {}
+    with open(authfile) as lines:
+        for line in lines:
+            if line.strip():
+                [author, lang] = line.split(":")
+                langs[author] = lang.strip()
+    return langs
 
 
 def main():
     authfile = nzdbConfig["authfile"]
     authfile = os.path.expanduser(authfile)
-    with open(authfile) as lines:
-        for line in lines:
-            [author, lang] = line.split(":")
-            storeAuthor(author, lang.strip())
+    version, added, changed, removed = syncAuthors(read_authors(authfile))
+    print(f"authors v{version}: {added} added, {changed} changed, {removed} removed")
     display_all()
 
 
 def display_all():
-    print("inserted")
-    authors = getAuthors()
-    for author in authors:
-        lang = mapAuthorToLang(author)
+    for author, lang in getAuthorLangs().items():
         print(f"{author} speaks {lang}")
 
 
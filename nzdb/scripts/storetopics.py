@@ -8,7 +8,7 @@ import os
 from collections import namedtuple
 
 from nzdb.configurator import nzdbConfig
-from nzdb.dbif import cleanTopicsCollection, getTopics, storeTopic
+from nzdb.dbif import getTopics, syncTopics
 
 """
 Builds database from topics.txt
@@ -31,18 +31,24 @@ def display_all():
         )
 
 
-def main():
-    fname = nzdbConfig["topicsfile"]
-    fname = os.path.expanduser(fname)
-    # clean topics collection before updating
-    cleanTopicsCollection()
+def read_topics(fname):
+    topics = []
     with open(fname) as f:
         for line in f:
             if line != "\n" and not line.startswith("#"):
                 line = line.strip().split(":")
                 assert len(line) == 4
-                topic = row(*line)._asdict()
-                storeTopic(topic)
+                topics.append(row(*line)._asdict())
+    return topics
+
+
+def main():
+    fname = nzdbConfig["topicsfile"]
+    fname = os.path.expanduser(fname)
+    # only a changed file touches the db, and then the new topics are
+    # swapped in whole, so running queries never miss a topic
+    version, added, changed, removed = syncTopics(read_topics(fname))
+    print(f"topics v{version}: {added} added, {changed} changed, {removed} removed")
     display_all()
 
 
@@ -0,0 +1,35 @@
+"""
+storage -- the storage engine behind dbif, chosen by BACKEND in the [db]
+section of the conf: mongo (the default) or sqlite
+"""
+
+from nzdb.configurator import nzdbConfig
+from nzdb.storage.base import DuplicateStatus, StorageBackend
+
+_backend = None
+
+
+def make_backend(conf):
+    """
+    :param dict conf: parsed conf
+    :rtype: StorageBackend
+    """
+    if conf["backend"] == "sqlite":
+        from nzdb.storage.sqlite import SqliteBackend
+
+        return SqliteBackend(conf["sqlitedir"])
+    if conf["backend"] == "mongo":
+        from nzdb.storage.mongo import MongoBackend
+
+        return MongoBackend(conf["partition"] == "monthly", conf["archivedir"])
+    raise ValueError(f"unknown storage backend {conf['backend']}")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = make_backend(nzdbConfig)
+    return _backend
+
+
+__all__ = ["DuplicateStatus", "StorageBackend", "get_backend", "make_backend"]
@@ -0,0 +1,188 @@
+"""
+base -- the operations dbif needs from a storage engine
+
+Status queries are passed as the mongo-style documents dbif builds
+(created_at window, $text search, equality, $in or a range on other
+fields), and projections as mongo projections; each backend translates
+what it needs.
+"""
+
+from abc import ABC, abstractmethod
+
+ASCENDING = 1
+DESCENDING = -1
+
+
+class DuplicateStatus(Exception):
+    pass
+
+
+class StorageBackend(ABC):
+    name = "base"
+
+    # statuses
+
+    @abstractmethod
+    def store_status(self, status):
+        """:raises: DuplicateStatus"""
+
+    @abstractmethod
+    def store_statuses(self, statuses):
+        """:return: number added, number skipped as duplicates"""
+
+    @abstractmethod
+    def find_statuses(self, searchon, projection=None, sort_dir=None, limit=None):
+        """
+        :return: iterable of statuses, in created_at order if sort_dir,
+            at most limit of them if limit
+        """
+
+    @abstractmethod
+    def find_status(self, searchon, projection=None):
+        """:return: one matching status or None"""
+
+    @abstractmethod
+    def count_statuses(self, searchon, limit=None):
+        """
+        :return: number of matches, counting stops at limit if given, and
+            whether the count is complete; a count cut short by the time
+            budget is only a lower bound
+        """
+
+    @abstractmethod
+    def ensure_indexes(self):
+        """create the indexes status queries rely on, if missing"""
+
+    @abstractmethod
+    def estimated_count(self):
+        """fast, possibly approximate, count of all statuses"""
+
+    @abstractmethod
+    def unknown_status_authors(self):
+        """:return: authors of statuses stored with language U"""
+
+    @abstractmethod
+    def reclassify_statuses(self, author, lang, batch):
+        """:return: generator of the number updated by each batch"""
+
+    # topics
+
+    @abstractmethod
+    def get_topics(self):
+        """:return: topic dicts sorted on desc"""
+
+    @abstractmethod
+    def find_topic(self, topic):
+        """:return: topic dict or None"""
+
+    @abstractmethod
+    def drop_topics(self):
+        pass
+
+    @abstractmethod
+    def store_topic(self, topic):
+        pass
+
+    @abstractmethod
+    def sync_topics(self, topics):
+        """:return: version, number added, changed, removed"""
+
+    # authors
+
+    @abstractmethod
+    def get_author_langs(self):
+        """:return: language code keyed by author"""
+
+    @abstractmethod
+    def find_author(self, author):
+        """:return: author dict or None"""
+
+    @abstractmethod
+    def unknown_authors(self):
+        """:return: author dicts with language U"""
+
+    @abstractmethod
+    def store_author(self, author, lang):
+        pass
+
+    @abstractmethod
+    def sync_authors(self, langs):
+        """:return: version, number added, changed, removed"""
+
+    # bookkeeping
+
+    @abstractmethod
+    def get_ref_version(self, name):
+        pass
+
+    @abstractmethod
+    def get_checkpoint(self, job):
+        pass
+
+    @abstractmethod
+    def store_checkpoint(self, job, **state):
+        pass
+
+    @abstractmethod
+    def get_lastread(self, feed=None, inherit=False):
+        """
+        :param inherit: a feed without a watermark starts from the
+            untagged one; only for the list readfeed read before
+        :return: key and maxid of the watermark, maxid 0 if none
+        """
+
+    @abstractmethod
+    def store_lastread(self, maxid, feed=None):
+        """advance the watermark to maxid; it never moves backwards"""
+
+    @abstractmethod
+    def get_watermarks(self):
+        """:return: maxid of every watermark, keyed as by get_lastread"""
+
+
+def project(status, projection):
+    """copy of status with the fields projection includes"""
+    included = [k for k, v in (projection or {}).items() if v and k != "_id"]
+    if not included:
+        return {k: v for k, v in status.items() if k != "_id"}
+    return {k: status[k] for k in included if k in status}
+
+
+def projected(projection, columns):
+    """
+    :param projection: mongo projection, or None for every column
+    :param list columns: fields a status may have
+    :return: those of columns selected by projection, in their order
+    """
+    if not projection:
+        return columns
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if included:
+        return [c for c in columns if c in included]
+    excluded = [k for k, v in projection.items() if not v]
+    return [c for c in columns if c not in excluded]
+
+
+def diff_topics(current, topics):
+    """
+    :param dict current: topic dicts keyed by topic
+    :param topics: list of new topic dicts
+    :return: new topics keyed by topic, and keys added, changed, removed
+    """
+    new = {t["topic"]: t for t in topics}
+    added = new.keys() - current.keys()
+    removed = current.keys() - new.keys()
+    changed = [k for k in new.keys() & current.keys() if new[k] != current[k]]
+    return new, added, changed, removed
+
+
+def diff_authors(current, langs):
+    """
+    :param dict current: language code keyed by author
+    :param dict langs: new language codes keyed by author
+    :return: authors to upsert, number added, number changed, authors removed
+    """
+    upserts = {a: lang for a, lang in langs.items() if current.get(a) != lang}
+    added = len(upserts.keys() - current.keys())
+    removed = current.keys() - langs.keys()
+    return upserts, added, len(upserts) - added, removed
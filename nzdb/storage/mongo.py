@@ -0,0 +1,375 @@
+"""
+mongo -- storage backend on a mongo server, the production engine
+"""
+
+from collections import defaultdict
+from itertools import islice
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ExecutionTimeout
+from pymongo.errors import DuplicateKeyError as DKE
+
+from nzdb import archive, budget, partitions
+from nzdb.connectdb import LIVE, get_db
+from nzdb.storage.base import (
+    DuplicateStatus,
+    StorageBackend,
+    diff_authors,
+    diff_topics,
+)
+from nzdb.textmatch import matcher
+
+# mongo error code of a unique index violation
+DUPLICATE_KEY = 11000
+
+
+def _window(searchon):
+    window = searchon.get("created_at", {})
+    return window.get("$gte"), window.get("$lt")
+
+
+def _narrowed(searchon, projection):
+    """
+    A $text query with an author filter is run on the (author, created_at)
+    index instead of the text index, which would read every match in the
+    window; the text is then matched here, stemmed as the text index does.
+    Mongo takes no hint for a $text query, so the $text is left out.
+    :return: query and projection for mongo, and the text match or None
+    """
+    if "$text" not in searchon or "author" not in searchon:
+        return searchon, projection, None
+    if "created_at" not in searchon:
+        return searchon, projection, None
+    query = {k: v for k, v in searchon.items() if k != "$text"}
+    if projection and any(v for k, v in projection.items() if k != "_id"):
+        projection = projection | {"text": True}
+    return query, projection, matcher({"$text": searchon["$text"]})
+
+
+def _is_text(spec):
+    return any(kind == partitions.TEXT for _, kind in spec["keys"])
+
+
+def _without_text(status):
+    status.pop("text", None)
+    return status
+
+
+def _timed(cursor):
+    """cursor limited to the time left in the budget, if any"""
+    if budget.current() is not None:
+        cursor = cursor.max_time_ms(budget.remaining_ms())
+    return cursor
+
+
+def _guarded(cursor):
+    """the statuses of cursor found before the budget ran out"""
+    try:
+        yield from cursor
+    except ExecutionTimeout:
+        budget.truncate()
+
+
+def _lastread_key(feed):
+    # the single-list readfeed keeps one untagged watermark document;
+    # feeds sharing a db in ingestd are tagged with their list id
+    return {"feed": {"$exists": False}} if feed is None else {"feed": feed}
+
+
+class MongoBackend(StorageBackend):
+    """
+    Statuses live in the statuses collection, or in monthly partitions,
+    with closed months optionally archived to parquet. The db is looked
+    up on every call, so use_db routes a backend to another db.
+    """
+
+    name = "mongo"
+
+    def __init__(self, partitioned=False, archivedir=None):
+        self.partitioned = partitioned
+        self.archivedir = archivedir
+
+    def _status_collection(self, db, status):
+        """collection status is stored in"""
+        if self.partitioned:
+            return partitions.partition_for(db, status["created_at"])
+        return db.statuses
+
+    # statuses
+
+    def store_status(self, status):
+        db = get_db()
+        try:
+            self._status_collection(db, status).insert_one(status)
+        except DKE:
+            raise DuplicateStatus(status)
+
+    def store_statuses(self, statuses):
+        db = get_db()
+        bycollection = defaultdict(list)
+        for status in statuses:
+            bycollection[self._status_collection(db, status).name].append(status)
+        added = skipped = 0
+        for name, group in bycollection.items():
+            try:
+                result = db[name].insert_many(group, ordered=False)
+                added += len(result.inserted_ids)
+            except BulkWriteError as e:
+                errors = e.details["writeErrors"]
+                if any(error["code"] != DUPLICATE_KEY for error in errors):
+                    raise
+                added += e.details["nInserted"]
+                skipped += len(errors)
+        return added, skipped
+
+    def find_statuses(self, searchon, projection=None, sort_dir=None, limit=None):
+        """
+        find statuses in the collections overlapping the date window of
+        searchon, merged in created_at order if sort_dir is given; with a
+        limit, each collection returns its first limit statuses only, so
+        the sort streams from the created_at index or is a top-k sort
+        """
+        db = get_db()
+        start, end = _window(searchon)
+        collections = partitions.collections(db, start, end)
+        query, fields, match = _narrowed(searchon, projection)
+        cursors = [_timed(statuses.find(query, fields)) for statuses in collections]
+        if sort_dir is not None:
+            cursors = [cursor.sort("created_at", sort_dir) for cursor in cursors]
+        if limit and match is None:
+            cursors = [cursor.limit(limit) for cursor in cursors]
+        cursors = [_guarded(cursor) for cursor in cursors]
+        if match is not None:
+            cursors = [filter(match, cursor) for cursor in cursors]
+            if fields != projection:
+                # text was fetched for the match only
+                cursors = [map(_without_text, cursor) for cursor in cursors]
+        if budget.expired():
+            budget.truncate()
+        elif self.archivedir and start is not None and end is not None:
+            archived = archive.find(
+                self.archivedir,
+                db.name,
+                searchon,
+                sort_dir == DESCENDING,
+                projection,
+                limit,
+            )
+            cursors.append(archived)
+        if sort_dir is None:
+            found = partitions.concat(cursors)
+        else:
+            found = partitions.merge_sorted(cursors, sort_dir)
+        return found if limit is None else islice(found, limit)
+
+    def find_status(self, searchon, projection=None):
+        """newest collections first, as recent statuses are looked up most"""
+        db = get_db()
+        for statuses in reversed(partitions.collections(db)):
+            status = statuses.find_one(searchon, projection)
+            if status is not None:
+                return status
+        return None
+
+    def count_statuses(self, searchon, limit=None):
+        db = get_db()
+        start, end = _window(searchon)
+        collections = partitions.collections(db, start, end)
+        query, _, match = _narrowed(searchon, None)
+        count = 0
+        for statuses in collections:
+            remaining = None if limit is None else limit - count
+            try:
+                if match is None:
+                    options = {} if remaining is None else {"limit": remaining}
+                    if budget.current() is not None:
+                        options["maxTimeMS"] = budget.remaining_ms()
+                    count += statuses.count_documents(searchon, **options)
+                else:
+                    found = _timed(statuses.find(query, {"_id": False, "text": True}))
+                    count += sum(1 for _ in islice(filter(match, found), remaining))
+            except ExecutionTimeout:
+                budget.truncate()
+                return count, False
+            if limit is not None and count >= limit:
+                return limit, True
+        if self.archivedir and start is not None and end is not None:
+            if budget.expired():
+                budget.truncate()
+                return count, False
+            count += archive.count(self.archivedir, db.name, searchon)
+        return (count if limit is None else min(count, limit)), True
+
+    def ensure_indexes(self):
+        """
+        create the default indexes on every status collection; new
+        monthly partitions copy those of the legacy collection
+        """
+        db = get_db()
+        for statuses in partitions.collections(db) or [db[partitions.LEGACY]]:
+            info = statuses.index_information()
+            specs = [partitions.index_spec(name, i) for name, i in info.items()]
+            existing = {tuple(map(tuple, spec["keys"])) for spec in specs}
+            # a collection has at most one text index, whatever its fields
+            has_text = any(_is_text(spec) for spec in specs)
+            for spec in partitions.DEFAULT_INDEXES:
+                if _is_text(spec) and has_text:
+                    continue
+                if tuple(spec["keys"]) not in existing:
+                    statuses.create_index(
+                        spec["keys"], name=spec["name"], **spec["options"]
+                    )
+
+    def estimated_count(self):
+        db = get_db()
+        return sum(c.estimated_document_count() for c in partitions.collections(db))
+
+    def unknown_status_authors(self):
+        db = get_db()
+        authors = set()
+        for statuses in partitions.collections(db):
+            authors.update(statuses.distinct("author", {"language_code": "U"}))
+        return list(authors)
+
+    def reclassify_statuses(self, author, lang, batch):
+        db = get_db()
+        unknown = {"author": author, "language_code": "U"}
+        for statuses in partitions.collections(db):
+            while True:
+                cursor = statuses.find(unknown, {"_id": 1}).limit(batch)
+                ids = [s["_id"] for s in cursor]
+                if not ids:
+                    break
+                result = statuses.update_many(
+                    {"_id": {"$in": ids}, "language_code": "U"},
+                    {"$set": {"language_code": lang}},
+                )
+                yield result.modified_count
+
+    # topics
+
+    def get_topics(self):
+        db = get_db()
+        return db.topics.find(projection={"_id": False}).sort("desc", ASCENDING)
+
+    def find_topic(self, topic):
+        db = get_db()
+        return db.topics.find_one({"topic": topic})
+
+    def drop_topics(self):
+        db = get_db()
+        db.topics.drop()
+
+    def store_topic(self, topic):
+        db = get_db()
+        db.topics.insert_one(topic)
+
+    def sync_topics(self, topics):
+        """
+        The new set is built in a staging collection and renamed over
+        topics, so queries never see a missing or partial topic set. The
+        version is bumped only then: a reader seeing the new version
+        reads the new topics
+        """
+        db = get_db()
+        current = {t["topic"]: t for t in db.topics.find(projection={"_id": False})}
+        new, added, changed, removed = diff_topics(current, topics)
+        if not (added or removed or changed):
+            return self.get_ref_version("topics"), 0, 0, 0
+        # unique to this sync, so concurrent syncs don't share one
+        staging = db[f"topics_staging_{ObjectId()}"]
+        staging.insert_many([dict(t) for t in new.values()])
+        staging.create_index("topic", unique=True)
+        staging.rename("topics", dropTarget=True)
+        version = self._bump_ref_version(db, "topics")
+        return version, len(added), len(changed), len(removed)
+
+    # authors
+
+    def get_author_langs(self):
+        db = get_db()
+        return {a["author"]: a["language_code"] for a in db.authors.find()}
+
+    def find_author(self, author):
+        db = get_db()
+        return db.authors.find_one({"author": author})
+
+    def unknown_authors(self):
+        db = get_db()
+        return db.authors.find({"language_code": "U"})
+
+    def store_author(self, author, lang):
+        db = get_db()
+        row = {"author": author, "language_code": lang}
+        db.authors.update_one({"author": author}, {"$set": row}, upsert=True)
+
+    def sync_authors(self, langs):
+        """changes are applied in one bulk write"""
+        db = get_db()
+        upserts, added, changed, removed = diff_authors(self.get_author_langs(), langs)
+        ops = [
+            UpdateOne(
+                {"author": author},
+                {"$set": {"author": author, "language_code": lang}},
+                upsert=True,
+            )
+            for author, lang in upserts.items()
+        ]
+        ops.extend(DeleteOne({"author": author}) for author in removed)
+        if not ops:
+            return self.get_ref_version("authors"), 0, 0, 0
+        db.authors.bulk_write(ops, ordered=False)
+        return self._bump_ref_version(db, "authors"), added, changed, len(removed)
+
+    # bookkeeping
+
+    def get_ref_version(self, name):
+        db = get_db()
+        versions = db.meta.find_one({"_id": "refversions"}) or {}
+        return versions.get(name, 0)
+
+    def _bump_ref_version(self, db, name):
+        versions = db.meta.find_one_and_update(
+            {"_id": "refversions"},
+            {"$inc": {name: 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return versions[name]
+
+    def get_checkpoint(self, job):
+        db = get_db()
+        return db.meta.find_one({"_id": f"checkpoint-{job}"}) or {}
+
+    def store_checkpoint(self, job, **state):
+        db = get_db()
+        db.meta.update_one({"_id": f"checkpoint-{job}"}, {"$set": state}, upsert=True)
+
+    def get_lastread(self, feed=None, inherit=False):
+        db = get_db(LIVE)
+        last = db.lastread.find_one(_lastread_key(feed))
+        if not last and feed is not None:
+            # the list moved into ingestd picks up where readfeed left off
+            _, maxid = self.get_lastread() if inherit else (0, 0)
+            return f"feed-{feed}", maxid
+        if not last:
+            return (0, 0)
+        else:
+            return last["_id"], last["maxid"]
+
+    def store_lastread(self, maxid, feed=None):
+        """
+        an atomic $max, so that a late or replayed checkpoint can never
+        move the watermark backwards
+        """
+        _id, _ = self.get_lastread(feed)
+        db = get_db(LIVE)
+        update = {"$max": {"maxid": maxid}}
+        if feed is not None:
+            update["$set"] = {"feed": feed}
+        db.lastread.update_one({"_id": _id}, update, upsert=True)
+
+    def get_watermarks(self):
+        db = get_db(LIVE)
+        return {last["_id"]: last["maxid"] for last in db.lastread.find()}
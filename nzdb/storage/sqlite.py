@@ -0,0 +1,405 @@
+"""
+sqlite -- embedded storage backend on sqlite with an fts5 text index
+
+Each db is a file <SQLITEDIR>/<dbname>.sqlite, so use_db switches files
+as it switches mongo databases. Text search uses a porter-stemmed,
+diacritic-folding fts5 index, close to mongo's $text with
+$diacriticSensitive False.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from nzdb import budget
+from nzdb.connectdb import current_target
+from nzdb.partitions import naive_utc
+from nzdb.storage.base import (
+    DESCENDING,
+    DuplicateStatus,
+    StorageBackend,
+    diff_authors,
+    diff_topics,
+    projected,
+)
+from nzdb.textmatch import TextQuery
+
+COLUMNS = ["id", "created_at", "author", "language_code", "source", "text"]
+RANGE_OPS = {"$gte": ">=", "$gt": ">", "$lt": "<", "$lte": "<="}
+TOPIC_COLUMNS = ["topic", "desc", "cat", "query"]
+# sqlite vm instructions between checks of the budget
+PROGRESS_STEPS = 10000
+
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS statuses (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    author TEXT,
+    language_code TEXT,
+    source TEXT,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS statuses_created_at ON statuses (created_at);
+CREATE INDEX IF NOT EXISTS statuses_author ON statuses (author, created_at);
+CREATE INDEX IF NOT EXISTS statuses_language
+    ON statuses (language_code, created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS statuses_fts USING fts5 (
+    text, content='statuses', content_rowid='id',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS statuses_ai AFTER INSERT ON statuses BEGIN
+    INSERT INTO statuses_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS statuses_ad AFTER DELETE ON statuses BEGIN
+    INSERT INTO statuses_fts (statuses_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+END;
+CREATE TABLE IF NOT EXISTS authors (
+    author TEXT PRIMARY KEY,
+    language_code TEXT
+);
+CREATE TABLE IF NOT EXISTS topics (
+    topic TEXT PRIMARY KEY,
+    "desc" TEXT,
+    cat TEXT,
+    query TEXT
+);
+CREATE TABLE IF NOT EXISTS lastread (
+    feed TEXT PRIMARY KEY,
+    maxid INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _interrupted(e):
+    """record a statement interrupted by the budget, reraise other errors"""
+    if "interrupted" not in str(e):
+        raise e
+    budget.truncate()
+
+
+def _guarded(statuses):
+    """the statuses found before the budget ran out"""
+    try:
+        yield from statuses
+    except sqlite3.OperationalError as e:
+        _interrupted(e)
+
+
+def _ts(date):
+    """created_at as stored: naive utc iso text, which sorts as dates do"""
+    return naive_utc(date).isoformat(sep=" ", timespec="microseconds")
+
+
+def _quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def fts_query(search):
+    """
+    Translate a mongo $text search string into an fts5 match expression
+    :return: positive match expression or None, negated expression or None
+    """
+    query = TextQuery(search)
+    if query.phrases:
+        positive = " AND ".join(_quote(phrase) for phrase in query.phrases)
+    else:
+        positive = " OR ".join(_quote(term) for term in sorted(query.terms))
+    negated = sorted(query.negated) + query.negated_phrases
+    negated = " OR ".join(_quote(term) for term in negated)
+    return positive or None, negated or None
+
+
+def _where(searchon):
+    """sql condition and parameters for a mongo-style status query"""
+    clauses, params = [], []
+    for field, cond in searchon.items():
+        if field == "created_at":
+            for op, value in cond.items():
+                clauses.append(f"created_at {RANGE_OPS[op]} ?")
+                params.append(_ts(value))
+        elif field == "$text":
+            positive, negated = fts_query(cond["$search"])
+            match = "SELECT rowid FROM statuses_fts WHERE statuses_fts MATCH ?"
+            if positive:
+                clauses.append(f"id IN ({match})")
+                params.append(positive)
+            if negated:
+                clauses.append(f"id NOT IN ({match})")
+                params.append(negated)
+        elif field in COLUMNS:
+            if isinstance(cond, dict) and set(cond) <= RANGE_OPS.keys():
+                for op, value in cond.items():
+                    clauses.append(f"{field} {RANGE_OPS[op]} ?")
+                    params.append(value)
+            elif isinstance(cond, dict):
+                if set(cond) != {"$in"}:
+                    raise ValueError(f"unsupported condition on {field}: {cond}")
+                values = list(cond["$in"])
+                clauses.append(f"{field} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            else:
+                clauses.append(f"{field} = ?")
+                params.append(cond)
+        else:
+            raise ValueError(f"unsupported query field {field}")
+    where = " AND ".join(clauses) if clauses else "1"
+    return where, params
+
+
+def _status(columns, row):
+    status = dict(zip(columns, row))
+    if "created_at" in status:
+        status["created_at"] = datetime.fromisoformat(status["created_at"])
+    return status
+
+
+class SqliteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, sqlitedir):
+        self.sqlitedir = sqlitedir
+        # connections can't be shared between threads
+        self._local = threading.local()
+
+    def _conn(self):
+        _, dbname = current_target()
+        conns = self._local.__dict__.setdefault("conns", {})
+        conn = conns.get(dbname)
+        if conn is None:
+            os.makedirs(self.sqlitedir, exist_ok=True)
+            path = os.path.join(self.sqlitedir, f"{dbname}.sqlite")
+            conn = sqlite3.connect(path)
+            conn.executescript(SCHEMA)
+            # a statement running past the budget of its search is interrupted
+            conn.set_progress_handler(budget.expired, PROGRESS_STEPS)
+            conns[dbname] = conn
+        return conn
+
+    # statuses
+
+    def _insert(self, conn, statuses):
+        rows = [
+            (
+                s["id"],
+                _ts(s["created_at"]),
+                s.get("author"),
+                s.get("language_code"),
+                s.get("source"),
+                s.get("text"),
+            )
+            for s in statuses
+        ]
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO statuses VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        return cursor.rowcount
+
+    def store_status(self, status):
+        conn = self._conn()
+        with conn:
+            if self._insert(conn, [status]) == 0:
+                raise DuplicateStatus(status)
+
+    def store_statuses(self, statuses):
+        conn = self._conn()
+        with conn:
+            added = self._insert(conn, statuses)
+        return added, len(statuses) - added
+
+    def find_statuses(self, searchon, projection=None, sort_dir=None, limit=None):
+        columns = projected(projection, COLUMNS)
+        where, params = _where(searchon)
+        sql = f"SELECT {', '.join(columns)} FROM statuses WHERE {where}"
+        if sort_dir is not None:
+            order = "DESC" if sort_dir == DESCENDING else "ASC"
+            sql += f" ORDER BY created_at {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        try:
+            cursor = self._conn().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            _interrupted(e)
+            return iter(())
+        return _guarded(_status(columns, row) for row in cursor)
+
+    def find_status(self, searchon, projection=None):
+        return next(iter(self.find_statuses(searchon, projection, limit=1)), None)
+
+    def count_statuses(self, searchon, limit=None):
+        where, params = _where(searchon)
+        if limit is None:
+            sql = f"SELECT count(*) FROM statuses WHERE {where}"
+        else:
+            sql = f"SELECT count(*) FROM (SELECT 1 FROM statuses WHERE {where} LIMIT ?)"
+            params.append(limit)
+        try:
+            return self._conn().execute(sql, params).fetchone()[0], True
+        except sqlite3.OperationalError as e:
+            # sqlite gives no partial count
+            _interrupted(e)
+            return 0, False
+
+    def ensure_indexes(self):
+        # created with the schema
+        self._conn()
+
+    def estimated_count(self):
+        count, _ = self.count_statuses({})
+        return count
+
+    def unknown_status_authors(self):
+        sql = "SELECT DISTINCT author FROM statuses WHERE language_code = 'U'"
+        return [row[0] for row in self._conn().execute(sql)]
+
+    def reclassify_statuses(self, author, lang, batch):
+        conn = self._conn()
+        sql = """UPDATE statuses SET language_code = ? WHERE id IN (
+            SELECT id FROM statuses WHERE author = ? AND language_code = 'U'
+            LIMIT ?)"""
+        while True:
+            with conn:
+                n = conn.execute(sql, (lang, author, batch)).rowcount
+            if n == 0:
+                return
+            yield n
+
+    # topics
+
+    def get_topics(self):
+        sql = 'SELECT topic, "desc", cat, query FROM topics ORDER BY "desc"'
+        rows = self._conn().execute(sql)
+        return [dict(zip(TOPIC_COLUMNS, row)) for row in rows]
+
+    def find_topic(self, topic):
+        sql = 'SELECT topic, "desc", cat, query FROM topics WHERE topic = ?'
+        row = self._conn().execute(sql, (topic,)).fetchone()
+        return None if row is None else dict(zip(TOPIC_COLUMNS, row))
+
+    def drop_topics(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM topics")
+
+    def store_topic(self, topic):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO topics VALUES (?, ?, ?, ?)",
+                [topic[c] for c in TOPIC_COLUMNS],
+            )
+
+    def sync_topics(self, topics):
+        """the new set replaces the old in one transaction"""
+        current = {t["topic"]: t for t in self.get_topics()}
+        new, added, changed, removed = diff_topics(current, topics)
+        if not (added or removed or changed):
+            return self.get_ref_version("topics"), 0, 0, 0
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM topics")
+            conn.executemany(
+                "INSERT INTO topics VALUES (?, ?, ?, ?)",
+                [[t[c] for c in TOPIC_COLUMNS] for t in new.values()],
+            )
+            version = self._bump_ref_version(conn, "topics")
+        return version, len(added), len(changed), len(removed)
+
+    # authors
+
+    def get_author_langs(self):
+        rows = self._conn().execute("SELECT author, language_code FROM authors")
+        return dict(rows.fetchall())
+
+    def find_author(self, author):
+        sql = "SELECT author, language_code FROM authors WHERE author = ?"
+        row = self._conn().execute(sql, (author,)).fetchone()
+        return None if row is None else {"author": row[0], "language_code": row[1]}
+
+    def unknown_authors(self):
+        sql = "SELECT author, language_code FROM authors WHERE language_code = 'U'"
+        rows = self._conn().execute(sql)
+        return [{"author": a, "language_code": lang} for a, lang in rows]
+
+    def store_author(self, author, lang):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO authors VALUES (?, ?)", (author, lang))
+
+    def sync_authors(self, langs):
+        upserts, added, changed, removed = diff_authors(self.get_author_langs(), langs)
+        if not (upserts or removed):
+            return self.get_ref_version("authors"), 0, 0, 0
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO authors VALUES (?, ?)", upserts.items()
+            )
+            conn.executemany(
+                "DELETE FROM authors WHERE author = ?", [(a,) for a in removed]
+            )
+            version = self._bump_ref_version(conn, "authors")
+        return version, added, changed, len(removed)
+
+    # bookkeeping
+
+    def _get_meta(self, key, default):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,))
+        row = row.fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def _set_meta(self, conn, key, value):
+        conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value))
+        )
+
+    def get_ref_version(self, name):
+        return self._get_meta("refversions", {}).get(name, 0)
+
+    def _bump_ref_version(self, conn, name):
+        """call inside the transaction making the change"""
+        versions = self._get_meta("refversions", {})
+        versions[name] = versions.get(name, 0) + 1
+        self._set_meta(conn, "refversions", versions)
+        return versions[name]
+
+    def get_checkpoint(self, job):
+        return self._get_meta(f"checkpoint-{job}", {})
+
+    def store_checkpoint(self, job, **state):
+        conn = self._conn()
+        with conn:
+            checkpoint = self.get_checkpoint(job) | state
+            self._set_meta(conn, f"checkpoint-{job}", checkpoint)
+
+    def get_lastread(self, feed=None, inherit=False):
+        sql = "SELECT maxid FROM lastread WHERE feed = ?"
+        row = self._conn().execute(sql, (feed or "",)).fetchone()
+        if row is None and feed is not None:
+            # the list moved into ingestd picks up where readfeed left off
+            _, maxid = self.get_lastread() if inherit else (0, 0)
+            return feed, maxid
+        if row is None:
+            return (0, 0)
+        return feed or 0, row[0]
+
+    def store_lastread(self, maxid, feed=None):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """INSERT INTO lastread VALUES (?, ?) ON CONFLICT (feed)
+                DO UPDATE SET maxid = max(maxid, excluded.maxid)""",
+                (feed or "", maxid),
+            )
+
+    def get_watermarks(self):
+        rows = self._conn().execute("SELECT feed, maxid FROM lastread")
+        return {feed or 0: maxid for feed, maxid in rows}
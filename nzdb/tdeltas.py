@@ -1,5 +1,4 @@
 from datetime import timedelta
-import delorean
 import re
 
 """
@@ -7,6 +6,20 @@ calculate series of time intervals
 """
 
 
+def parse_date(text: str):
+    """parse a date as the queries give it, utc assumed
+
+    Args:
+        text (str): date, e.g. 2021-06-01 or 2021-06-01T12:00
+    Returns:
+        Delorean: the date, its datetime under .datetime
+    """
+    # delorean and babel take a while to import, only done when needed
+    import delorean
+
+    return delorean.parse(text, yearfirst=True, dayfirst=False)
+
+
 def parse_delta(interval: str) -> timedelta:
     """find the timedelta corresponding to the given string
 
@@ -39,7 +52,7 @@ def calc_intervals(start: str, interval: str, nintvls: int):
         interval (string): interval indicator (e.g., 1d 1h 3m)
         nintvls (int): number of intervals
     """
-    startde = delorean.parse(start, yearfirst=True, dayfirst=False)
+    startde = parse_date(start)
     delta = parse_delta(interval)
     intervals = []
     s = startde.datetime
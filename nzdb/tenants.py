@@ -0,0 +1,76 @@
+"""
+tenants -- several nooze sites, each on the db of its own conf, served
+by one process
+
+    NZDB_TENANTS="/us=~/confs/usnews.conf,/eu=~/confs/eunews.conf" \\
+        gunicorn 'nzdb.tenants:tenants_app()'
+
+A tenant whose key starts with / is mounted under that path, any other
+on the host name given as its key. Tenants share the code, the mongo
+client of each host and admission control of the process; each has its
+own app, db and caches.
+"""
+
+import os
+
+from werkzeug.exceptions import NotFound
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+from nzdb.configurator import parse_config
+from nzdb.noozeapp import create_app
+
+
+class TenantError(ValueError):
+    pass
+
+
+class HostDispatcher:
+    """wsgi app passing each request to the app of its host name"""
+
+    def __init__(self, apps, default):
+        self.apps = apps
+        self.default = default
+
+    def __call__(self, environ, start_response):
+        host = environ.get("HTTP_HOST", "").partition(":")[0].lower()
+        return self.apps.get(host, self.default)(environ, start_response)
+
+
+def parse_tenants(spec):
+    """
+    :param str spec: comma separated key=conf pairs
+    :return: paths of the confs keyed by prefix or host
+    :rtype: dict
+    :raises: TenantError
+    """
+    tenants = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        key, sep, conf = part.partition("=")
+        if not (sep and key and conf):
+            raise TenantError(f"bad tenant {part}, use /prefix=conf or host=conf")
+        key = key.rstrip("/") if key.startswith("/") else key.lower()
+        if not key or key in tenants:
+            raise TenantError(f"tenant {part} duplicates or shadows another")
+        tenants[key] = conf
+    if not tenants:
+        raise TenantError("no tenants given")
+    return tenants
+
+
+def tenants_app(spec=None):
+    """
+    :param str spec: tenants as in parse_tenants, by default those of
+        the NZDB_TENANTS environment variable
+    :return: wsgi app dispatching requests to the app of their tenant
+    """
+    tenants = parse_tenants(spec or os.getenv("NZDB_TENANTS", ""))
+    apps = {key: create_app(parse_config(conf)) for key, conf in tenants.items()}
+    prefixed = {k: app for k, app in apps.items() if k.startswith("/")}
+    hosted = {k: app for k, app in apps.items() if not k.startswith("/")}
+    app = DispatcherMiddleware(NotFound(), prefixed)
+    if hosted:
+        app = HostDispatcher(hosted, app)
+    # the apps to warm up, see warmup.served, and the mounts, see asgi
+    app.nzdb_apps = list(apps.values())
+    app.nzdb_prefixes = list(prefixed)
+    return app
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from nzdb import archive
+from nzdb.scripts import archive as script
+
+pytest.importorskip("pyarrow")
+
+MONTHS = [datetime(2022, 1, 1), datetime(2022, 2, 1)]
+WINDOW = {"$gte": datetime(2022, 1, 1), "$lt": datetime(2022, 3, 1)}
+
+
+def make_statuses(month, n):
+    return [
+        {
+            "id": month.month * 1000 + i,
+            "created_at": month + timedelta(hours=i),
+            "author": "lemonde" if i % 2 else "nytimes",
+            "language_code": "fr" if i % 2 else "en",
+            "source": "web",
+            "text": f"Macron meets Biden, take {i}",
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def archivedir(tmp_path):
+    for month in MONTHS:
+        archive.write_month(str(tmp_path), "testdb", month, make_statuses(month, 10))
+    return str(tmp_path)
+
+
+def test_round_trip(archivedir):
+    month = MONTHS[0]
+    statuses = make_statuses(month, 10)
+    window = archive.month_window(month)
+    assert archive.find(archivedir, "testdb", window) == statuses  # nosec
+    # statuses stored late are merged in
+    late = make_statuses(month, 12)[10:]
+    assert archive.write_month(archivedir, "testdb", month, late) == 12  # nosec
+    assert archive.count(archivedir, "testdb", window) == 12  # nosec
+
+
+def test_find(archivedir):
+    searchon = {"created_at": WINDOW, "$text": {"$search": "macron"}}
+    searchon["author"] = "lemonde"
+    found = archive.find(archivedir, "testdb", searchon, descending=True)
+    assert len(found) == 10  # nosec
+    assert found[0]["created_at"] == MONTHS[1] + timedelta(hours=9)  # nosec
+    assert archive.count(archivedir, "testdb", searchon) == 10  # nosec
+
+
+def test_find_projection_limit(archivedir):
+    searchon = {"created_at": WINDOW, "$text": {"$search": "macron"}}
+    projection = {"_id": False, "id": True}
+    found = archive.find(archivedir, "testdb", searchon, True, projection, 3)
+    # the newest first, without the text read for the match
+    assert [set(s) for s in found] == [{"id", "created_at"}] * 3  # nosec
+    assert [s["id"] for s in found] == [2009, 2008, 2007]  # nosec
+    found = archive.find(archivedir, "testdb", searchon, limit=12)
+    assert len(found) == 12 and found[-1]["id"] == 2001  # nosec
+
+
+def test_write_month_streamed(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ROW_GROUP", 4)
+    month = MONTHS[0]
+    statuses = make_statuses(month, 10)
+    written = archive.write_month(str(tmp_path), "testdb", month, iter(statuses[::2]))
+    assert written == 5  # nosec
+    # late statuses are merged in order, the archived ones kept as they are
+    late = [dict(s, text="rewritten") for s in statuses]
+    assert archive.write_month(str(tmp_path), "testdb", month, late) == 10  # nosec
+    found = archive.find(str(tmp_path), "testdb", archive.month_window(month))
+    assert [s["id"] for s in found] == [s["id"] for s in statuses]  # nosec
+    assert [s["text"] == "rewritten" for s in found] == [False, True] * 5  # nosec
+
+
+class Statuses:
+    def __init__(self, name, ids):
+        self.name, self.ids = name, set(ids)
+
+    def delete_many(self, query):
+        self.ids -= set(query["_id"]["$in"])
+
+    def estimated_document_count(self):
+        return len(self.ids)
+
+    def drop(self):
+        self.ids = None
+
+
+def test_delete_written(monkeypatch):
+    monkeypatch.setattr(script, "BATCH", 2)
+    # a status stored after the read is kept
+    legacy = Statuses("statuses", range(6))
+    script.delete_written(legacy, [0, 1, 2, 3, 4])
+    assert legacy.ids == {5}  # nosec
+    partition = Statuses("statuses_202201", range(3))
+    script.delete_written(partition, [0, 1])
+    assert partition.ids == {2}  # nosec
+    script.delete_written(partition, [2])
+    assert partition.ids is None  # nosec
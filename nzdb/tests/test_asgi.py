@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+from nzdb import asgi
+
+
+def test_lane():
+    assert asgi.lane("/json/qry", []) == "search"  # nosec
+    assert asgi.lane("/us/json/qry", ["/us"]) == "search"  # nosec
+    assert asgi.lane("/us/json/events", ["/us/east", "/us"]) == "events"  # nosec
+    assert asgi.lane("/usa/json/qry", ["/us"]) == "pages"  # nosec
+    assert asgi.lane("/us/stats", ["/us"]) == "pages"  # nosec
+
+
+def test_backpressure(monkeypatch):
+    yielded = []
+    done = threading.Event()
+
+    def wsgiapp(env, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        for i in range(100):
+            yielded.append(i)
+            yield b"x"
+        done.set()
+
+    monkeypatch.setattr(asgi, "wsgiapp", wsgiapp)
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/json/events",
+        "query_string": b"",
+        "headers": [],
+    }
+
+    async def run():
+        requested = asyncio.Event()
+        sent = []
+
+        async def receive():
+            if not requested.is_set():
+                requested.set()
+                return {"type": "http.request", "body": b""}
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+            if len(sent) == 2:
+                # a client that doesn't read for a while
+                await asyncio.sleep(0.3)
+                # the view waits for the client instead of running ahead
+                assert len(yielded) <= asgi.QUEUE + 2  # nosec
+
+        await asgi.app(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    assert done.is_set() and len(yielded) == 100  # nosec
+    assert sum(len(m.get("body", b"")) for m in sent) == 100  # nosec
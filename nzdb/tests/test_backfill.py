@@ -0,0 +1,85 @@
+import gzip
+
+import bson
+import pytest
+from bson import json_util
+
+from nzdb import partitions
+from nzdb.scripts import backfill
+from nzdb.scripts.backfill import ranges, read_archive, read_range
+
+DOCS = [{"id": i, "text": "x" * (i % 7)} for i in range(100)]
+
+
+def write_dump(path):
+    if path.name.startswith("dump.bson"):
+        data = b"".join(bson.encode(doc) for doc in DOCS)
+    else:
+        data = b"".join(json_util.dumps(doc).encode() + b"\n\n" for doc in DOCS)
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("name", ["dump.jsonl", "dump.bson", "dump.jsonl.gz"])
+@pytest.mark.parametrize("size", [1, 50, 10000])
+def test_ranges(tmp_path, name, size):
+    path = write_dump(tmp_path / name)
+    parts = ranges(path, size)
+    if name.endswith(".gz"):
+        assert parts == [(0, None)]  # nosec
+    # every doc is read once, by the range it starts in
+    docs = [doc["id"] for start, end in parts for doc in read_range(path, start, end)]
+    assert docs == [doc["id"] for doc in DOCS]  # nosec
+    assert [doc["id"] for doc in read_archive(path)] == docs  # nosec
+
+
+class Collection:
+    def __init__(self, name, indexes=()):
+        self.name = name
+        self.info = {"_id_": {"key": [("_id", 1)]}}
+        self.info["id_1"] = {"key": [("id", 1)], "unique": True}
+        self.info |= {name: {"key": keys} for name, keys in indexes}
+
+    def index_information(self):
+        return dict(self.info)
+
+    def drop_index(self, name):
+        del self.info[name]
+
+    def create_index(self, keys, name, **options):
+        self.info[name] = {"key": keys, **options}
+
+
+class Meta:
+    doc = None
+
+    def find_one(self, query):
+        return self.doc
+
+    def insert_one(self, doc):
+        self.doc = doc
+
+    def delete_one(self, query):
+        self.doc = None
+
+
+class Db(dict):
+    meta = Meta()
+
+
+def test_deferred_indexes(monkeypatch):
+    created = [("created_at_-1", [("created_at", -1)])]
+    db = Db(statuses=Collection("statuses", created))
+    db["statuses_202201"] = Collection("statuses_202201", created)
+    monkeypatch.setattr(partitions, "collections", lambda db: list(db.values()))
+    specs = backfill.drop_secondary_indexes(db)
+    # every partition is stripped down to its unique indexes
+    assert set(specs) == {"statuses", "statuses_202201"}  # nosec
+    assert [set(c.info) for c in db.values()] == [{"_id_", "id_1"}] * 2  # nosec
+    # a partition made during the import gets the indexes of statuses
+    db["statuses_202202"] = Collection("statuses_202202")
+    backfill.rebuild_indexes(db, specs)
+    assert all("created_at_-1" in c.info for c in db.values())  # nosec
+    assert db.meta.doc is None  # nosec
@@ -0,0 +1,16 @@
+from nzdb.compact import decode, encode
+
+
+def test_roundtrip():
+    statuses = [
+        {"id": 1, "author": "lemonde", "source": "<a>web</a>", "text": "a"},
+        {"id": 2, "author": "lefigaro", "source": "<a>web</a>", "text": "b"},
+        {"id": 3, "author": "lemonde", "source": "<a>app</a>", "text": "c"},
+    ]
+    encoded, tables = encode(statuses)
+    assert [s["author"] for s in encoded] == [0, 1, 0]  # nosec
+    assert tables == {  # nosec
+        "author": ["lemonde", "lefigaro"],
+        "source": ["<a>web</a>", "<a>app</a>"],
+    }
+    assert decode(encoded, tables) == statuses  # nosec
@@ -0,0 +1,41 @@
+import gzip
+import zlib
+
+import pytest
+
+from nzdb.compress import MIN_SIZE, BodyCache, negotiate, stream
+
+CHUNKS = [b"event: statuses\ndata: {}\n\n", "event: ping\n\n"]
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate") == "gzip"  # nosec
+    assert negotiate("gzip;q=0, deflate") is None  # nosec
+    assert negotiate("") is None  # nosec
+
+
+def test_body_cache():
+    cache = BodyCache(size=1)
+    body = b"x" * MIN_SIZE
+    cache.put("a", body, 60, "application/json")
+    zipped, encoding, _ = cache.get("a", "gzip")
+    assert encoding == "gzip" and gzip.decompress(zipped) == body  # nosec
+    cache.put("b", b"{}", 60, "application/json")
+    assert cache.get("a") is None  # nosec
+    assert cache.get("b", "gzip") == (b"{}", None, "application/json")  # nosec
+
+
+def test_stream_gzip():
+    decompressor = zlib.decompressobj(31)
+    # each chunk can be decompressed as soon as it is sent
+    for chunk, out in zip(CHUNKS, stream(CHUNKS, "gzip")):
+        expected = chunk.encode() if isinstance(chunk, str) else chunk
+        assert decompressor.decompress(out) == expected  # nosec
+
+
+def test_stream_br():
+    brotli = pytest.importorskip("brotli")
+    decompressor = brotli.Decompressor()
+    for chunk, out in zip(CHUNKS, stream(CHUNKS, "br")):
+        expected = chunk.encode() if isinstance(chunk, str) else chunk
+        assert decompressor.process(out) == expected  # nosec
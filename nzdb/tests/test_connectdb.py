@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+from pymongo.read_preferences import SecondaryPreferred
+
+from nzdb import metrics
+from nzdb.connectdb import ANALYTICS, LIVE, current_reads, read_preference, reading
+from nzdb.mongostats import PoolStats
+
+
+def test_pool_stats():
+    stats = PoolStats(size=4)
+    event = SimpleNamespace(address=("db", 27017), reason="timeout")
+    stats.connection_created(event)
+    stats.connection_check_out_started(event)
+    stats.connection_checked_out(event)
+    stats.connection_check_out_started(event)
+    stats.connection_check_out_failed(event)
+    gauges = metrics.snapshot()
+    server = (("server", "db:27017"),)
+    assert gauges[("nzdb_pool_in_use", server)] == 1  # nosec
+    assert gauges[("nzdb_pool_waiting", server)] == 0  # nosec
+    assert gauges[("nzdb_pool_utilization", server)] == 0.25  # nosec
+    stats.connection_checked_in(event)
+    assert metrics.snapshot()[("nzdb_pool_in_use", server)] == 0  # nosec
+
+
+def test_read_preference():
+    assert read_preference(LIVE) is None  # nosec
+    preference = read_preference(ANALYTICS)
+    assert isinstance(preference, SecondaryPreferred)  # nosec
+    assert preference.max_staleness >= 90  # nosec
+
+
+def test_current_reads():
+    assert current_reads() == LIVE  # nosec
+    with reading(ANALYTICS):
+        assert current_reads() == ANALYTICS  # nosec
+    assert current_reads() == LIVE  # nosec
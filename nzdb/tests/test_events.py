@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+from nzdb import events
+from nzdb.connectdb import current_target
+from nzdb.events import Subscription, Watcher
+
+
+class Backend:
+    def __init__(self):
+        self.marks = {}
+        self.statuses = []
+
+    def get_watermarks(self):
+        return dict(self.marks)
+
+    def find_statuses(self, searchon, projection=None, sort_dir=None):
+        ids = searchon["id"]
+        return [s for s in self.statuses if ids["$gt"] < s["id"] <= ids["$lte"]]
+
+
+def test_poll():
+    backend = Backend()
+    watcher = Watcher(("localhost", "test"))
+    backend.marks = {0: 10}
+    assert watcher.poll(backend) == []  # nosec
+    now = datetime.utcnow()
+    backend.statuses = [{"id": i, "created_at": now} for i in (11, 12, 21)]
+    backend.marks = {0: 12, 1: 21}
+    assert [s["id"] for s in watcher.poll(backend)] == [11, 12, 21]  # nosec
+    # a lagging feed passing ids already pushed brings nothing new
+    backend.marks = {0: 20, 1: 21}
+    assert watcher.poll(backend) == []  # nosec
+
+
+def test_max_streams(monkeypatch):
+    class Idle(Watcher):
+        def subscribe(self, fields):
+            return Subscription(self, fields)
+
+    monkeypatch.setattr(events, "nzdbConfig", {"maxstreams": 1})
+    target = current_target()
+    monkeypatch.setattr(events, "_watchers", {target: Idle(target)})
+    sub = events.subscribe({})
+    with pytest.raises(events.TooManyStreams):
+        events.subscribe({})
+    sub.close()
+    sub.close()
+    events.subscribe({}).close()
+    assert events._streams == 0  # nosec
@@ -0,0 +1,19 @@
+from nzdb import federation
+from nzdb.connectdb import current_target
+
+
+def test_fan_out(monkeypatch):
+    regions = {"us": ("localhost", "usnews"), "eu": ("localhost", "eunews")}
+    monkeypatch.setattr(federation, "configured", lambda: regions)
+
+    def search(fail_on):
+        _, dbname = current_target()
+        if dbname == fail_on:
+            return Exception("down"), None
+        return None, iter([dbname])
+
+    results, reports = federation.fan_out(search, lambda region: ("eunews",))
+    assert results == {"us": ["usnews"]}  # nosec
+    assert reports["eu"]["error"] == "down"  # nosec
+    assert reports["us"]["error"] is None  # nosec
+
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from nzdb.dbif import PROFILES
+from nzdb.hotindex import HotIndex
+from nzdb.storage.base import ASCENDING, DESCENDING
+
+NOW = datetime(2022, 3, 1, 12)
+TEXTS = [
+    "Macron meets Biden",
+    "Meeting at the Élysée",
+    "Biden in Brussels",
+    "Scholz meets Macron",
+]
+
+
+class Backend:
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def find_statuses(self, searchon, projection=None):
+        window = searchon["created_at"]
+        start, end = window["$gte"], window["$lt"]
+        return [s for s in self.statuses if start <= s["created_at"] < end]
+
+
+def make_statuses():
+    # one an hour, the newest last
+    return [
+        {
+            "id": i,
+            "created_at": NOW - timedelta(hours=len(TEXTS) - i),
+            "author": "lemonde" if i % 2 else "nytimes",
+            "text": text,
+        }
+        for i, text in enumerate(TEXTS)
+    ]
+
+
+def make_index(hours=6):
+    index = HotIndex(hours)
+    index.refresh(Backend(make_statuses()), NOW)
+    return index
+
+
+def search(index, text, sort_dir=ASCENDING, limit=None, **searchon):
+    searchon["created_at"] = {"$gte": NOW - timedelta(hours=6), "$lt": NOW}
+    if text:
+        searchon["$text"] = {"$search": text}
+    found = index.find(searchon, sort_dir, limit, PROFILES["ids"])
+    return [status["id"] for status in found]
+
+
+def test_covers():
+    index = HotIndex(6)
+    window = {"$gte": NOW - timedelta(hours=1), "$lt": NOW}
+    assert not index.covers({"created_at": window})  # nosec
+    index.refresh(Backend([]), NOW)
+    assert index.covers({"created_at": window})  # nosec
+    window["$gte"] = NOW - timedelta(hours=7)
+    assert not index.covers({"created_at": window})  # nosec
+    assert not index.covers({"created_at": {"$lt": NOW}})  # nosec
+    assert not index.covers({})  # nosec
+
+
+def test_find():
+    index = make_index()
+    # stemmed and folded as by mongo
+    assert search(index, "meeting") == [0, 1, 3]  # nosec
+    assert search(index, "ELYSEE") == [1]  # nosec
+    assert search(index, "macron -scholz") == [0]  # nosec
+    assert search(index, '"meets macron"') == [3]  # nosec
+    assert search(index, '"macron meeting"') == []  # nosec
+    assert search(index, "meets", DESCENDING, 1) == [3]  # nosec
+    assert search(index, "biden", author="nytimes") == [0, 2]  # nosec
+    assert search(index, None, author={"$in": ["lemonde"]}) == [1, 3]  # nosec
+
+
+def test_evict():
+    index = make_index()
+    index._evict(NOW + timedelta(hours=3, minutes=30))
+    # the two oldest have left the window, as have their words
+    assert sorted(index.statuses) == [2, 3]  # nosec
+    assert "elys" not in index.postings and "elyse" not in index.postings  # nosec
+    assert list(index.postings["macron"]) == [3]  # nosec
+    assert search(index, "meeting") == [3]  # nosec
+    # statuses older than the window are not added back
+    index.add(make_statuses())
+    assert sorted(index.statuses) == [2, 3]  # nosec
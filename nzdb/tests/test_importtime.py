@@ -0,0 +1,47 @@
+import os
+import subprocess  # nosec
+import sys
+
+import pytest
+
+# usecs the commands may take to import, needing no conf; checked only
+# if set, as timings vary with the machine
+BUDGET = os.getenv("NZDB_IMPORT_BUDGET")
+# imported only by the code that uses them
+HEAVY = ("pymongo", "bson", "tweepy", "delorean", "babel")
+
+
+def import_times(module):
+    """:return: cumulative import time in usecs of each module imported"""
+    env = {k: v for k, v in os.environ.items() if k != "NZDBCONF"}
+    proc = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "nzdb.scripts.query",
+        "nzdb.scripts.idknown",
+        "nzdb.scripts.readfeed",
+        # imported by the app, which reads the conf only once it is used
+        "nzdb.federation",
+    ],
+)
+def test_import_time(module):
+    times = import_times(module)
+    assert not [name for name in times if name.split(".")[0] in HEAVY]  # nosec
+    if BUDGET:
+        assert times[module] < int(BUDGET)  # nosec
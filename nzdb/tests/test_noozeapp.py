@@ -1,36 +1,6 @@
 # import json
 from urllib.parse import quote
-from nzdb.noozeapp import parse_query, extract_options, app
-
-testqs = [
-    "-d 1 *Executive *Judicial",
-    "-H 8 Warren Gillibrand",
-    "-d 5 *Business Schumer",
-    "-s 12/15/2017 -e 12/16/2017 Jones *Executive",
-]
-
-
-def test_extract_options():
-    expected = ["-d 1", "-H 8", "-d 5", "-s 12/15/2017 -e 12/16/2017"]
-    for i in range(len(testqs)):
-        parts = testqs[i].split(" ")
-        options, _ = extract_options(parts)
-        assert options == expected[i]  # nosec
-
-
-def test_parse_query():
-    expected = [
-        ["-d 1 *Executive", "-d 1 *Judicial"],
-        ['-H 8 "Warren Gillibrand"'],
-        ["-d 5 *Business", '-d 5 "Schumer"'],
-        [
-            "-s 12/15/2017 -e 12/16/2017 *Executive",
-            '-s 12/15/2017 -e 12/16/2017 "Jones"',
-        ],
-    ]
-    for i in range(len(testqs)):
-        _, queries = parse_query(testqs[i])
-        assert queries == expected[i]  # nosec
+from nzdb.noozeapp import app, flag
 
 
 def test_routes():
@@ -69,3 +39,8 @@ def test_count():
     assert resp.status == "200 OK"  # nosec
     jdata = resp.get_json()
     assert isinstance(jdata["count"], int)  # nosec
+
+
+def test_flag():
+    assert flag("1") and flag("true") and flag(True)  # nosec
+    assert not (flag("0") or flag("false") or flag(None))  # nosec
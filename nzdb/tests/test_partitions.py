@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+from nzdb import partitions
+from nzdb.connectdb import use_db
+from nzdb.partitions import months, next_month, partition_name
+
+
+def test_next_month():
+    assert next_month(datetime(2021, 12, 1)) == datetime(2022, 1, 1)  # nosec
+    assert next_month(datetime(2022, 1, 1)) == datetime(2022, 2, 1)  # nosec
+
+
+def test_months():
+    start = datetime(2021, 11, 20, tzinfo=timezone.utc)
+    end = datetime(2022, 2, 1, tzinfo=timezone.utc)
+    names = [partition_name(month) for month in months(start, end)]
+    assert names == ["statuses_202111", "statuses_202112", "statuses_202201"]  # nosec
+
+
+class Db:
+    name = "news"
+
+    def __init__(self, names):
+        self.names = names
+
+    def list_collection_names(self, filter):
+        return self.names
+
+
+def test_status_names_per_host(monkeypatch):
+    monkeypatch.setattr(partitions, "_known", {})
+    us, eu = Db(["statuses_202201"]), Db(["statuses_202202"])
+    # dbs of one name on two hosts keep their partitions apart
+    with use_db("news", "us.example"):
+        assert partitions.status_names(us) == ["statuses_202201"]  # nosec
+    with use_db("news", "eu.example"):
+        assert partitions.status_names(eu) == ["statuses_202202"]  # nosec
+    with use_db("news", "us.example"):
+        assert partitions.status_names(us) == ["statuses_202201"]  # nosec
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta, timezone
+
+from nzdb.querylang import compile_query, parse
+
+testqs = [
+    "-d 1 *Executive *Judicial",
+    "-H 8 Warren Gillibrand",
+    "-d 5 *Business Schumer",
+    "-s 12/15/2017 -e 12/16/2017 Jones *Executive",
+]
+
+
+def topic_query(topic):
+    return f"q{topic}"
+
+
+def test_searches():
+    expected = [
+        ("qExecutive", "qJudicial"),
+        ('"Warren Gillibrand"',),
+        ("qBusiness", '"Schumer"'),
+        ("qExecutive", '"Jones"'),
+    ]
+    for q, searches in zip(testqs, expected):
+        plan = compile_query(parse(q), topic_query, together=True)
+        assert plan.searches == searches  # nosec
+
+
+def test_windows():
+    now = datetime(2022, 3, 1, tzinfo=timezone.utc)
+    assert parse(testqs[0]).window(now) == (now - timedelta(days=1), now)  # nosec
+    assert parse("since:2w x").window(now)[0] == now - timedelta(days=14)  # nosec
+    start, end = parse(testqs[3]).window(now)
+    assert (start.day, end.day) == (15, 16)  # nosec
+
+
+def test_filters():
+    q = parse('-H 3 macron "tax cut" -zemmour author:lemonde lang:fr lang:en')
+    assert q.text() == 'macron "tax cut" -zemmour'  # nosec
+    assert q.filters() == {  # nosec
+        "author": "lemonde",
+        "language_code": {"$in": ["fr", "en"]},
+    }
@@ -0,0 +1,50 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from nzdb.replay import ReplaySource, to_status
+from nzdb.scheduler import AdaptiveScheduler, simulate
+
+T0 = datetime(2022, 3, 1, tzinfo=timezone.utc)
+
+
+def replay(per_hour):
+    """replay source with per_hour[i] statuses in hour i after T0"""
+    docs = []
+    sid = 1
+    for hour, n in enumerate(per_hour):
+        for k in range(n):
+            created = T0 + timedelta(hours=hour, seconds=k * 3600 / n)
+            docs.append({"id": sid, "author": "a", "created_at": created, "text": ""})
+            sid += 1
+    return ReplaySource([to_status(doc) for doc in docs])
+
+
+def scheduler():
+    return AdaptiveScheduler("test", 60, 1800, jitter=0, rng=random.Random(0))
+
+
+def test_quiet_feed_backs_off():
+    source = replay([2] * 12)
+    start = T0.timestamp()
+    decisions = simulate(scheduler(), source, start, start + 12 * 3600)
+    assert decisions[-1][2] == 1800  # nosec
+
+
+def test_busy_feed_polls_faster():
+    source = replay([2] * 4 + [1200] * 8)
+    start = T0.timestamp()
+    decisions = simulate(scheduler(), source, start, start + 12 * 3600)
+    _, nread, interval = decisions[-1]
+    assert interval < 300  # nosec
+    assert nread <= 200  # nosec
+
+
+def test_bounds_and_budget():
+    sched = scheduler()
+    assert sched.next_interval(10000, 1) == 60  # nosec
+    sched = scheduler()
+    assert sched.next_interval(1, 60) == 1800  # nosec
+    # 2 requests left for the next 3600s: poll at most every 1800s
+    sched = scheduler()
+    assert sched.next_interval(100, 60, 2, 3600) == 1800  # nosec
+    assert sched.next_interval(100, 60, 4, 3600) == 900  # nosec
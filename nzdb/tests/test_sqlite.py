@@ -0,0 +1,261 @@
+import logging
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from nzdb import budget, dbif
+from nzdb.connectdb import use_db
+from nzdb.scripts import readfeed
+from nzdb.storage.base import DESCENDING
+from nzdb.storage.sqlite import SqliteBackend, _where, fts_query
+
+START = datetime(2022, 3, 1)
+XQUERY = {"words": ["Macron"], "start": "2022-03-01", "end": "2022-04-01"}
+
+
+def make_statuses(n):
+    return [
+        {
+            "id": i,
+            "created_at": START + timedelta(minutes=i),
+            "author": "lemonde" if i % 2 else "nytimes",
+            "language_code": "fr" if i % 2 else "en",
+            "source": "web",
+            "text": f"Macron meets Biden, take {i}",
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    backend = SqliteBackend(str(tmp_path))
+    monkeypatch.setattr(dbif, "get_backend", lambda: backend)
+    with use_db("sqlitetest"):
+        yield backend
+
+
+def texts(backend, search, **searchon):
+    found = backend.find_statuses(searchon | {"$text": {"$search": search}})
+    return sorted(status["text"] for status in found)
+
+
+def test_fts_query():
+    assert fts_query("Macron biden") == ('"biden" OR "macron"', None)  # nosec
+    assert fts_query('"Élysée palace" -Biden') == (  # nosec
+        '"elysee palace"',
+        '"biden"',
+    )
+    assert fts_query("-biden") == (None, '"biden"')  # nosec
+    assert fts_query('macron -"tax cut"') == ('"macron"', '"tax cut"')  # nosec
+
+
+def test_where():
+    window = {"$gte": START, "$lt": START + timedelta(days=1)}
+    searchon = {"created_at": window, "author": {"$in": ["a", "b"]}, "id": {"$gt": 3}}
+    where, params = _where(searchon)
+    assert where == (  # nosec
+        "created_at >= ? AND created_at < ? AND author IN (?, ?) AND id > ?"
+    )
+    assert params == [  # nosec
+        "2022-03-01 00:00:00.000000",
+        "2022-03-02 00:00:00.000000",
+        "a",
+        "b",
+        3,
+    ]
+    where, params = _where({"$text": {"$search": "macron -biden"}})
+    assert where.startswith("id IN (") and "AND id NOT IN (" in where  # nosec
+    assert params == ['"macron"', '"biden"']  # nosec
+    with pytest.raises(ValueError):
+        _where({"retweets": 3})
+    with pytest.raises(ValueError):
+        _where({"author": {"$ne": "a"}})
+
+
+def test_text_search(backend):
+    backend.store_statuses(
+        [
+            {"id": 1, "created_at": START, "text": "Macron meets Biden"},
+            {"id": 2, "created_at": START, "text": "Réunion à l'Élysée"},
+            {"id": 3, "created_at": START, "text": "Meeting at the White House"},
+        ]
+    )
+    # stemmed, and folding case and diacritics
+    assert texts(backend, "meeting") == [  # nosec
+        "Macron meets Biden",
+        "Meeting at the White House",
+    ]
+    assert texts(backend, "elysee") == ["Réunion à l'Élysée"]  # nosec
+    assert texts(backend, "meeting -biden") == ["Meeting at the White House"]  # nosec
+    assert texts(backend, '"white house" macron') == [  # nosec
+        "Meeting at the White House"
+    ]
+    assert texts(backend, '"house white"') == []  # nosec
+    assert texts(backend, 'meeting -"white house"') == ["Macron meets Biden"]  # nosec
+
+
+def test_find_interrupted(backend):
+    backend.store_statuses(make_statuses(5000))
+    searchon = {"$text": {"$search": "macron"}}
+    with budget.time_budget(0):
+        found = list(backend.find_statuses(searchon, sort_dir=DESCENDING))
+        assert budget.truncated() and found == []  # nosec
+    found = backend.find_statuses(searchon, {"id": True}, DESCENDING, limit=2)
+    assert list(found) == [{"id": 5000}, {"id": 4999}]  # nosec
+
+
+def test_watermarks(backend):
+    assert backend.get_lastread() == (0, 0)  # nosec
+    backend.store_lastread(10)
+    backend.store_lastread(5)
+    assert backend.get_lastread() == (0, 10)  # nosec
+    # the list readfeed read starts from its watermark, any other from 0
+    assert backend.get_lastread("list", inherit=True) == ("list", 10)  # nosec
+    assert backend.get_lastread("other") == ("other", 0)  # nosec
+    backend.store_lastread(5, "other")
+    assert backend.get_lastread("other", inherit=True) == ("other", 5)  # nosec
+    backend.store_lastread(20, "list")
+    backend.store_lastread(15, "list")
+    assert backend.get_lastread("list") == ("list", 20)  # nosec
+    assert backend.get_watermarks() == {0: 10, "list": 20, "other": 5}  # nosec
+
+
+def test_count_cut_short(backend):
+    backend.store_statuses(make_statuses(5000))
+    with budget.time_budget(0):
+        err, count = dbif.xcount(XQUERY)
+        assert budget.truncated()  # nosec
+    assert err is None and not count["exact"] and count["max"] is None  # nosec
+    with budget.time_budget(0):
+        _, count = dbif.xcount(XQUERY | {"approx": True, "limit": 10})
+    assert not count["exact"]  # nosec
+    err, count = dbif.xcount(XQUERY)
+    assert count == {"count": 5000, "exact": True, "min": 5000, "max": 5000}  # nosec
+
+
+def test_counts_cut_short(backend, monkeypatch):
+    backend.store_statuses(make_statuses(10))
+    monkeypatch.setattr(backend, "count_statuses", lambda searchon: (3, False))
+    err, counts = dbif.xcounts(XQUERY | {"interval": "1d", "n": 2})
+    assert err is None and counts["counts"] == [None, None]  # nosec
+
+
+def test_background_count(backend, monkeypatch):
+    monkeypatch.setattr(dbif, "_exact_counts", {})
+    backend.store_statuses(make_statuses(50))
+    xquery = XQUERY | {"authors": ["lemonde"], "approx": True, "limit": 10}
+    xquery["background"] = True
+
+    def pending():
+        ((_, future),) = dbif._exact_counts.values()
+        future.exception()
+        return future
+
+    def fail(backend, searchon):
+        raise RuntimeError("count failed")
+
+    exact_count = dbif._exact_count
+    monkeypatch.setattr(dbif, "_exact_count", fail)
+    _, count = dbif.xcount(xquery)
+    assert count["min"] == 10 and not count["exact"]  # nosec
+    assert pending().exception() is not None  # nosec
+    monkeypatch.setattr(dbif, "_exact_count", exact_count)
+    # a failed count is submitted again
+    _, count = dbif.xcount(xquery)
+    assert not count["exact"] and pending().result() == 25  # nosec
+    _, count = dbif.xcount(xquery)
+    assert count["count"] == 25 and count["exact"]  # nosec
+    # a stale count is dropped and submitted again
+    monkeypatch.setattr(dbif, "EXACT_TTL", 0)
+    _, count = dbif.xcount(xquery)
+    assert not count["exact"] and pending().result() == 25  # nosec
+
+
+def timeline(n, broken=False):
+    """twitter statuses of a list, newest first, the read broken at the end"""
+    for status in reversed(make_statuses(n)):
+        author = SimpleNamespace(screen_name=status.pop("author"))
+        yield SimpleNamespace(author=author, **status)
+    if broken:
+        raise OSError("read broken off")
+
+
+@pytest.fixture
+def feed(backend, monkeypatch):
+    backend.store_author("lemonde", "fr")
+    backend.store_author("nytimes", "en")
+    monkeypatch.setattr(readfeed, "logger", logging.getLogger("test"))
+    monkeypatch.setattr(readfeed, "maxid", 0)
+    monkeypatch.setattr(readfeed, "added", 0)
+    batches = []
+    store = dbif.storeStatuses
+    monkeypatch.setattr(
+        readfeed, "storeStatuses", lambda b: batches.append(len(b)) or store(b)
+    )
+    return batches
+
+
+def test_store_timeline(backend, feed):
+    readfeed.storeTimeline(timeline(250), True, None)
+    # committed in batches as read, the watermark advanced once all are
+    assert feed == [100, 100, 50] and readfeed.added == 250  # nosec
+    assert backend.get_lastread() == (0, 250)  # nosec
+
+
+def test_store_timeline_broken(backend, feed):
+    backend.store_lastread(10)
+    readfeed.maxid = 10
+    with pytest.raises(OSError):
+        readfeed.storeTimeline(timeline(150, broken=True), True, None)
+    # what was read is kept, the watermark stays below the gap
+    assert readfeed.added == 150 and backend.count_statuses({})[0] == 150  # nosec
+    assert backend.get_lastread() == (0, 10)  # nosec
+    readfeed.storeTimeline(timeline(200), True, None)
+    assert readfeed.added == 200 and backend.get_lastread() == (0, 200)  # nosec
+
+
+class ListApi:
+    """list_timeline over the statuses posted so far, optionally broken off"""
+
+    def __init__(self, n):
+        self.statuses = list(timeline(n))
+        self.calls = []
+        self.limit = None
+
+    def list_timeline(self, list_id, since_id=None, max_id=None, count=None):
+        self.calls.append((since_id, max_id))
+        for i, status in enumerate(s for s in self.statuses if s.id > (since_id or 0)):
+            if i == self.limit:
+                raise OSError("read broken off")
+            if max_id is None or status.id <= max_id:
+                yield status
+
+
+class Cursor:
+    def __init__(self, method, **kwargs):
+        self.method, self.kwargs = method, kwargs
+
+    def items(self):
+        return self.method(**self.kwargs)
+
+
+def test_read_list_resumed(backend, feed, monkeypatch):
+    monkeypatch.setattr("tweepy.Cursor", Cursor)
+    api = ListApi(250)
+    api.limit = 150
+    with pytest.raises(OSError):
+        readfeed.read_list(api, 1, True)
+    # the checkpoint pages on below the statuses stored, the watermark stays
+    checkpoint = dbif.getCheckpoint("readfeed")
+    assert (checkpoint["max_id"], checkpoint["top"]) == (100, 250)  # nosec
+    assert backend.get_lastread() == (0, 0)  # nosec
+    api.statuses = list(timeline(260))
+    api.limit = None
+    processed, _ = readfeed.read_list(api, 1, True)
+    # the rest of the broken read, then the new statuses above it
+    assert api.calls[1:] == [(None, 100), (250, None)] and processed == 110  # nosec
+    assert backend.count_statuses({})[0] == 260  # nosec
+    assert backend.get_lastread() == (0, 260)  # nosec
+    assert dbif.getCheckpoint("readfeed")["max_id"] is None  # nosec
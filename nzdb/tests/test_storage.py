@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import pytest
+
+from nzdb.storage import mongo
+from nzdb.storage.base import diff_authors, diff_topics
+
+
+def test_diff_topics():
+    current = {"a": {"topic": "a", "q": "x"}, "b": {"topic": "b", "q": "y"}}
+    topics = [{"topic": "b", "q": "z"}, {"topic": "c", "q": "w"}]
+    new, added, changed, removed = diff_topics(current, topics)
+    assert set(new) == {"b", "c"} and added == {"c"}  # nosec
+    assert changed == ["b"] and removed == {"a"}  # nosec
+    assert diff_topics(new, topics)[1:] == (set(), [], set())  # nosec
+
+
+def test_diff_authors():
+    current = {"lemonde": "fr", "nytimes": "en", "elpais": "es"}
+    langs = {"lemonde": "fr", "nytimes": "fr", "bbc": "en"}
+    upserts, added, changed, removed = diff_authors(current, langs)
+    assert upserts == {"nytimes": "fr", "bbc": "en"}  # nosec
+    assert (added, changed, removed) == (1, 1, {"elpais"})  # nosec
+
+
+class FakeCollection:
+    def __init__(self, db, name, docs=()):
+        self.db, self.name, self.docs = db, name, list(docs)
+
+    def find(self, projection=None):
+        return [dict(doc) for doc in self.docs]
+
+    def insert_many(self, docs):
+        self.docs.extend(docs)
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def rename(self, name, dropTarget=False):
+        self.db.collections.pop(self.name)
+        self.db.collections[name] = self
+        self.name = name
+
+    def find_one_and_update(self, filter, update, **kwargs):
+        # the topics a reader of the new version would see
+        self.db.seen = [t["topic"] for t in self.db["topics"].docs]
+        return {"topics": 2}
+
+
+class FakeDb:
+    def __init__(self, topics):
+        self.collections = {"topics": FakeCollection(self, "topics", topics)}
+        self.meta = FakeCollection(self, "meta")
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, name))
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+@pytest.fixture
+def fakedb(monkeypatch):
+    db = FakeDb([{"topic": "a"}])
+    monkeypatch.setattr(mongo, "get_db", lambda: db)
+    return db
+
+
+def test_sync_topics_version(fakedb):
+    backend = mongo.MongoBackend()
+    result = backend.sync_topics([{"topic": "a"}, {"topic": "b"}])
+    assert result == (2, 1, 0, 0)  # nosec
+    # the version is bumped once the new topics are in place
+    assert fakedb.seen == ["a", "b"]  # nosec
+    assert list(fakedb.collections) == ["topics"]  # nosec
+
+
+def test_narrowed():
+    window = {"$gte": datetime(2022, 3, 1), "$lt": datetime(2022, 3, 2)}
+    searchon = {"created_at": window, "$text": {"$search": "meeting"}}
+    assert mongo._narrowed(searchon, None) == (searchon, None, None)  # nosec
+    searchon["author"] = "lemonde"
+    query, fields, match = mongo._narrowed(searchon, {"_id": False, "id": True})
+    assert query == {"created_at": window, "author": "lemonde"}  # nosec
+    assert fields == {"_id": False, "id": True, "text": True}  # nosec
+    # stemmed as by the text index
+    assert match({"author": "lemonde", "text": "Macron meets Biden"})  # nosec
+
+
+class IndexedCollection:
+    def __init__(self, info):
+        self.info = info
+        self.created = []
+
+    def index_information(self):
+        return self.info
+
+    def create_index(self, keys, name, **options):
+        self.created.append(name)
+
+
+def test_ensure_indexes(monkeypatch):
+    text = {
+        "key": [("_fts", "text"), ("_ftsx", 1)],
+        "weights": {"text": 1, "title": 1},
+        "v": 2,
+    }
+    statuses = IndexedCollection(
+        {"_id_": {"key": [("_id", 1)]}, "id_1": {"key": [("id", 1)]}, "alltext": text}
+    )
+    monkeypatch.setattr(mongo, "get_db", lambda: None)
+    monkeypatch.setattr(mongo.partitions, "collections", lambda db: [statuses])
+    mongo.MongoBackend().ensure_indexes()
+    # the existing text index is kept, as mongo allows only one
+    assert statuses.created == [  # nosec
+        "created_at_-1",
+        "author_1_created_at_-1",
+        "language_code_1_created_at_-1",
+    ]
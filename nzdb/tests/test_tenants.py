@@ -0,0 +1,47 @@
+import os
+
+import pytest
+from werkzeug.exceptions import NotFound
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.test import Client
+
+from nzdb.configurator import nzdbConfig
+from nzdb.noozeapp import create_app
+from nzdb import noozeapp, warmup
+from nzdb.tenants import TenantError, parse_tenants, tenants_app
+
+TEMPLATES = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "app", "templates")
+)
+
+
+def test_parse_tenants():
+    tenants = parse_tenants("/us/=us.conf, EUNEWS.org=eu.conf")
+    assert tenants == {"/us": "us.conf", "eunews.org": "eu.conf"}  # nosec
+    with pytest.raises(TenantError):
+        parse_tenants("/us=us.conf,/us=eu.conf")
+    with pytest.raises(TenantError):
+        parse_tenants("us.conf")
+
+
+def test_create_app():
+    app = create_app(dict(nzdbConfig, templates=TEMPLATES))
+    client = app.test_client()
+    assert client.get("/").status_code == 200  # nosec
+    # pages extending webapp-base link to the routes of the blueprint
+    for page in ("/help", "/error"):
+        resp = client.get(page)
+        assert resp.status_code == 200 and b'href="/stats"' in resp.data  # nosec
+    # a mounted tenant links to its own pages
+    client = Client(DispatcherMiddleware(NotFound(), {"/us": app}))
+    assert client.get("/us/").status_code == 200  # nosec
+    assert b'href="/us/stats"' in client.get("/us/help").data  # nosec
+
+
+def test_served_apps():
+    conf = os.environ["NZDBCONF"]
+    app = tenants_app(f"/us={conf},eunews.org={conf}")
+    apps = warmup.served(app)
+    # the apps of the tenants only, not the app made at import
+    assert len(apps) == 2 and noozeapp.app not in apps  # nosec
+    assert warmup.served(noozeapp.app) == [noozeapp.app]  # nosec
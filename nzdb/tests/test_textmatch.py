@@ -0,0 +1,43 @@
+from nzdb.textmatch import TextQuery, fold, matcher
+
+STATUS = {
+    "author": "lemonde",
+    "language_code": "fr",
+    "text": "Élysée : Macron reçoit Biden https://t.co/x",
+}
+
+
+def test_fold():
+    assert fold("Élysée Reçoit") == "elysee recoit"  # nosec
+
+
+def test_terms():
+    assert matcher({"$text": {"$search": "elysee obama"}})(STATUS)  # nosec
+    assert not matcher({"$text": {"$search": "obama"}})(STATUS)  # nosec
+    assert not matcher({"$text": {"$search": "macron -biden"}})(STATUS)  # nosec
+    # urls are not searched
+    assert not matcher({"$text": {"$search": "t"}})(STATUS)  # nosec
+
+
+def test_phrases():
+    assert matcher({"$text": {"$search": '"macron recoit"'}})(STATUS)  # nosec
+    assert not matcher({"$text": {"$search": '"recoit macron"'}})(STATUS)  # nosec
+    assert not matcher({"$text": {"$search": '"macron" "obama"'}})(STATUS)  # nosec
+
+
+def test_fields():
+    assert matcher({"author": "lemonde"})(STATUS)  # nosec
+    assert matcher({"author": {"$in": ["nytimes", "lemonde"]}})(STATUS)  # nosec
+    assert not matcher({"language_code": "en"})(STATUS)  # nosec
+    searchon = {"$text": {"$search": "macron"}, "author": "nytimes"}
+    assert not matcher(searchon)(STATUS)  # nosec
+
+
+def test_negated_phrases():
+    status = {"text": "Macron announces tax cut"}
+    query = TextQuery('macron -"tax cut"')
+    assert query.phrases == [] and query.negated_phrases == ["tax cut"]  # nosec
+    assert not matcher({"$text": {"$search": 'macron -"tax cut"'}})(status)  # nosec
+    assert matcher({"$text": {"$search": 'macron -"cut tax"'}})(status)  # nosec
+    searchon = {"$text": {"$search": '"announces tax" -"tax cut"'}}
+    assert not matcher(searchon)(status)  # nosec
@@ -0,0 +1,36 @@
+from flask import Flask
+
+from nzdb import warmup
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config["NZDB_TARGET"] = ("localhost", "testdb")
+    app.extensions["nzdb_warmup"] = warmup.Warmup(app)
+    return app
+
+
+def test_wait_all(monkeypatch):
+    monkeypatch.setattr(warmup, "RETRY", 0)
+    app, unserved = make_app(), make_app()
+    warm = app.extensions["nzdb_warmup"]
+    attempts = []
+
+    def steps():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise warmup.WarmupFailed("/ answered 500")
+        return {"/": 1.0}
+
+    warm.warm = steps
+    assert not warm.ready.is_set()  # nosec
+    assert warmup.wait_all(warmup.served(app), timeout=5)  # nosec
+    assert warm.steps == {"/": 1.0} and warm.error is None  # nosec
+    assert len(attempts) == 2  # nosec
+    # apps made but not served are left alone
+    assert not unserved.extensions["nzdb_warmup"]._started  # nosec
+    # as in a forked child
+    warm._pid = -1
+    warm.warm = lambda: {}
+    warm.start()
+    assert warm.ready.wait(5) and not warm.steps  # nosec
@@ -0,0 +1,108 @@
+"""
+textmatch -- match status texts against a mongo $text search string
+outside of mongo, folding case and diacritics as $diacriticSensitive:
+False does, and stemming terms with the snowball english stemmer, as
+the text index, created with the default language, does. Phrases are
+matched on folded words, unstemmed.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+from nzdb.dupdetect import tokenize
+
+_negated_phrase = re.compile(r'-"([^"]*)"')
+_phrase = re.compile(r'"([^"]*)"')
+_word = re.compile(r"\w+")
+
+
+def fold(text):
+    """lower case text without diacritics"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def words(text):
+    """folded words of a status text, urls removed"""
+    return _word.findall(fold(" ".join(tokenize(text))))
+
+
+@lru_cache(maxsize=None)
+def _stemmer():
+    # imported on first use: the scripts that never match texts don't pay
+    import snowballstemmer
+
+    return snowballstemmer.stemmer("english")
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """snowball english stem of a folded word"""
+    return _stemmer().stemWord(word)
+
+
+def stems(text):
+    """stems of the words of a status text"""
+    return {stem(word) for word in words(text)}
+
+
+def _folded(phrase):
+    """a quoted phrase as the folded words it is matched on"""
+    return " ".join(_word.findall(fold(phrase)))
+
+
+class TextQuery:
+    """
+    A $text search string: a status matches if it contains every phrase,
+    or, if there are no phrases, any term; and none of the negated terms
+    and phrases
+    """
+
+    def __init__(self, search):
+        # -"..." first, or its quoted part would be taken as a phrase
+        self.negated_phrases = [_folded(p) for p in _negated_phrase.findall(search)]
+        search = _negated_phrase.sub(" ", search)
+        self.phrases = [_folded(p) for p in _phrase.findall(search)]
+        rest = _phrase.sub(" ", search).split()
+        # folded words, for engines that stem them themselves
+        self.negated = {w for t in rest if t.startswith("-") for w in words(t[1:])}
+        self.terms = {w for t in rest if not t.startswith("-") for w in words(t)}
+        self.negated_stems = {stem(w) for w in self.negated}
+        self.term_stems = {stem(w) for w in self.terms}
+
+    def matches(self, text):
+        tokens = words(text)
+        present = {stem(token) for token in tokens}
+        if present & self.negated_stems:
+            return False
+        joined = f" {' '.join(tokens)} "
+        if any(f" {phrase} " in joined for phrase in self.negated_phrases):
+            return False
+        if self.phrases:
+            return all(f" {phrase} " in joined for phrase in self.phrases)
+        return bool(present & self.term_stems)
+
+
+def matcher(searchon):
+    """
+    python test for the parts of a mongo status query other than its
+    created_at window: $text, and equality or $in on other fields
+    :param dict searchon: query as built by dbif
+    :return: function of a status doc, true if it matches
+    """
+    text = searchon.get("$text")
+    textquery = TextQuery(text["$search"]) if text else None
+    fields = {k: v for k, v in searchon.items() if k not in ("$text", "created_at")}
+
+    def match(status):
+        for field, cond in fields.items():
+            value = status.get(field)
+            if isinstance(cond, dict) and "$in" in cond:
+                if value not in cond["$in"]:
+                    return False
+            elif value != cond:
+                return False
+        return textquery is None or textquery.matches(status["text"])
+
+    return match
@@ -0,0 +1,137 @@
+"""
+warmup -- the first requests of a worker, made by the worker itself
+
+A worker fresh from a deploy or restart would otherwise have its first
+clients wait while it opens its mongo pool, reads the topics, compiles
+the templates and loads the hot window. The warm-up of an app reads the
+topics and authors, then requests the pages and json the frontend asks
+for first and a search of each topic over the hot window, through the
+app itself; /ready answers 503 until it is done.
+
+Under gunicorn, each worker waits for the warm-ups of the apps it serves
+before accepting connections (see app/gunicorn.conf.py), for at most
+WAIT secs: workers share the listening socket, so a cold worker that
+doesn't accept gets no traffic. A warm-up that fails, e.g. with the db
+down, is retried in the background. Apps that are made but not served
+are never warmed up.
+"""
+
+import logging
+import os
+import threading
+from time import perf_counter, sleep
+from urllib.parse import quote
+
+from nzdb import dbif, metrics
+from nzdb.connectdb import use_db
+
+# requests of a warm-up, in order, as the frontend makes them
+REQUESTS = ("/", "/help", "/json/cats", "/json/count", "/json/recent")
+# search run for each topic, as from the topic links of the frontend
+TOPIC_QUERY = "-H 3 *{}"
+# secs a worker waits for its warm-up before it takes requests anyway
+WAIT = 20
+# secs between attempts of a warm-up that failed
+RETRY = 5
+
+logger = logging.getLogger(__name__)
+
+class WarmupFailed(Exception):
+    pass
+
+
+class Warmup:
+    """warm-up of an app, run once per process"""
+
+    def __init__(self, app):
+        self.app = app
+        self._reset()
+
+    def _reset(self):
+        # a forked child runs the warm-up of its parent again
+        self._pid = os.getpid()
+        self.ready = threading.Event()
+        # ms taken by each step, once ready
+        self.steps = {}
+        self.error = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """run the warm-up in the background, unless it has been started"""
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self.run, name="nzdb-warmup", daemon=True).start()
+
+    def run(self):
+        _, dbname = self.app.config["NZDB_TARGET"]
+        t0 = perf_counter()
+        while True:
+            try:
+                self.steps = self.warm()
+                break
+            except Exception as e:
+                self.error = str(e)
+                logger.warning(f"warm-up of {dbname} failed, retry in {RETRY}s: {e}")
+                sleep(RETRY)
+        self.error = None
+        self.ready.set()
+        metrics.set_gauge("nzdb_warmup_seconds", perf_counter() - t0, db=dbname)
+        logger.info(f"warm-up of {dbname} done, pid {os.getpid()}: {self.steps}")
+
+    def warm(self):
+        """
+        :return: ms taken by each step
+        :raises: WarmupFailed, or the error of the db
+        """
+        steps = {}
+        host, dbname = self.app.config["NZDB_TARGET"]
+        t0 = perf_counter()
+        # the first reads open the pool
+        with use_db(dbname, host):
+            topics = [topic["topic"] for topic in dbif.getTopics()]
+            dbif.getAuthors()
+        steps["topics and authors"] = round(1000 * (perf_counter() - t0), 1)
+        searches = [
+            "/json/qry?data=" + quote(TOPIC_QUERY.format(topic)) for topic in topics
+        ]
+        client = self.app.test_client()
+        for path in REQUESTS + tuple(searches):
+            t0 = perf_counter()
+            # cached bodies are kept compressed as browsers ask for them
+            resp = client.get(path, headers={"Accept-Encoding": "gzip"})
+            if resp.status_code != 200:
+                raise WarmupFailed(f"{path} answered {resp.status_code}")
+            steps[path] = round(1000 * (perf_counter() - t0), 1)
+        return steps
+
+
+def served(wsgi):
+    """
+    :param wsgi: app served, or a dispatcher of apps as made by tenants
+    :return: the flask apps it serves
+    """
+    return getattr(wsgi, "nzdb_apps", [wsgi])
+
+
+def start_all(apps):
+    """start the warm-ups of apps"""
+    for app in apps:
+        app.extensions["nzdb_warmup"].start()
+
+
+def wait_all(apps, timeout=WAIT):
+    """
+    start the warm-ups of apps and wait for them
+    :param apps: flask apps made by noozeapp.create_app
+    :param float timeout: secs to wait for all of them
+    :return: True if all are done
+    """
+    start_all(apps)
+    warmups = [app.extensions["nzdb_warmup"] for app in apps]
+    until = perf_counter() + timeout
+    return all(w.ready.wait(max(0, until - perf_counter())) for w in warmups)
@@ -19,9 +19,18 @@ setup(
             "storeauths = nzdb.scripts.storeauthtable:main",
             "storetopics = nzdb.scripts.storetopics:main",
             "readfeed = nzdb.scripts.readfeed:main",
+            "ingestd = nzdb.scripts.ingestd:main",
+            "backfill = nzdb.scripts.backfill:main",
+            "partition = nzdb.scripts.partition:main",
+            "archive = nzdb.scripts.archive:main",
             "unknown = nzdb.scripts.idknown:showUknowns",
+            "reclassify = nzdb.scripts.reclassify:main",
             "query = nzdb.scripts.query:main",
+            "loadbench = nzdb.scripts.loadbench:main",
+            "replset = nzdb.scripts.replset:main",
         ]
     },
+    # brotli responses, gzip only without it; parquet archives of old months
+    extras_require={"brotli": ["brotli"], "archive": ["pyarrow"]},
     packages=find_packages(),
 )